@@ -0,0 +1,104 @@
+import yaml
+import os
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+# Written by PixelCalibrationWindow:
+#   image_size: {width: 1920, height: 1080}            # snapshot the points were clicked on
+#   affine_pixel_to_gantry_mm: {row_x: [a, b, c], row_y: [d, e, f]}
+# Optional, for wide-field cameras (edited by hand or by an external calibration tool):
+#   homography_pixel_to_gantry_mm: [[h11, h12, h13], [h21, h22, h23], [h31, h32, h33]]
+#   lens: {camera_matrix: [[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dist_coeffs: [k1, k2, p1, p2, k3]}
+# A homography replaces the affine; lens distortion is removed before either is applied.
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config_profiles')
+CALIBRATION_FILE = os.path.join(CONFIG_DIR, "calibration.yaml")
+
+_lock = threading.Lock()
+_cache = {"path": None, "stamp": None, "transform": None}
+
+
+class PixelToGantry:
+    """Vectorised pixel -> gantry mm mapping built from calibration.yaml."""
+
+    def __init__(self, data: dict):
+        size = data.get("image_size") or {}
+        self.image_size = (int(size["width"]), int(size["height"])) if "width" in size and "height" in size else None
+
+        self.homography = None
+        self.affine = None
+        if data.get("homography_pixel_to_gantry_mm") is not None:
+            self.homography = np.asarray(data["homography_pixel_to_gantry_mm"], dtype=np.float64).reshape(3, 3)
+        else:
+            rows = data.get("affine_pixel_to_gantry_mm") or {}
+            if "row_x" not in rows or "row_y" not in rows:
+                raise ValueError("calibration has neither an affine nor a homography")
+            self.affine = np.array([rows["row_x"], rows["row_y"]], dtype=np.float64).reshape(2, 3)
+
+        lens = data.get("lens") or {}
+        self.camera_matrix = None
+        self.dist_coeffs = None
+        if lens.get("camera_matrix") is not None:
+            self.camera_matrix = np.asarray(lens["camera_matrix"], dtype=np.float64).reshape(3, 3)
+            self.dist_coeffs = np.asarray(lens.get("dist_coeffs") or [], dtype=np.float64).ravel()
+
+    @property
+    def model(self) -> str:
+        name = "homography" if self.homography is not None else "affine"
+        return f"{name}+lens" if self.camera_matrix is not None else name
+
+    def transform(self, points, image_size=None) -> np.ndarray:
+        """(N, 2) pixel points -> (N, 2) gantry mm. image_size=(w, h) of the image the
+        points come from; they are rescaled if it differs from the calibration snapshot."""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(pts) == 0:
+            return pts.copy()
+        if image_size is not None and self.image_size is not None and tuple(image_size) != self.image_size:
+            pts = pts * (self.image_size[0] / float(image_size[0]), self.image_size[1] / float(image_size[1]))
+        if self.camera_matrix is not None:
+            pts = cv2.undistortPoints(pts.reshape(-1, 1, 2), self.camera_matrix, self.dist_coeffs,
+                                      P=self.camera_matrix).reshape(-1, 2)
+        if self.homography is not None:
+            q = pts @ self.homography[:, :2].T + self.homography[:, 2]
+            return q[:, :2] / q[:, 2:3]
+        return pts @ self.affine[:, :2].T + self.affine[:, 2]
+
+    __call__ = transform
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def load_transform(path: str = CALIBRATION_FILE):
+    """PixelToGantry for calibration.yaml, or None if it is missing or invalid.
+    Parsed once and reused until the file's mtime changes."""
+    stamp = _stamp(path)
+    with _lock:
+        if stamp is not None and _cache["path"] == path and _cache["stamp"] == stamp:
+            return _cache["transform"]
+    if stamp is None:
+        return None
+    transform = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            transform = PixelToGantry(yaml.safe_load(f) or {})
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Invalid pixel calibration {path}: {e}")
+    with _lock:
+        _cache.update(path=path, stamp=stamp, transform=transform)
+    return transform
+
+
+def save_calibration(data: dict, path: str = CALIBRATION_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    with _lock:
+        _cache.update(path=None, stamp=None, transform=None)
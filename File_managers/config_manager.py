@@ -29,18 +29,31 @@ def update_settings(updates: dict):
     save_settings(settings)
 
 
-def load_led_settings(default_pwm=255, default_enabled=False) -> dict:
+def load_led_settings(default_pwm=255, default_enabled=False, default_settle_ms=80,
+                      default_tolerance_pct=2.0) -> dict:
     settings = load_settings()
     pwm = settings.get("led_pwm", default_pwm)
     enabled = settings.get("led_enabled", default_enabled)
+    settle_ms = settings.get("led_settle_ms", default_settle_ms)
+    tolerance = settings.get("led_brightness_tolerance_pct", default_tolerance_pct)
     try:
         pwm = int(pwm)
     except Exception:
         pwm = int(default_pwm)
     pwm = max(0, min(255, pwm))
+    try:
+        settle_ms = max(0, int(settle_ms))
+    except Exception:
+        settle_ms = int(default_settle_ms)
+    try:
+        tolerance = max(0.0, float(tolerance))
+    except Exception:
+        tolerance = float(default_tolerance_pct)
     return {
         "led_pwm": pwm,
         "led_enabled": bool(enabled),
+        "led_settle_ms": settle_ms,                    # after the M106 "ok", before frames count
+        "led_brightness_tolerance_pct": tolerance,     # frame-to-frame mean change that counts as stable
     }
 
 
@@ -60,6 +73,128 @@ def save_led_settings(led_pwm=None, led_enabled=None):
         update_settings(updates)
 
 
+def load_transport_settings(default_streaming=False, default_bufsize=4,
+                            default_reliable=False, default_ring_size=64,
+                            default_auto=False) -> dict:
+    settings = load_settings()
+    streaming = settings.get("streaming_mode", default_streaming)
+    bufsize = settings.get("serial_bufsize", default_bufsize)
+    reliable = settings.get("reliable_transport", default_reliable)
+    ring_size = settings.get("resend_ring_size", default_ring_size)
+    auto = settings.get("auto_transport", default_auto)
+    try:
+        bufsize = int(bufsize)
+    except Exception:
+        bufsize = int(default_bufsize)
+    try:
+        ring_size = int(ring_size)
+    except Exception:
+        ring_size = int(default_ring_size)
+    return {
+        "streaming_mode": bool(streaming),
+        "serial_bufsize": max(1, bufsize),
+        "reliable_transport": bool(reliable),
+        "resend_ring_size": max(8, ring_size),
+        # let firmware capabilities (M115) switch on faster transport features
+        "auto_transport": bool(auto),
+    }
+
+
+def load_position_report_settings(default_interval=1) -> dict:
+    """M154 auto-report period in whole seconds (Marlin's resolution); 0 disables it."""
+    settings = load_settings()
+    interval = settings.get("position_autoreport_interval", default_interval)
+    try:
+        interval = int(interval)
+    except Exception:
+        interval = int(default_interval)
+    return {"interval": max(0, interval)}
+
+
+def load_jog_settings(default_mode="stream", default_segment_ms=50,
+                      default_lookahead_ms=200, default_release="quickstop") -> dict:
+    """Manual jog: "stream" (JogEngine, one continuous move) or "steps" (timer-driven G91 steps)."""
+    settings = load_settings()
+    mode = settings.get("jog_mode", default_mode)
+    release = settings.get("jog_release", default_release)
+    try:
+        segment_ms = int(settings.get("jog_segment_ms", default_segment_ms))
+    except Exception:
+        segment_ms = int(default_segment_ms)
+    try:
+        lookahead_ms = int(settings.get("jog_lookahead_ms", default_lookahead_ms))
+    except Exception:
+        lookahead_ms = int(default_lookahead_ms)
+    return {
+        "mode": mode if mode in ("stream", "steps") else default_mode,
+        "segment_time": max(10, segment_ms) / 1000.0,
+        "lookahead_time": max(segment_ms, lookahead_ms) / 1000.0,
+        "release": release if release in ("quickstop", "drain") else default_release,
+    }
+
+
+def load_picking_settings(default_window=4, default_sequence=None) -> dict:
+    """Picking run: targets queued ahead of the gantry, and the per-target G-code
+    (templates with {x} {y} {feed} {n}; default: the XY move only)."""
+    settings = load_settings()
+    try:
+        window = int(settings.get("picking_window", default_window))
+    except Exception:
+        window = int(default_window)
+    sequence = settings.get("picking_sequence", default_sequence)
+    if isinstance(sequence, str):
+        sequence = [line for line in sequence.splitlines() if line.strip()]
+    return {
+        "window": max(1, window),
+        "sequence": list(sequence) if sequence else None,
+    }
+
+
+SESSION_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'session_logs')
+
+
+def load_session_recording_settings(default_enabled=False, default_dir=SESSION_LOG_DIR) -> dict:
+    settings = load_settings()
+    return {
+        "enabled": bool(settings.get("record_serial_sessions", default_enabled)),
+        "directory": settings.get("session_log_dir") or default_dir,
+    }
+
+
+# Snapshot files; the old hard-coded location stays the default on Windows.
+CAPTURE_DIR = (r"C:\Users\Public\Pictures\MyCaptures" if os.name == "nt"
+               else os.path.join(os.path.expanduser("~"), "Pictures", "MyCaptures"))
+
+
+def load_capture_settings(default_dir=CAPTURE_DIR, default_format="jpg", default_jpeg_quality=90,
+                          default_png_compression=1, default_queue=8) -> dict:
+    """Snapshot output: root folder (a dated subfolder per day), format "jpg" | "png" | "npy",
+    and the bound of the background writer's queue."""
+    settings = load_settings()
+    fmt = str(settings.get("capture_format", default_format)).lower().lstrip(".")
+    if fmt == "jpeg":
+        fmt = "jpg"
+    try:
+        quality = int(settings.get("capture_jpeg_quality", default_jpeg_quality))
+    except Exception:
+        quality = int(default_jpeg_quality)
+    try:
+        compression = int(settings.get("capture_png_compression", default_png_compression))
+    except Exception:
+        compression = int(default_png_compression)
+    try:
+        queue_size = int(settings.get("image_writer_queue", default_queue))
+    except Exception:
+        queue_size = int(default_queue)
+    return {
+        "directory": settings.get("capture_dir") or default_dir,
+        "format": fmt if fmt in ("jpg", "png", "npy") else default_format,
+        "jpeg_quality": max(1, min(100, quality)),
+        "png_compression": max(0, min(9, compression)),   # 0-1 fast, 9 smallest; always lossless
+        "queue_size": max(1, queue_size),
+    }
+
+
 def save_camera_settings(index, data: dict):
     settings = load_settings()
     # Ensure the camera_settings section exists
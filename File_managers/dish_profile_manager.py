@@ -26,9 +26,9 @@ def save_dish_roi_points(dish_id, roi_points):
         # Save lists instead of tuples because YAML handles lists better.
         roi_list = [[int(x), int(y)] for (x, y) in roi_points]
 
-        data[dish_key] = {
-            "roi_points": roi_list
-        }
+        entry = data.get(dish_key) if isinstance(data.get(dish_key), dict) else {}
+        entry["roi_points"] = roi_list  # keep plate_position and other keys
+        data[dish_key] = entry
 
         save_dish_profiles(data)
         logging.getLogger(__name__).info(f"[OK] ROI points saved to dish_profiles.yaml under dish_id={dish_id}.")
@@ -36,3 +36,26 @@ def save_dish_roi_points(dish_id, roi_points):
         logging.getLogger(__name__).error(f"[ERROR] Failed to save ROI points: {e}")
         raise
 
+
+def load_batch_plates():
+    """Dish profiles usable by the batch scheduler, in file order:
+    [{"dish_id", "plate_position": (X, Y), "offset": (dX, dY), "roi_points": [...]}, ...].
+
+    Profile keys: plate_position: {X, Y} (required), offset: {X, Y} (optional, mm).
+    """
+    plates = []
+    for dish_id, entry in load_dish_profiles().items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("plate_position"), dict):
+            continue
+        pos = entry["plate_position"]
+        off = entry.get("offset") or {}
+        try:
+            plates.append({
+                "dish_id": str(dish_id),
+                "plate_position": (float(pos["X"]), float(pos["Y"])),
+                "offset": (float(off.get("X", 0.0)), float(off.get("Y", 0.0))),
+                "roi_points": [(int(x), int(y)) for x, y in (entry.get("roi_points") or [])],
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            logging.getLogger(__name__).warning(f"[WARN] Dish profile {dish_id}: bad plate_position/offset ({e})")
+    return plates
@@ -0,0 +1,99 @@
+import yaml
+import os
+import hashlib
+import threading
+from datetime import datetime
+
+# Stored next to marlin_settings.yaml. One entry per firmware build, keyed by the
+# fingerprint of its M115 report:
+#   3f9a1c2b7d10:
+#     firmware_name: Marlin 2.1.2.1
+#     machine_type: Ender-3 V3 SE
+#     capabilities: {AUTOREPORT_POS: true, EMERGENCY_PARSER: true, ADVANCED_OK: false, ...}
+#     unsupported_gcodes: [M906]
+#     bufsize: 4
+#     last_seen: '2026-01-01T12:00:00'
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config_profiles')
+CACHE_PATH = os.path.join(CONFIG_DIR, "firmware_cache.yaml")
+
+_lock = threading.Lock()  # entries are updated from the serial reactor thread too
+
+
+def parse_m115_response(lines) -> dict:
+    """Parse an M115 report into {"fields": {...}, "capabilities": {...}}. Empty dict if no report."""
+    fields = {}
+    capabilities = {}
+    for raw in lines:
+        line = str(raw).strip()
+        if line.startswith("Cap:"):
+            name, _, value = line[4:].rpartition(":")
+            if name:
+                capabilities[name.strip().upper()] = value.strip() == "1"
+        elif "FIRMWARE_NAME:" in line:
+            # KEY:value pairs; values may contain spaces (FIRMWARE_NAME:Marlin 2.1.2 (Jan 1 2024)).
+            key = None
+            for token in line[line.index("FIRMWARE_NAME:"):].split(" "):
+                head, sep, rest = token.partition(":")
+                if sep and head.isupper() and head.replace("_", "").isalnum():
+                    key = head
+                    fields[key] = rest
+                elif key:
+                    fields[key] = f"{fields[key]} {token}".strip()
+    if not fields and not capabilities:
+        return {}
+    return {"fields": fields, "capabilities": capabilities}
+
+
+def fingerprint(info: dict) -> str:
+    fields = info.get("fields", {})
+    caps = info.get("capabilities", {})
+    basis = "|".join([
+        fields.get("FIRMWARE_NAME", ""),
+        fields.get("MACHINE_TYPE", ""),
+        fields.get("UUID", ""),
+        ",".join(f"{k}={int(v)}" for k, v in sorted(caps.items())),
+    ])
+    return hashlib.sha1(basis.encode("utf-8")).hexdigest()[:12]
+
+
+def load_cache() -> dict:
+    if not os.path.exists(CACHE_PATH):
+        return {}
+    with open(CACHE_PATH, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def save_cache(data: dict):
+    if not os.path.exists(CONFIG_DIR):
+        os.makedirs(CONFIG_DIR)
+    with open(CACHE_PATH, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=True)
+
+
+def get_entry(fp: str):
+    with _lock:
+        return load_cache().get(fp)
+
+
+def update_entry(fp: str, updates: dict) -> dict:
+    with _lock:
+        cache = load_cache()
+        entry = cache.get(fp) or {}
+        entry.update(updates)
+        entry["last_seen"] = datetime.now().isoformat(timespec="seconds")
+        cache[fp] = entry
+        save_cache(cache)
+        return entry
+
+
+def add_unsupported_gcode(fp: str, code: str):
+    with _lock:
+        cache = load_cache()
+        entry = cache.get(fp) or {}
+        codes = set(entry.get("unsupported_gcodes") or [])
+        if code in codes:
+            return
+        codes.add(code)
+        entry["unsupported_gcodes"] = sorted(codes)
+        cache[fp] = entry
+        save_cache(cache)
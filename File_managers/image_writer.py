@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+# Background image writer: encoding and disk I/O run on a few worker threads fed
+# by a bounded queue, so the GUI (or a capture loop) never waits for the disk.
+#   pool.submit(frame, "/captures/2026.01.01/capture_cam0_...", "png") -> Future(path)
+# Formats: "jpg" (fast, lossy), "png" (lossless), "npy" (raw array, no encoding).
+# Files are written under a temporary name and renamed, so a reader never sees
+# half a file. A full queue fails the submit instead of blocking the caller.
+FORMATS = ("jpg", "png", "npy")
+
+
+def write_image(image, path: str, fmt: str = None, jpeg_quality: int = 90, png_compression: int = 1) -> str:
+    """Synchronous write; fmt defaults to the extension of path. Returns path."""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported image format: {fmt!r}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        if fmt == "npy":
+            np.save(f, image, allow_pickle=False)
+        else:
+            params = ([cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)] if fmt == "jpg"
+                      else [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)])
+            ok, data = cv2.imencode("." + fmt, image, params)
+            if not ok:
+                raise OSError(f"could not encode {path}")
+            f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+class ImageWriterPool:
+    def __init__(self, workers: int = 2, max_queue: int = 8):
+        self.max_queue = max(1, int(max_queue))
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._closed = False
+        self._threads = []
+        for i in range(max(1, int(workers))):
+            t = threading.Thread(target=self._run, name=f"image-writer-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, image, path_base: str, fmt: str = "jpg", jpeg_quality: int = 90,
+               png_compression: int = 1, block: bool = False) -> Future:
+        """Queue image for path_base + "." + fmt; the future resolves with the path.
+        The pool keeps a reference to image: do not modify it afterwards."""
+        future = Future()
+        fmt = fmt.lower()
+        path = f"{path_base}.{fmt}"
+        if self._closed:
+            future.set_exception(RuntimeError("image writer is closed"))
+            return future
+        if fmt not in FORMATS:
+            future.set_exception(ValueError(f"unsupported image format: {fmt!r}"))
+            return future
+        try:
+            self._queue.put((image, path, fmt, jpeg_quality, png_compression, future), block=block)
+        except queue.Full:
+            future.set_exception(queue.Full(f"image writer queue full ({self.max_queue}), {path} not written"))
+        return future
+
+    def close(self, wait: bool = True):
+        """Write what is queued, then stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            image, path, fmt, jpeg_quality, png_compression, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(write_image(image, path, fmt, jpeg_quality, png_compression))
+            except Exception as e:
+                future.set_exception(e)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_pool(max_queue: int = 8) -> ImageWriterPool:
+    """Process-wide pool (created on first use with max_queue)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ImageWriterPool(max_queue=max_queue)
+        return _shared
+
+
+def close_shared_pool(wait: bool = True):
+    global _shared
+    with _shared_lock:
+        pool, _shared = _shared, None
+    if pool is not None:
+        pool.close(wait)
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+import threading
+from datetime import datetime
+
+# One append-only JSON-lines file per picking run:
+#   {"type": "job", "job_id": ..., "targets": [[x, y], ...], "points": [[px, py], ...], ...}
+#   {"type": "pick", "idx": 0, "t": 1767261600.1}      one per confirmed target (its M400 "ok")
+#   {"type": "stop"} / {"type": "resume", "idx": 12}    run events
+#   {"type": "end", "status": "done" | "closed"}
+# Records reach the OS on every write; fsync is batched (every fsync_every records or
+# fsync_interval seconds, and always for job/stop/end), so a crash loses at most the
+# last few confirmations and those targets are picked again.
+JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'picking_jobs')
+
+_TAIL_BLOCK = 4096
+
+
+class JobJournal:
+    def __init__(self, path: str, fsync_every: int = 8, fsync_interval: float = 1.0):
+        self.path = path
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = float(fsync_interval)
+        self._lock = threading.Lock()
+        needs_newline = os.path.exists(path) and os.path.getsize(path) > 0 and not _ends_with_newline(path)
+        self._f = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._f.write("\n")  # a crash cut the last record short
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def create(cls, targets, points=None, meta: dict = None, directory: str = JOB_DIR, **kwargs):
+        os.makedirs(directory, exist_ok=True)
+        job_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        journal = cls(os.path.join(directory, f"job_{job_id}.jsonl"), **kwargs)
+        header = {
+            "type": "job",
+            "job_id": job_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "targets": [[float(x), float(y)] for x, y in targets],
+            "points": [[int(x), int(y)] for x, y in (points or [])],
+        }
+        header.update(meta or {})
+        journal._append(header, sync=True)
+        return journal
+
+    # ---------- records ----------
+    def record_pick(self, idx: int):
+        self._append({"type": "pick", "idx": int(idx), "t": round(time.time(), 3)})
+
+    def record_event(self, kind: str, **data):
+        record = {"type": kind}
+        record.update(data)
+        self._append(record, sync=True)
+
+    def finish(self, status: str = "done"):
+        self._append({"type": "end", "status": status}, sync=True)
+        self.close()
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._f.closed:
+                return
+            self._sync_locked()
+            self._f.close()
+
+    def _append(self, record: dict, sync: bool = False):
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._f.flush()
+            self._unsynced += 1
+            if sync or self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        if self._f.closed or not self._unsynced:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _tail_records(f, size: int):
+    """Complete records from the end of the file backwards, newest first. Reads
+    _TAIL_BLOCK bytes at a time, so finding the last pick does not depend on the job length."""
+    end = size
+    carry = b""
+    while end > 0:
+        start = max(0, end - _TAIL_BLOCK)
+        f.seek(start)
+        chunk = f.read(end - start) + carry
+        lines = chunk.split(b"\n")
+        carry = lines.pop(0) if start > 0 else b""
+        for raw in reversed(lines):
+            try:
+                yield json.loads(raw)
+            except ValueError:
+                continue  # empty or cut short by a crash
+        end = start
+
+
+def read_job(path: str) -> dict:
+    """{"path", "header", "next_idx", "status"}; status is None while the job is unfinished."""
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        size = f.seek(0, os.SEEK_END)
+        status = None
+        next_idx = 0
+        for record in _tail_records(f, size):
+            kind = record.get("type")
+            if kind == "end" and status is None:
+                status = record.get("status", "done")
+            elif kind == "pick":
+                next_idx = int(record["idx"]) + 1
+                break
+            elif kind in ("resume", "job"):
+                next_idx = int(record.get("idx", 0))
+                break
+    return {"path": path, "header": header, "next_idx": next_idx, "status": status}
+
+
+def list_unfinished(directory: str = JOB_DIR) -> list:
+    """Jobs without an end record that still have targets left, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    jobs = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not (name.startswith("job_") and name.endswith(".jsonl")):
+            continue
+        try:
+            job = read_job(os.path.join(directory, name))
+        except (OSError, ValueError, KeyError):
+            continue
+        if job["status"] is None and job["next_idx"] < len(job["header"].get("targets", [])):
+            jobs.append(job)
+    return jobs
@@ -2,54 +2,170 @@
 import threading
 
 import cv2, os
+import numpy as np
 from datetime import datetime
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton, QSizePolicy
 from PyQt5.QtCore import QTimer, Qt, pyqtSignal, QThread, pyqtSlot
 from PyQt5.QtGui import QImage, QPixmap
 import yaml
-from File_managers import config_manager
+from File_managers import config_manager, image_writer
+from Image_processing.frame_ring import FrameRing
+from Image_processing.led_snapshot import LedSnapshot
 from GUI.custom_widgets.photo_pipeline.manual_steps.manual_pipeline_widget import PipelineWidget
 from GUI.custom_widgets.mainwindow_components.CameraSettingsWidget import CameraSettingsWidget
 
 
+# QImage wraps BGR data directly where Qt supports it (5.14+); otherwise the preview converts.
+_FORMAT_BGR888 = getattr(QImage, "Format_BGR888", None)
+
+
+def zoom_crop(frame, zoom_level, offset_x, offset_y):
+    """Zoomed crop of frame as a view (no copy)."""
+    h, w = frame.shape[:2]
+    if zoom_level > 1.0:
+        new_w, new_h = int(w / zoom_level), int(h / zoom_level)
+
+        center_x = w // 2 + int(offset_x * (w // 2 - new_w // 2))
+        center_y = h // 2 + int(offset_y * (h // 2 - new_h // 2))
+
+        x1 = max(center_x - new_w // 2, 0)
+        y1 = max(center_y - new_h // 2, 0)
+        x2 = min(x1 + new_w, w)
+        y2 = min(y1 + new_h, h)
+
+        frame = frame[y1:y2, x1:x2]
+    return frame
+
+
+def prepare_capture(frame, zoom_level, offset_x, offset_y, blur):
+    """Saved and analysed form of a snapshot: zoom crop, optional 15x15 blur, as an own
+    contiguous array. Runs on the snapshot thread, not the GUI thread."""
+    frame = zoom_crop(frame, zoom_level, offset_x, offset_y)
+    if blur:
+        frame = cv2.GaussianBlur(frame, (15, 15), 0)
+    return np.ascontiguousarray(frame)
+
+
+class PreviewRenderer:
+    """Worker side of the preview: crop, shrink to the label size, blur, convert to a QImage.
+    Downsampling comes first, so the blur and the colour conversion run on label-sized
+    pixels; the blur kernel is scaled to look like the 15x15 one on the full frame."""
+
+    def __init__(self):
+        self._buf = None
+
+    def render(self, frame, zoom_level, offset_x, offset_y, blur, size):
+        """The returned QImage shares this renderer's buffer: it is valid until the next render()."""
+        view = zoom_crop(frame, zoom_level, offset_x, offset_y)
+        h, w = view.shape[:2]
+        tw, th = size
+        scale = min(tw / w, th / h) if tw > 0 and th > 0 else 1.0
+        dw, dh = max(1, int(w * scale)), max(1, int(h * scale))
+        shape = (dh, dw) + view.shape[2:]
+        if self._buf is None or self._buf.shape != shape or self._buf.dtype != view.dtype:
+            self._buf = np.empty(shape, dtype=view.dtype)
+        buf = self._buf
+        if (dw, dh) == (w, h):
+            np.copyto(buf, view)
+        else:
+            cv2.resize(view, (dw, dh), dst=buf,
+                       interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+        if blur:
+            k = int(15 * scale) | 1
+            if k >= 3:
+                cv2.GaussianBlur(buf, (k, k), 0, dst=buf)
+        fmt = _FORMAT_BGR888
+        if fmt is None:
+            cv2.cvtColor(buf, cv2.COLOR_BGR2RGB, dst=buf)
+            fmt = QImage.Format_RGB888
+        return QImage(buf.data, dw, dh, buf.strides[0], fmt)
+
+
 class CameraWorker(QThread):
-    """Opens, reads, and closes its own cv2.VideoCapture entirely in the background thread."""
-    frame_ready = pyqtSignal(object)   # emits numpy BGR frame
+    """Opens, reads, and closes its own cv2.VideoCapture entirely in the background thread.
+    Frames are read into the FrameRing's buffers; the preview is rendered here too, so the
+    GUI thread only blits the QImage it receives."""
+    frame_ready = pyqtSignal(int, object)   # emits ring sequence number, display-ready QImage
     error       = pyqtSignal(str)
 
-    def __init__(self, camera_index: int):
+    def __init__(self, camera_index: int, ring: FrameRing, fps: float = 30, free_run: bool = False):
         super().__init__()
         self._index   = camera_index
-        self._fps     = 30
+        self._ring    = ring
+        self._fps     = fps
+        self._free_run = free_run   # grab at the camera's own rate, driver queue of one frame
         self._running = False
+        self._display_pending = False   # a frame_ready is queued and not handled yet
+        self._renderer = PreviewRenderer()
+        self._view = (1.0, 0.0, 0.0, False, (0, 0))   # zoom, offset x/y, blur, label size
 
     def run(self):
         cap = cv2.VideoCapture(self._index, cv2.CAP_DSHOW)
         if not cap.isOpened():
             self.error.emit(f"[ERROR] Could not open camera {self._index}.")
             return
-        self._running = True  
+        if self._free_run:
+            # Keep only the newest frame in the driver: grab() then returns the scene
+            # as it is now, not one from several queued frames ago.
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._running = True
+        ring = self._ring
+        period = 1.0 / self._fps if self._fps and self._fps > 0 else 0.0
+        next_due = time.monotonic()
         while self._running:
-            ret, frame = cap.read()
-            if ret:
-                self.frame_ready.emit(frame)
-            else:
+            if not self._free_run:
+                # Deadline pacing: the read time counts against the frame period.
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_due = max(next_due + period, time.monotonic())   # no burst after a stall
+            if not cap.grab():
                 self.error.emit("[WARN] Camera read failed (no frame).")
                 time.sleep(0.1)
                 continue
-            time.sleep(1.0 / self._fps ) #  30 FPS -> circa 33 ms per frame 
+            grabbed_at = time.monotonic()
+            slot = ring.acquire()
+            if slot is None:
+                continue   # every slot is leased: drop this frame
+            buf = ring.buffer(slot)
+            ret, frame = cap.retrieve(buf) if buf is not None else cap.retrieve()
+            if not ret:
+                ring.discard(slot)
+                self.error.emit("[WARN] Camera read failed (no frame).")
+                time.sleep(0.1)
+                continue
+            hw_msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+            seq = ring.publish(slot, frame, grabbed_at, hw_msec if hw_msec > 0 else None)
+            # Only one preview in flight: while the GUI is behind, frames are not
+            # rendered at all and it gets the newest one when it is ready again.
+            # (The slot stays the ring's latest until this thread publishes again.)
+            if seq and not self._display_pending:
+                image = self._renderer.render(frame, *self._view)
+                self._display_pending = True
+                self.frame_ready.emit(seq, image)
         cap.release()
 
     def request_stop(self):
         """Non-blocking: signal the loop to exit. Thread dies on its own."""
         self._running = False
 
+    def set_view(self, zoom_level, offset_x, offset_y, blur, size):
+        """Preview settings; size is the (w, h) the image is shown at."""
+        self._view = (float(zoom_level), float(offset_x), float(offset_y), bool(blur),
+                      (int(size[0]), int(size[1])))
+
+    def frame_shown(self):
+        """GUI thread: the last preview was blitted, its buffer may be rendered into again."""
+        self._display_pending = False
+
 
 class CameraWidget(QWidget):
     playPressed     = pyqtSignal()
     stopPressed     = pyqtSignal()
     snapshotPressed = pyqtSignal()
     _cameras_ready  = pyqtSignal(list)   # emitted by detect thread → main thread
+    _snapshot_done  = pyqtSignal(object) # LedSnapshot result, snapshot thread → main thread
+    _capture_written = pyqtSignal(object) # image_writer Future, writer thread → main thread
 
     def __init__(self, log_widget, main_window, camera_index=None, available_cams=None, parent=None):
         super().__init__(parent)
@@ -57,9 +173,8 @@ class CameraWidget(QWidget):
         self.available_cams  = available_cams or []
         self.main_window     = main_window
         self.log_widget      = log_widget
-        self.capture_after_led = False
-        self.frames_to_skip    = 0
-        self.current_frame     = None
+        self.frame_ring        = FrameRing(slots=4)
+        self._snapshot_thread  = None
 
         # Load saved settings (default index 0 for initial load)
         _idx = camera_index if camera_index is not None else 0
@@ -70,12 +185,16 @@ class CameraWidget(QWidget):
         self.blur_enabled  = camera_settings.get("blur",       False)
         self.gain          = camera_settings.get("gain",       0.0)
         self.exposure      = camera_settings.get("exposure",  -6.0)
+        self.fps           = camera_settings.get("fps",        30)
+        self.free_run      = camera_settings.get("free_run",   False)
 
         self._worker: CameraWorker | None = None
         self._is_running = False   # tracks whether capture is active
 
         # wire the detection-done signal (must be done before initUI calls populate_camera_list)
         self._cameras_ready.connect(self._on_cameras_detected)
+        self._snapshot_done.connect(self._on_snapshot_done)
+        self._capture_written.connect(self._on_capture_written)
 
         self.initUI()
 
@@ -199,6 +318,8 @@ class CameraWidget(QWidget):
         self.blur_enabled  = camera_settings.get("blur",       False)
         self.gain          = camera_settings.get("gain",       0.0)
         self.exposure      = camera_settings.get("exposure",  -6.0)
+        self.fps           = camera_settings.get("fps",        30)
+        self.free_run      = camera_settings.get("free_run",   False)
 
     # ------------------------------------------------------------------
     # Worker management (non-blocking stop)
@@ -207,7 +328,9 @@ class CameraWidget(QWidget):
         """Start capture for *index*. Always non-blocking."""
         self._kill_worker()
         self.camera_index = index
-        self._worker = CameraWorker(index)
+        self.frame_ring.clear()
+        self._worker = CameraWorker(index, self.frame_ring, fps=self.fps, free_run=self.free_run)
+        self._push_view(self._worker)
         self._worker.frame_ready.connect(self._on_frame_ready)
         self._worker.error.connect(self.log_widget.append_log)
         self._worker.finished.connect(self._worker.deleteLater)
@@ -249,41 +372,75 @@ class CameraWidget(QWidget):
         self.log_widget.append_log("[INFO] Camera: Stop pressed")
         self.stopPressed.emit()
         self._kill_worker()
-        self.current_frame = None
+        self.frame_ring.clear()
         self.label_camera.clear()
         self.label_camera.setText("Camera Feed")
 
-    def _on_frame_ready(self, frame):
-        """Runs on the main thread – display + deferred capture logic only."""
-        self.current_frame = frame
-        frame_to_show = self.apply_zoom_and_blur(frame)
-        rgb_image = cv2.cvtColor(frame_to_show, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        qimg = QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimg).scaled(self.label_camera.size(), Qt.KeepAspectRatio)
-        self.label_camera.setPixmap(pixmap)
-
-        if self.capture_after_led:
-            if self.frames_to_skip > 0:
-                self.frames_to_skip -= 1
-            else:
-                self.capture_after_led = False
-                self.capture_image()
-                self._send_led_pwm(0)
+    @property
+    def current_frame(self):
+        """Copy of the latest camera frame (BGR), or None. Readers that only need it
+        briefly should lease it from frame_ring instead."""
+        return self.frame_ring.copy_latest()
+
+    def _on_frame_ready(self, seq, image):
+        """Runs on the main thread – blit only."""
+        self.label_camera.setPixmap(QPixmap.fromImage(image))
+        worker = self.sender()
+        if isinstance(worker, CameraWorker):
+            self._push_view(worker)
+            worker.frame_shown()   # after fromImage: the worker reuses the image buffer
+
+    def _push_view(self, worker):
+        size = self.label_camera.size()
+        worker.set_view(self.zoom_level, self.zoom_offset_x, self.zoom_offset_y,
+                        self.blur_enabled, (size.width(), size.height()))
 
 
     def on_snapshot(self):
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            self.log_widget.append_log("[INFO] Snapshot already in progress.")
+            return
+        if not self._is_running:
+            self.log_widget.append_log("[WARN] Start the camera first.")
+            return
         led_cfg = config_manager.load_led_settings(default_pwm=255, default_enabled=False)
         s = int(led_cfg.get("led_pwm", 255)) if bool(led_cfg.get("led_enabled", False)) else 0
-        self._send_led_pwm(s)
-        self.frames_to_skip    = 3
-        self.capture_after_led = True
+        g_control = getattr(self.main_window, "g_control", None)
+        if g_control is not None and not g_control.connected:
+            g_control = None   # no LED without the machine; take the frame as it is
+        snapshot = LedSnapshot(
+            self.frame_ring, g_control, s,
+            settle_time=led_cfg["led_settle_ms"] / 1000.0,
+            tolerance=led_cfg["led_brightness_tolerance_pct"] / 100.0,
+        )
+        view = (self.zoom_level, self.zoom_offset_x, self.zoom_offset_y, self.blur_enabled)
+        self._snapshot_thread = threading.Thread(
+            target=self._take_snapshot, args=(snapshot, view), daemon=True, name="led-snapshot")
+        self._snapshot_thread.start()
         self.snapshotPressed.emit()
 
-    def _send_led_pwm(self, s_value: int):
-        g_control = getattr(self.main_window, "g_control", None)
-        if g_control:
-            g_control.send_led_pwm(s_value)
+    def _take_snapshot(self, snapshot, view):
+        """Snapshot thread: LED capture, then zoom and blur, so the GUI thread only
+        queues the write and opens the analyzer."""
+        result = snapshot.run()
+        if result["frame"] is not None:
+            result["frame"] = prepare_capture(result["frame"], *view)
+        self._snapshot_done.emit(result)
+
+    def _on_snapshot_done(self, result):
+        if result["frame"] is None:
+            self.log_widget.append_log(f"[ERROR] Snapshot failed: {result['error']}")
+            return
+        if result["error"]:
+            self.log_widget.append_log(f"[WARN] Snapshot: {result['error']}")
+        if not result["stable"]:
+            self.log_widget.append_log("[WARN] Snapshot: brightness did not settle, using the last frame.")
+        ack = result["ack_latency"]
+        ack_text = f", LED ok after {ack * 1000:.0f} ms" if ack is not None else ""
+        self.log_widget.append_log(
+            f"[INFO] Snapshot in {result['latency'] * 1000:.0f} ms{ack_text}, "
+            f"{result['frames']} frame(s), mean brightness {result['brightness']:.1f}")
+        self.capture_image(result["frame"])
 
     def open_camera_settings(self):
         if self.camera_index is None:
@@ -309,22 +466,12 @@ class CameraWidget(QWidget):
         if was_running:
             self._start_worker(self.camera_index)
 
-    def apply_zoom_and_blur(self, frame):
-        h, w = frame.shape[:2]
-
-        # Crop zoomed image
-        if self.zoom_level > 1.0:
-            new_w, new_h = int(w / self.zoom_level), int(h / self.zoom_level)
-
-            center_x = w // 2 + int(self.zoom_offset_x * (w // 2 - new_w // 2))
-            center_y = h // 2 + int(self.zoom_offset_y * (h // 2 - new_h // 2))
-
-            x1 = max(center_x - new_w // 2, 0)
-            y1 = max(center_y - new_h // 2, 0)
-            x2 = min(x1 + new_w, w)
-            y2 = min(y1 + new_h, h)
+    def _zoom_view(self, frame):
+        """Zoomed crop of frame as a view (no copy)."""
+        return zoom_crop(frame, self.zoom_level, self.zoom_offset_x, self.zoom_offset_y)
 
-            frame = frame[y1:y2, x1:x2]
+    def apply_zoom_and_blur(self, frame):
+        frame = self._zoom_view(frame)
 
         # Apply blur if enabled
         if self.blur_enabled:
@@ -332,25 +479,33 @@ class CameraWidget(QWidget):
 
         return frame
 
-    def capture_image(self):
-        if self.current_frame is not None:
-            processed_frame = self.apply_zoom_and_blur(self.current_frame)
+    def capture_image(self, image):
+        """Queue image (from prepare_capture, see on_snapshot) for the background writer and
+        open it in the analyzer straight from memory. False if there is no image."""
+        if image is None:
+            return False
+        cfg = config_manager.load_capture_settings()
+        date_folder = datetime.now().strftime("%Y.%m.%d")
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        path_base = os.path.join(cfg["directory"], date_folder, f"capture_cam{self.camera_index}_{timestamp}")
 
-            base_dir = r"C:\Users\Public\Pictures\MyCaptures"
-            date_folder = datetime.now().strftime("%Y.%m.%d")
-            save_folder = os.path.join(base_dir, date_folder)
-            os.makedirs(save_folder, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            filename = os.path.join(save_folder, f"capture_cam{self.camera_index}_{timestamp}.jpg")
+        future = image_writer.shared_pool(cfg["queue_size"]).submit(
+            image, path_base, cfg["format"],
+            jpeg_quality=cfg["jpeg_quality"], png_compression=cfg["png_compression"])
+        future.add_done_callback(self._capture_written.emit)
 
-            cv2.imwrite(filename, processed_frame)
-            self.log_widget.append_log(f"Image saved: {filename}")
+        # Open the image in the analyzer
+        self.open_bacteria_analyzer(f"{path_base}.{cfg['format']}", image)
+        return True
 
-            # Open the image in the analyzer
-            self.open_bacteria_analyzer(filename)
+    def _on_capture_written(self, future):
+        try:
+            self.log_widget.append_log(f"Image saved: {future.result()}")
+        except Exception as e:
+            self.log_widget.append_log(f"[ERROR] Image not saved: {e}")
 
-    def open_bacteria_analyzer(self, image_path=None):
-        self.analyzer_window = PipelineWidget(self.main_window, image_path, self.log_widget)
+    def open_bacteria_analyzer(self, image_path=None, image=None):
+        self.analyzer_window = PipelineWidget(self.main_window, image_path, self.log_widget, image=image)
         self.analyzer_window.pipeline_finished.connect(self._on_pipeline_finished)
         self.analyzer_window.setWindowState(self.analyzer_window.windowState() & ~Qt.WindowFullScreen)
         self.analyzer_window.showMaximized()
@@ -5,6 +5,8 @@ from PyQt5.QtGui import QPainter, QColor, QPen
 import time
 import threading
 from Pozitioner_and_Communicater.CommandSender import CommandSender
+from Pozitioner_and_Communicater.jog_engine import JogEngine
+from File_managers import config_manager
 import re
 
 
@@ -109,6 +111,8 @@ class ArrowControlPad(QWidget):
 
 class ManualControlWidget(QWidget):
     actionCommand = pyqtSignal(str)
+    # direction -> (axis, sign); matches the step commands of send_move_command()
+    JOG_AXES = {"up": ("Y", -1), "down": ("Y", 1), "right": ("X", 1), "left": ("X", -1)}
 
     def __init__(self, g_control, log_widget, command_sender, main_window, parent=None):
         super().__init__(parent)
@@ -126,6 +130,7 @@ class ManualControlWidget(QWidget):
         self._extruder_motion_prepared = False
         self.auto_disable_steppers_on_idle = True
         self.idle_disable_delay_ms = 1200
+        self.jog_engine = self._create_jog_engine()
 
         self.status_label = QLabel("Checking connection...")
         self._reconnecting = False
@@ -340,6 +345,8 @@ class ManualControlWidget(QWidget):
         self.jog_feedrate = speed
         self.lbl_jog_speed_value.setText(f"F{speed}")
         self._update_jog_timer_interval()
+        if self.jog_engine is not None:
+            self.jog_engine.set_feedrate(speed)
 
     def query_config(self):
         if self.g_control.connected:
@@ -349,9 +356,26 @@ class ManualControlWidget(QWidget):
         else:
             self.log_widget.append_log("[ERROR] Machine is not connected for configuration query.")
 
+    def _create_jog_engine(self):
+        try:
+            cfg = config_manager.load_jog_settings()
+        except Exception as e:
+            self.log_widget.append_log(f"[WARN] Failed to load jog settings: {e}")
+            return None
+        if cfg["mode"] != "stream":
+            return None
+        return JogEngine(self.g_control, cfg["segment_time"], cfg["lookahead_time"], cfg["release"])
+
     def _on_direction_pressed(self, direction):
         if self._idle_disable_timer.isActive():
             self._idle_disable_timer.stop()
+        if self.jog_engine is not None and direction in self.JOG_AXES:
+            if self.stopped:
+                return
+            axis, sign = self.JOG_AXES[direction]
+            self.log_widget.append_log(f"[JOG] {axis}{'+' if sign > 0 else '-'} continuous at F{self.jog_feedrate}")
+            self.jog_engine.start(axis, sign, self.jog_feedrate)
+            return
         timer = self.timers.get(direction)
         if timer and not timer.isActive():
             self.send_move_command(direction)
@@ -359,6 +383,12 @@ class ManualControlWidget(QWidget):
             self._prime_continuous_jog(direction)
 
     def _on_direction_released(self, direction):
+        if self.jog_engine is not None and direction in self.JOG_AXES:
+            axis, sign = self.JOG_AXES[direction]
+            if self.jog_engine.is_jogging(axis, sign):
+                self.jog_engine.stop()
+            self._schedule_idle_disable()
+            return
         timer = self.timers.get(direction)
         if timer:
             timer.stop()
@@ -370,6 +400,8 @@ class ManualControlWidget(QWidget):
             return
         if any(t.isActive() for t in self.timers.values()):
             return
+        if self.jog_engine is not None and self.jog_engine.active:
+            return
         self._idle_disable_timer.start()
 
     def _disable_steppers_if_idle(self):
@@ -379,6 +411,8 @@ class ManualControlWidget(QWidget):
             return
         if any(t.isActive() for t in self.timers.values()):
             return
+        if self.jog_engine is not None and self.jog_engine.active:
+            return
 
         has_pending = False
         pending_fn = getattr(self.g_control, "has_pending_motion_commands", None)
@@ -583,6 +617,8 @@ class ManualControlWidget(QWidget):
 
     def emergency_stop(self):
         self.log_widget.append_log("[EMERGENCY STOP] Immediate machine stop!")
+        if self.jog_engine is not None:
+            self.jog_engine.stop()
 
         # M410 = quickstop (halts all motion immediately, firmware stays alive)
         # M18  = disable all steppers
@@ -590,9 +626,7 @@ class ManualControlWidget(QWidget):
         # a power cycle to recover (especially on STM32-based boards like Ender 3 V3 SE).
         try:
             if self.g_control.ser and self.g_control.ser.is_open:
-                self.g_control.ser.write(b"M410\n")
-                self.g_control.ser.write(b"M18\n")
-                self.g_control.ser.flush()
+                self.g_control.quick_stop(disable_steppers=True)
                 self.log_widget.append_log("[EMERGENCY STOP] M410 + M18 sent – motion stopped, connection kept.")
             else:
                 self.log_widget.append_log("[EMERGENCY STOP] Not connected – nothing to stop.")
@@ -4,7 +4,8 @@ Workflow:
 1. User clicks 'Capture snapshot' -> freezes the current camera frame.
 2. User clicks 3 points on the frozen image (P1, P2, P3).
 3. For each point, the user manually moves the printer so the needle physically
-   sits on the marked spot, then clicks 'Capture position' to query M114.
+   sits on the marked spot, then clicks 'Capture position' (uses the M154
+   auto-report when fresh, otherwise queries M114 without blocking the GUI).
 4. User enters the 3 real-world distances between the points (mm).
 5. 'Calculate & Save' fits an affine transform (pixel -> gantry mm), computes
    the average px/mm scale, and the needle offset relative to the camera image
@@ -13,18 +14,16 @@ Workflow:
 import os
 import math
 import time
-import yaml
 import cv2
 import numpy as np
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtCore import Qt, QPoint, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor, QFont
 from PyQt5.QtWidgets import (
     QDialog, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout,
     QGroupBox, QDoubleSpinBox, QMessageBox, QFrame
 )
-
-CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "config_profiles")
-CALIBRATION_FILE = os.path.join(CONFIG_DIR, "calibration.yaml")
+from Pozitioner_and_Communicater.G_communicate import parse_position
+from File_managers.calibration_manager import CALIBRATION_FILE, save_calibration
 
 POINT_COLORS = [QColor(255, 60, 60), QColor(60, 220, 60), QColor(60, 140, 255)]
 POINT_LABELS = ["P1", "P2", "P3"]
@@ -127,11 +126,14 @@ class ClickableImageLabel(QLabel):
 
 
 class PixelCalibrationWindow(QDialog):
+    _position_ready = pyqtSignal(int, object)  # (point index, CommandHandle of M400+M114), from the reactor thread
+
     def __init__(self, g_control, camera_widget, log_widget, parent=None):
         super().__init__(parent)
         self.g_control = g_control
         self.camera_widget = camera_widget
         self.log_widget = log_widget
+        self._position_ready.connect(self._on_position_reply)
         self.setWindowTitle("Pixel / mm calibration")
         self.resize(1100, 800)
 
@@ -240,7 +242,7 @@ class PixelCalibrationWindow(QDialog):
         if frame is None:
             QMessageBox.warning(self, "No frame", "Camera has no frame yet. Start the camera first.")
             return
-        self.image_label.set_frame(frame.copy())
+        self.image_label.set_frame(frame)   # current_frame is already a copy of the ring slot
         self.pixel_points = [None, None, None]
         self.gantry_points = [None, None, None]
         for i in range(3):
@@ -265,21 +267,28 @@ class PixelCalibrationWindow(QDialog):
         if not self.g_control or not self.g_control.connected:
             QMessageBox.warning(self, "Not connected", "Printer is not connected.")
             return
-        # request position and read back after a short delay
-        self.g_control.new_command("M114")
-        # poll _current_pos for up to ~1s for a fresh value
-        start = time.time()
-        prev = dict(self.g_control._current_pos)
-        x = y = None
-        while time.time() - start < 1.0:
-            time.sleep(0.05)
-            cur = self.g_control._current_pos
-            if cur != prev or (time.time() - start) > 0.4:
-                x, y = cur.get("X"), cur.get("Y")
+        # M400 + M114 as one command on the control lane: it queues behind every move, and the
+        # M114 is only written once M400's "ok" says the planner is empty, so the reply is the
+        # position the gantry stopped at. The reply arrives on the reactor thread -> signal.
+        self.btn_capture_pos[idx].setEnabled(False)
+        handle = self.g_control.submit_command("M400\nM114", wait_motion=False)
+        handle.add_done_callback(lambda h: self._position_ready.emit(idx, h))
+
+    def _on_position_reply(self, idx, handle):
+        self.btn_capture_pos[idx].setEnabled(True)
+        pos = {}
+        # Last match: auto-reports taken during the move come before the M114 reply.
+        for line in reversed(handle.responses):
+            pos = parse_position(line)
+            if pos:
                 break
-        if x is None or y is None:
-            cur = self.g_control._current_pos
-            x, y = cur.get("X", 0.0), cur.get("Y", 0.0)
+        if "X" not in pos or "Y" not in pos:
+            self.log_widget.append_log(
+                f"[CALIB] {POINT_LABELS[idx]}: no position reply from the printer; point not set.")
+            return
+        self._set_gantry_point(idx, pos["X"], pos["Y"])
+
+    def _set_gantry_point(self, idx, x, y):
         self.gantry_points[idx] = (float(x), float(y))
         self.lbl_gantry[idx].setText(f"({x:.2f}, {y:.2f})")
         self.log_widget.append_log(f"[CALIB] {POINT_LABELS[idx]} gantry pos: X={x:.2f} Y={y:.2f}")
@@ -368,10 +377,8 @@ class PixelCalibrationWindow(QDialog):
             },
         }
 
-        os.makedirs(CONFIG_DIR, exist_ok=True)
         try:
-            with open(CALIBRATION_FILE, "w", encoding="utf-8") as f:
-                yaml.safe_dump(result, f, sort_keys=False)
+            save_calibration(result)
         except Exception as e:
             QMessageBox.critical(self, "Save error", f"Failed to write {CALIBRATION_FILE}:\n{e}")
             return
@@ -11,7 +11,7 @@ from GUI.custom_widgets.photo_pipeline.pipeline_context import PipelineContext
 class PipelineWidget(QWidget):
     pipeline_finished = pyqtSignal()
 
-    def __init__(self,main_window, image_path,log_widget):
+    def __init__(self,main_window, image_path,log_widget, image=None):
         super().__init__()
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.image_path = image_path
@@ -19,6 +19,8 @@ class PipelineWidget(QWidget):
         self.log_widget = log_widget
 
         self.context = PipelineContext()
+        if image is not None:
+            self.context.preload_image(image, image_path)   # no need to wait for the file
         self.stack = QStackedWidget()
         self.stack.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         layout = QVBoxLayout()
@@ -162,7 +162,7 @@ class StepCaptureWidget(QWidget):
 
     def load_and_process_image(self, path):
         self.image_path = path
-        self.original_image = cv2.imread(path)
+        self.original_image = self.context.load_image(path)
         if self.original_image is not None:
             self.petri_mask = None
             self.update_petri_params(force_detect=True)
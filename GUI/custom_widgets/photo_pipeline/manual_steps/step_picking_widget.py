@@ -2,10 +2,19 @@
 from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from Image_processing.overlay_draw import draw_picking_progress
+from Pozitioner_and_Communicater.motion_estimator import format_duration, transport_overhead
+from Pozitioner_and_Communicater.route_optimizer import optimize_route
+from Pozitioner_and_Communicater.picking_executor import PickingExecutor, DEFAULT_SEQUENCE
+from File_managers import config_manager, calibration_manager
+from File_managers.job_journal import JobJournal, read_job
 import cv2
+import threading
+import time
 
 class StepPickingWidget(QWidget):
     finished = pyqtSignal()
+    _executor_event = pyqtSignal(object, str, object)  # (executor, event, args), from the serial reactor thread
+    _estimate_ready = pyqtSignal(int, object)          # (request, (count, plan) / exception / None), from the estimate thread
     ROI_MOVE_FEEDRATE = 6000
 
     def __init__(self, context, image_path=None, log_widget=None, main_window=None):
@@ -41,6 +50,9 @@ class StepPickingWidget(QWidget):
         self.log_box.setReadOnly(True)
         log_layout.addWidget(self.log_box)
 
+        self.estimate_label = QLabel("")  # motion time preview, see _update_estimate()
+        log_layout.addWidget(self.estimate_label)
+
         right_controls_layout = QHBoxLayout()
         right_controls_layout.setSpacing(8)
 
@@ -77,18 +89,23 @@ class StepPickingWidget(QWidget):
         main_layout.addLayout(button_layout)
         self.setLayout(main_layout)
 
-        # state machine
-        self._engine = QTimer(self)      # ticks every 100 ms
-        self._engine.setInterval(100)
-        self._engine.timeout.connect(self._tick)
+        # the route runs in a PickingExecutor; its events are handled on the GUI thread
+        self._executor_event.connect(self._on_executor_event)
+        self._executor = None
+        self._estimate_ready.connect(self._on_estimate_ready)
+        self._estimate_request = 0       # bumped per preview; stale results are dropped
 
         self._active = False
         self._paused = False
-        self._idx = -1                   # current ROI index
-        self._awaiting_motion = False    # True while waiting for queued move to fully complete
-        self._points = []                # cached roi_points
+        self._idx = -1                   # last finished ROI index
+        self._points = []                # cached roi_points (pixels, route order)
+        self._targets = []               # the same points in gantry mm
         self._reconnect_required = False
         self._resume_after_stop_available = False
+        self._plan = None                # MotionEstimator result for the current run
+        self._run_started = None         # time.monotonic() at start_picking()
+        self._route_cache = None         # (key, ordered pixels, ordered targets)
+        self._journal = None             # JobJournal of the current run
 
         # wire
         self.start_btn.clicked.connect(self.start_picking)
@@ -109,6 +126,8 @@ class StepPickingWidget(QWidget):
     def showEvent(self, event):
         super().showEvent(event)
         self._refresh_view()
+        if not self._active:
+            self._update_estimate()
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -122,12 +141,14 @@ class StepPickingWidget(QWidget):
     def _stop_engine(self):
         self._active = False
         self._paused = False
-        self._awaiting_motion = False
-        if self._engine.isActive():
-            self._engine.stop()
+        executor = self._executor
+        if executor is not None and executor.state in ("running", "pausing"):
+            executor.pause()  # targets already sent to the firmware finish, the rest are dropped
 
     def _abort_pending_picking_motion(self, log_message: str = ""):
         self._stop_engine()
+        self._executor = None
+        self._close_journal()
         removed = 0
         try:
             if self.g_control:
@@ -187,37 +208,140 @@ class StepPickingWidget(QWidget):
         draw_picking_progress(im, self._points, current_idx=current)
         self._show(im)
 
-    def _distance_sq(a, b):
-        dx = float(a[0]) - float(b[0])
-        dy = float(a[1]) - float(b[1])
-        return dx * dx + dy * dy
+    def _gantry_xy(self):
+        if not self.g_control:
+            return None
+        pos = self.g_control.get_position_snapshot()
+        return (pos["X"], pos["Y"]) if "X" in pos and "Y" in pos else None
 
-    def _order_points_nearest_neighbor(self, points):
+    def _plan_route(self, points):
+        """ROI pixels -> gantry mm (pixel calibration), then the fastest visiting order from
+        the live gantry position. Returns (ordered pixel points, ordered gantry targets)."""
         if not points:
-            return []
-
-        remaining = [(int(x), int(y)) for (x, y) in points]
-        ordered = []
-        current = remaining[0]
-
-        while remaining:
-            nearest_idx = 0
-            nearest_d = self._distance_sq(remaining[0], current)
-            for i in range(1, len(remaining)):
-                d = self._distance_sq(remaining[i], current)
-                if d < nearest_d:
-                    nearest_d = d
-                    nearest_idx = i
-            nxt = remaining.pop(nearest_idx)
-            ordered.append(nxt)
-            current = nxt
-
-        return ordered
+            return [], []
+        pts = [(int(x), int(y)) for (x, y) in points]
+        transform = calibration_manager.load_transform()
+        image = self.context.image
+        image_size = (image.shape[1], image.shape[0]) if image is not None else None
+        start = self._gantry_xy()
+        key = (tuple(pts), start, transform, image_size)
+        if self._route_cache is not None and self._route_cache[0] == key:
+            return list(self._route_cache[1]), list(self._route_cache[2])
+        if transform is not None:
+            targets = [(round(float(x), 3), round(float(y), 3)) for x, y in transform(pts, image_size)]
+        else:
+            targets = [(float(x), float(y)) for x, y in pts]  # uncalibrated: pixels go out as mm
+        max_feedrate = self.g_control.get_motion_estimator().max_feedrate if self.g_control else None
+        order = optimize_route(targets, start=start, feedrate=self.ROI_MOVE_FEEDRATE, max_feedrate=max_feedrate)
+        ordered = [pts[i] for i in order]
+        ordered_targets = [targets[i] for i in order]
+        self._route_cache = (key, ordered, ordered_targets)
+        return list(ordered), list(ordered_targets)
+
+    # ---------- time estimate ----------
+    def _estimate(self, executor):
+        """The run's motion time (trapezoidal model) over the G-code the executor sends per
+        target: the XY move plus the picking sequence's Z moves and dwells."""
+        estimator = self.g_control.get_motion_estimator()
+        return estimator.estimate_points(executor.targets, executor.feedrate, start=self._gantry_xy(),
+                                         command_for=executor.command_for)
+
+    def _show_estimate(self, plan, count):
+        self.estimate_label.setText(
+            f"Estimated: {count} ROIs, {plan['distance']:.0f} mm travel, "
+            f"motion {format_duration(plan['total_time'])}"
+        )
+
+    def _update_estimate(self):
+        """Preview the run's motion time. Route planning can take the optimizer's full time
+        limit, so it runs on a worker thread; the result arrives via _estimate_ready."""
+        self._estimate_request += 1
+        roi_points = list(self.context.roi_points) if self.context.roi_points is not None else []
+        if not roi_points or not self.g_control:
+            self.estimate_label.setText("")
+            return
+        self.estimate_label.setText("Estimating...")
+        threading.Thread(target=self._estimate_worker, args=(self._estimate_request, roi_points),
+                         name="pick-estimate", daemon=True).start()
+
+    def _estimate_worker(self, request, roi_points):
+        try:
+            _points, targets = self._plan_route(roi_points)
+            sequence = config_manager.load_picking_settings()["sequence"] or list(DEFAULT_SEQUENCE)
+            executor = PickingExecutor(self.g_control, targets, sequence, feedrate=self.ROI_MOVE_FEEDRATE)
+            result = (len(targets), self._estimate(executor)) if targets else None
+        except Exception as e:
+            result = e
+        self._estimate_ready.emit(request, result)
+
+    def _on_estimate_ready(self, request, result):
+        if request != self._estimate_request or self._active:
+            return
+        if result is None:
+            self.estimate_label.setText("")
+        elif isinstance(result, Exception):
+            self.estimate_label.setText(f"Estimate unavailable: {result}")
+        else:
+            count, plan = result
+            self._show_estimate(plan, count)
+
+    def _log_run_summary(self):
+        if self._plan is None or self._run_started is None:
+            return
+        report = transport_overhead(time.monotonic() - self._run_started, self._plan)
+        self.log_box.append(
+            f"[TIME] Run took {format_duration(report['wall_time'])}, estimated motion "
+            f"{format_duration(report['motion_time'])}, overhead {report['overhead_share'] * 100:.0f}%"
+        )
+
+    # ---------- job journal ----------
+    def _new_executor(self, sequence, window):
+        executor = PickingExecutor(self.g_control, self._targets, sequence,
+                                   feedrate=self.ROI_MOVE_FEEDRATE, window=window)
+        executor.listener = lambda event, *args: self._executor_event.emit(executor, event, args)
+        self._executor = executor
+        return executor
+
+    def _close_journal(self, status=None):
+        """status=None leaves the job unfinished, i.e. resumable from the main window."""
+        if self._journal is not None:
+            try:
+                if status:
+                    self._journal.finish(status)
+                else:
+                    self._journal.close()
+            except OSError:
+                pass
+            self._journal = None
+
+    def resume_job(self, path):
+        """Load an unfinished run from its journal; Pause / Continue picks up after the
+        last confirmed ROI. Detection and route planning are not repeated."""
+        job = read_job(path)
+        header = job["header"]
+        self._targets = [tuple(t) for t in header["targets"]]
+        points = header.get("points") or []
+        self._points = [tuple(p) for p in points] if len(points) == len(self._targets) else []
+        if self._points:
+            self.context.roi_points = list(self._points)  # Start re-plans the same ROIs as a new job
+        self._route_cache = None
+        self._close_journal()
+        self._journal = JobJournal(path)
+        self._new_executor(header.get("sequence") or list(DEFAULT_SEQUENCE), header.get("window", 4))
+        self._idx = job["next_idx"] - 1
+        self._active = False
+        self._paused = False
+        self._resume_after_stop_available = True
+        self.log_box.append(
+            f"[JOB] Loaded {header.get('job_id')}: {job['next_idx']}/{len(self._targets)} ROIs done. "
+            f"Press Pause / Continue to resume."
+        )
+        self._refresh_view()
 
     # ---------- commands ----------
     def start_picking(self):
         roi_points = list(self.context.roi_points) if self.context.roi_points is not None else []
-        self._points = self._order_points_nearest_neighbor(roi_points)
+        self._points, self._targets = self._plan_route(roi_points)
         if not self._points:
             self.log_box.append("[ERROR] No ROI points.")
             return
@@ -242,17 +366,44 @@ class StepPickingWidget(QWidget):
                 return
             self.log_box.append("[INFO] Emergency latch cleared. Starting picking...")
 
-        # init FSM
+        if calibration_manager.load_transform() is None:
+            self.log_box.append("[WARN] No pixel calibration (calibration.yaml): ROI pixels are sent as mm.")
+        settings = config_manager.load_picking_settings()
+        sequence = settings["sequence"] or list(DEFAULT_SEQUENCE)
+        self._new_executor(sequence, settings["window"])
+
+        self._estimate_request += 1  # a preview still running is superseded
+        try:
+            self._plan = self._estimate(self._executor)
+        except Exception as e:
+            self._plan = None
+            self.estimate_label.setText(f"Estimate unavailable: {e}")
+        else:
+            self._show_estimate(self._plan, len(self._targets))
+            self.log_box.append(f"[PLAN] {self.estimate_label.text()}")
+        self._run_started = time.monotonic()
+        self._close_journal()
+        try:
+            self._journal = JobJournal.create(self._targets, self._points, meta={
+                "image_path": self.context.image_path,
+                "feedrate": self.ROI_MOVE_FEEDRATE,
+                "sequence": sequence,
+                "window": settings["window"],
+            })
+            self.log_box.append(f"[JOB] Journal: {self._journal.path}")
+        except OSError as e:
+            self._journal = None
+            self.log_box.append(f"[WARN] Job journal unavailable: {e}")
+
         self._active = True
         self._paused = False
         self._idx = -1
-        self._awaiting_motion = False
         self._resume_after_stop_available = False
-        self._draw_progress(current=None)
-        self._engine.start()  # start ticking
+        self._draw_progress(current=0)
+        self._executor.start()
 
     def _resume_after_emergency_stop(self):
-        if not self._resume_after_stop_available or not self._points:
+        if not self._resume_after_stop_available or not self._targets or self._executor is None:
             self.log_box.append("[WARN] No paused picking state to continue.")
             return
         if not self.g_control:
@@ -268,9 +419,16 @@ class StepPickingWidget(QWidget):
 
         self._active = True
         self._paused = False
-        self._awaiting_motion = False
-        self._engine.start()
-        self.log_box.append("[INFO] Continued from last ROI position.")
+        self._resume_after_stop_available = False
+        executor = self._executor
+        from_idx = executor.done_idx if executor.state != "idle" else self._idx + 1
+        self.log_box.append(f"[INFO] Continued from ROI {from_idx + 1}.")
+        if self._journal is not None:
+            self._journal.record_event("resume", idx=from_idx)
+        if executor.state == "idle":
+            executor.start(from_idx)  # job loaded from its journal
+        else:
+            executor.resume()
 
     def toggle_pause(self):
         if not self._active:
@@ -279,9 +437,17 @@ class StepPickingWidget(QWidget):
             return
         self._paused = not self._paused
         self.log_box.append("Pause" if self._paused else "Resume")
+        if self._paused:
+            self._executor.pause()
+        else:
+            self._executor.resume()
 
     def stop_picking(self):
         self._resume_after_stop_available = bool(self._active or self._idx >= 0)
+        if self._executor is not None:
+            self._executor.stop()
+        if self._journal is not None:
+            self._journal.record_event("stop")
         self._trigger_emergency_stop_like_manual_control()
         self._stop_engine()
         self.log_box.append("[INFO] Pipetting stopped.")
@@ -297,9 +463,7 @@ class StepPickingWidget(QWidget):
                 for t in getattr(control_widget, "timers", {}).values():
                     t.stop()
             if self.g_control and self.g_control.ser and self.g_control.ser.is_open:
-                self.g_control.ser.write(b"M410\n")
-                self.g_control.ser.write(b"M18\n")
-                self.g_control.ser.flush()
+                self.g_control.quick_stop(disable_steppers=True)
                 self.log_box.append("[EMERGENCY STOP] M410 + M18 sent – motion stopped, connection kept.")
         except Exception as e:
             self.log_box.append(f"[ERROR] Emergency stop failed: {e}")
@@ -309,51 +473,29 @@ class StepPickingWidget(QWidget):
         self._abort_pending_picking_motion("[INFO] Picking finished by user; pending motion commands cleared.")
         QTimer.singleShot(0, self.finished.emit)
 
-    # ---------- FSM tick ----------
-    def _tick(self):
-        # stoppe  d?
-        if not self._active:
-            self._engine.stop()
-            return
-        # paused?
-        if self._paused:
-            return
-
-        # wait until last move is really completed (queue drained + worker idle)
-        if self._awaiting_motion:
-            if self.g_control and self.g_control.has_pending_motion_commands():
-                return
-            self._awaiting_motion = False
-
-        # move to next point
-        self._idx += 1
-        if self._idx >= len(self._points):
-            if self.g_control and self.g_control.has_pending_motion_commands():
-                self._idx = len(self._points) - 1
-                return
-
+    # ---------- executor events ----------
+    def _on_executor_event(self, executor, event, args):
+        if executor is not self._executor:
+            return  # stale event from an aborted run
+        if event == "progress":
+            self._idx = args[0]
+            if self._journal is not None:
+                self._journal.record_pick(self._idx)
+            x, y = self._targets[self._idx]
+            self.log_box.append(f"[STEP] {self._idx + 1}. ROI -> X:{x:.2f}, Y:{y:.2f}")
+            if self._idx + 1 < len(self._points):
+                self._draw_progress(current=self._idx + 1)
+        elif event == "paused":
+            self.log_box.append(f"[INFO] Paused after ROI {args[0]}.")
+        elif event == "finished":
             self._stop_engine()
+            self._close_journal("done")
             self.log_box.append("[DONE] All ROI positions visited.")
-            return
-
-        x, y = self._points[self._idx]
-        self.log_box.append(f"[STEP] {self._idx + 1}. ROI -> X:{x}, Y:{y}")
-        try:
-            if not self.g_control:
-                raise RuntimeError("G-code control is not available.")
-            command = f"G0 X{int(x)} Y{int(y)} F{self.ROI_MOVE_FEEDRATE}\n"
-            self.g_control.new_command(command)
-            self.g_control.log(f"[GCODE] {command.strip()}")
-        except Exception as e:
-            self.log_box.append(f"[ERROR] Command send error: {e}")
+            self._log_run_summary()
+        elif event == "failed":
+            self.log_box.append(f"[ERROR] Move did not complete: {args[0]}")
             self._stop_engine()
-            return
-
-        # show progress with current highlighted
-        self._draw_progress(current=self._idx)
-
-        # wait for actual motion completion before moving to next ROI
-        self._awaiting_motion = True
+            self._resume_after_stop_available = True
 
     # ---------- Qt cleanup ----------
     def closeEvent(self, event):
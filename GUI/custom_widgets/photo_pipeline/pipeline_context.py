@@ -21,6 +21,7 @@ class PipelineContext:
         self.detector = BacteriaDetector()
         self.image_path: Optional[str] = None
         self.output_dir: Optional[str] = None
+        self._preloaded: Optional[Tuple[Optional[str], np.ndarray]] = None
         self._detector_params_path = os.path.join(config_manager.CONFIG_DIR, "detector_params.yaml")
         self._detector_params_mtime: Optional[float] = None
 
@@ -89,6 +90,21 @@ class PipelineContext:
         else:
             self.output_dir = os.path.join(os.getcwd(), "debug")
 
+    def preload_image(self, image: np.ndarray, path: Optional[str] = None) -> None:
+        """In-memory frame for path, e.g. a snapshot whose file is still being written."""
+        self._preloaded = (path, image)
+
+    def load_image(self, path: str) -> Optional[np.ndarray]:
+        """Image for path: the preloaded frame if it belongs to path, else read from disk."""
+        if self._preloaded is not None and self._preloaded[0] == path:
+            return self._preloaded[1]
+        if path.lower().endswith(".npy"):
+            try:
+                return np.load(path, allow_pickle=False)
+            except Exception:
+                return None
+        return cv2.imread(path)
+
     def on_analysis_done(self, results: Any) -> None:
         auto_pts: List[Tuple[int, int]] = []
         if isinstance(results, dict) and "centers" in results:
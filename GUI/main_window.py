@@ -1,6 +1,9 @@
-﻿import sys
+﻿import os
+import sys
+import cv2
+import time
 from PyQt5.QtWidgets import QMainWindow, QWidget, QAction, QVBoxLayout, QSplitter, QGroupBox
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 import threading
 
 from GUI.custom_widgets.mainwindow_components.camera_widget import CameraWidget  # Keep import path this way for reliable module resolution.
@@ -11,6 +14,11 @@ from File_managers.config_manager import ensure_settings_yaml_exists
 from Pozitioner_and_Communicater.CommandSender import CommandSender
 from GUI.custom_widgets.openable_widgets.motion_calibration_window import MotionCalibrationWindow
 from GUI.custom_widgets.openable_widgets.pixel_calibration_window import PixelCalibrationWindow
+from GUI.custom_widgets.photo_pipeline.manual_steps.step_picking_widget import StepPickingWidget
+from GUI.custom_widgets.photo_pipeline.pipeline_context import PipelineContext
+from File_managers import job_journal, calibration_manager, config_manager, dish_profile_manager, image_writer
+from Pozitioner_and_Communicater.batch_scheduler import BatchScheduler, ColonyDetector, Plate
+from Pozitioner_and_Communicater.picking_executor import DEFAULT_SEQUENCE
 
 
 class _StderrToLog:
@@ -37,8 +45,12 @@ class _StderrToLog:
 
 
 class MainWindow(QMainWindow):
+    _batch_event = pyqtSignal(str, object)  # (event, args) from the batch scheduler thread
+
     def __init__(self, g_control):
         super().__init__()
+        self.batch_scheduler = None
+        self._batch_event.connect(self._on_batch_event)
         ensure_settings_yaml_exists()  # Ensure settings file is present
         self.g_control = g_control
         self._orig_stderr = sys.stderr
@@ -131,6 +143,25 @@ class MainWindow(QMainWindow):
         open_motion_cal_action.triggered.connect(self.open_motion_calibration_window)
         open_menu.addAction(open_motion_cal_action)
 
+        resume_job_action = QAction("Resume picking job", self)
+        resume_job_action.triggered.connect(self.open_resume_picking_job)
+        open_menu.addAction(resume_job_action)
+
+        # Batch menu: unattended capture -> detect -> pick over the dish profiles' plates
+        batch_menu = menubar.addMenu("Batch")
+
+        run_batch_action = QAction("Run plate batch", self)
+        run_batch_action.triggered.connect(self.run_plate_batch)
+        batch_menu.addAction(run_batch_action)
+
+        pause_batch_action = QAction("Pause / Continue plate batch", self)
+        pause_batch_action.triggered.connect(self.toggle_plate_batch_pause)
+        batch_menu.addAction(pause_batch_action)
+
+        stop_batch_action = QAction("Stop plate batch", self)
+        stop_batch_action.triggered.connect(self.stop_plate_batch)
+        batch_menu.addAction(stop_batch_action)
+
 
 
     def _init_widgets(self):
@@ -289,16 +320,18 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         self.log_widget.append_log("[INFO] Main window is closing")
 
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.stop()
+
         # Graceful shutdown: stop motion + disable steppers, but do NOT send M112.
         # M112 kills Creality/STM32 firmware and requires a power cycle to recover.
         if self.g_control:
             try:
                 if self.g_control.ser and self.g_control.ser.is_open:
-                    self.g_control.ser.write(b"M410\n")   # quickstop (abort motion)
-                    self.g_control.ser.write(b"M107\n")   # fan/LED off
-                    self.g_control.ser.write(b"M18\n")    # steppers off
-                    self.g_control.ser.flush()
-                    self.log_widget.append_log("[INFO] Sent M410+M107+M18 for graceful shutdown.")
+                    self.g_control.quick_stop(disable_steppers=False)  # M410 on the fast lane, queued moves dropped
+                    self.g_control.clear_all_pending_commands_full()
+                    # stop_threads() below sends M107 (fan/LED off) + M18 (steppers off)
+                    self.log_widget.append_log("[INFO] Sent M410 for graceful shutdown.")
             except Exception as e:
                 self.log_widget.append_log(f"[WARN] Failed to send shutdown commands: {e}")
 
@@ -307,6 +340,7 @@ class MainWindow(QMainWindow):
                 self.g_control.stop_threads()
             except Exception as e:
                 self.log_widget.append_log(f"[ERROR] Failed to stop threads: {e}")
+        image_writer.close_shared_pool(wait=True)   # finish the snapshots still being written
         self._restore_stderr_logging()
         event.accept()
 
@@ -344,4 +378,101 @@ class MainWindow(QMainWindow):
         self.pixel_calib_win = PixelCalibrationWindow(self.g_control, self.camera_widget, self.log_widget)
         self.pixel_calib_win.show()
         self._config_refs = getattr(self, "_config_refs", [])
-        self._config_refs.append(self.pixel_calib_win)
\ No newline at end of file
+        self._config_refs.append(self.pixel_calib_win)
+
+    def open_resume_picking_job(self):
+        """Reopen the newest unfinished picking run from its journal (survives app restarts)."""
+        jobs = job_journal.list_unfinished()
+        if not jobs:
+            self.log_widget.append_log("[JOB] No unfinished picking job.")
+            return
+        job = jobs[0]
+        context = PipelineContext()
+        image_path = job["header"].get("image_path")
+        if image_path and os.path.exists(image_path):
+            context.set_image(cv2.imread(image_path), image_path)
+        self.resume_job_win = StepPickingWidget(context, image_path=image_path,
+                                                log_widget=self.log_widget, main_window=self)
+        self.resume_job_win.finished.connect(self.resume_job_win.close)
+        self.resume_job_win.resume_job(job["path"])
+        self.resume_job_win.setWindowTitle("Resume picking job")
+        self.resume_job_win.show()
+        self._config_refs = getattr(self, "_config_refs", [])
+        self._config_refs.append(self.resume_job_win)
+
+    # ---------- plate batch ----------
+    def run_plate_batch(self):
+        if self.batch_scheduler is not None and self.batch_scheduler.state in ("running", "paused"):
+            self.log_widget.append_log("[BATCH] A batch is already running.")
+            return
+        if not self.g_control.connected:
+            self.log_widget.append_log("[BATCH] Not connected to machine.")
+            return
+        if self.camera_widget.frame_ring.latest_seq is None:
+            self.log_widget.append_log("[BATCH] Start the camera first.")
+            return
+        profiles = dish_profile_manager.load_batch_plates()
+        if not profiles:
+            self.log_widget.append_log("[BATCH] No dish profile has a plate_position.")
+            return
+        plates = [Plate(p["dish_id"], p["plate_position"], p["offset"], p["roi_points"]) for p in profiles]
+        transform = calibration_manager.load_transform()
+        if transform is None:
+            self.log_widget.append_log("[WARN] No pixel calibration (calibration.yaml): ROI pixels are sent as mm.")
+        context = PipelineContext()  # detector parameters from detector_params.yaml
+        settings = config_manager.load_picking_settings()
+        sequence = settings["sequence"] or list(DEFAULT_SEQUENCE)
+        feedrate = StepPickingWidget.ROI_MOVE_FEEDRATE
+
+        def journal_for(plate):
+            return job_journal.JobJournal.create(plate.targets, plate.points, meta={
+                "plate_id": plate.plate_id, "feedrate": feedrate,
+                "sequence": sequence, "window": settings["window"],
+            })
+
+        self.batch_scheduler = BatchScheduler(
+            self.g_control, plates, self._grab_fresh_frame,
+            detect=ColonyDetector(context.get_petri_params(), detector=context.detector),
+            transform=transform, feedrate=feedrate, sequence=sequence, window=settings["window"],
+            listener=lambda event, *args: self._batch_event.emit(event, args),
+            journal_factory=journal_for,
+        )
+        self.log_widget.append_log(f"[BATCH] Starting {len(plates)} plates.")
+        self.batch_scheduler.start()
+
+    def toggle_plate_batch_pause(self):
+        batch = self.batch_scheduler
+        if batch is None:
+            return
+        if batch.state == "running":
+            batch.pause()
+            self.log_widget.append_log("[BATCH] Pause")
+        elif batch.state == "paused":
+            batch.resume()
+            self.log_widget.append_log("[BATCH] Resume")
+
+    def stop_plate_batch(self):
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.stop()
+            self.g_control.quick_stop(disable_steppers=False)
+            self.log_widget.append_log("[BATCH] Stopping...")
+
+    def _grab_fresh_frame(self, timeout: float = 2.0):
+        """Batch thread: the first camera frame delivered after the call."""
+        return self.camera_widget.frame_ring.copy_latest(after_time=time.monotonic(), timeout=timeout)
+
+    def _on_batch_event(self, event, args):
+        log = self.log_widget.append_log
+        if event == "captured":
+            log(f"[BATCH] Plate {args[0].plate_id}: captured.")
+        elif event == "detected":
+            log(f"[BATCH] Plate {args[0].plate_id}: {len(args[0].targets)} colonies.")
+        elif event == "plate_done":
+            log(f"[BATCH] Plate {args[0].plate_id}: {args[0].picked} picked.")
+        elif event == "finished":
+            log(f"[BATCH] Done: {len(args[0])} plates, {sum(p.picked for p in args[0])} colonies.")
+        elif event == "stopped":
+            log(f"[BATCH] Stopped: {sum(p.picked for p in args[0])} colonies picked.")
+        elif event == "failed":
+            plate = f"plate {args[0].plate_id}: " if args[0] is not None else ""
+            log(f"[BATCH] [ERROR] {plate}{args[1]}")
@@ -0,0 +1,151 @@
+# Image_processing/frame_ring.py
+#
+# Hand-off of camera frames between the capture thread and its readers
+# (display, snapshots, batch captures). The ring owns N preallocated frame
+# buffers; the camera decodes straight into a free one (cv2 VideoCapture.retrieve
+# with an output array), so a running camera allocates nothing per frame.
+#
+#   writer:  cap.grab(); t = time.monotonic(); slot = ring.acquire()
+#            ok, img = cap.retrieve(ring.buffer(slot)); ring.publish(slot, img, t)
+#   reader:  lease = ring.lease()            # latest frame, pinned until released
+#            with lease: show(lease.frame)
+#            frame = ring.copy_latest()      # own copy, for anything kept longer
+#
+# Readers always get the newest frame; frames nobody looked at are simply
+# overwritten, so a slow reader drops frames instead of queueing them. A leased
+# slot is never written, and the writer skips a frame when every slot is busy.
+
+import threading
+import time
+
+import numpy as np
+
+
+class FrameLease:
+    """Read access to one published frame; the slot is not reused until release()."""
+
+    __slots__ = ("seq", "timestamp", "hw_timestamp", "frame", "_ring", "_slot")
+
+    def __init__(self, ring, slot, seq, timestamp, hw_timestamp, frame):
+        self._ring = ring
+        self._slot = slot
+        self.seq = seq
+        self.timestamp = timestamp          # time.monotonic() when the frame was grabbed
+        self.hw_timestamp = hw_timestamp    # driver timestamp (ms) or None
+        self.frame = frame
+
+    def release(self):
+        if self._ring is not None:
+            self._ring._release(self._slot)
+            self._ring = None
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FrameRing:
+    def __init__(self, slots: int = 4):
+        n = max(3, int(slots))      # one being written, the latest, at least one leased
+        self._buffers = [None] * n
+        self._seq = [0] * n
+        self._stamp = [0.0] * n
+        self._hw_stamp = [None] * n
+        self._leases = [0] * n
+        self._writing = [False] * n
+        self._generation = [0] * n
+        self._gen = 0
+        self._next_seq = 0
+        self._latest = None
+        self._cond = threading.Condition()
+        self.dropped = 0            # frames skipped because every slot was busy
+
+    # ---------- writer ----------
+    def acquire(self):
+        """Free slot for the next frame (oldest first), or None if all are busy."""
+        with self._cond:
+            best = None
+            for i in range(len(self._buffers)):
+                if i == self._latest or self._leases[i] or self._writing[i]:
+                    continue
+                if best is None or self._seq[i] < self._seq[best]:
+                    best = i
+            if best is None:
+                self.dropped += 1
+                return None
+            self._writing[best] = True
+            self._generation[best] = self._gen
+            return best
+
+    def buffer(self, slot):
+        """Preallocated array of the slot (None before its first frame)."""
+        return self._buffers[slot]
+
+    def publish(self, slot, frame, timestamp: float = None, hw_timestamp: float = None) -> int:
+        """Make the frame read into slot the latest one. If the camera did not
+        reuse the slot's buffer (first frame, resolution change) frame becomes the
+        slot's buffer. timestamp is the time.monotonic() the frame was grabbed at
+        (default: now). Returns the sequence number, 0 if the ring was cleared meanwhile."""
+        with self._cond:
+            self._writing[slot] = False
+            if frame is None or self._generation[slot] != self._gen:
+                return 0
+            self._buffers[slot] = frame
+            self._next_seq += 1
+            self._seq[slot] = self._next_seq
+            self._stamp[slot] = time.monotonic() if timestamp is None else timestamp
+            self._hw_stamp[slot] = hw_timestamp
+            self._latest = slot
+            self._cond.notify_all()
+            return self._next_seq
+
+    def discard(self, slot):
+        """Give back an acquired slot without publishing (read failed)."""
+        with self._cond:
+            self._writing[slot] = False
+
+    def clear(self):
+        """Forget the latest frame (camera stopped or switched). Frames from a writer
+        that acquired its slot before the clear are not published."""
+        with self._cond:
+            self._latest = None
+            self._gen += 1
+
+    # ---------- readers ----------
+    @property
+    def latest_seq(self):
+        """Sequence number of the latest frame, None when there is none."""
+        with self._cond:
+            return None if self._latest is None else self._seq[self._latest]
+
+    def lease(self, after_seq: int = None, timeout: float = 0.0, after_time: float = None):
+        """Lease the latest frame, waiting up to timeout for one newer than after_seq
+        and grabbed at or after after_time (time.monotonic()). None if there is no such frame."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while True:
+                slot = self._latest
+                if (slot is not None and (after_seq is None or self._seq[slot] > after_seq)
+                        and (after_time is None or self._stamp[slot] >= after_time)):
+                    self._leases[slot] += 1
+                    return FrameLease(self, slot, self._seq[slot], self._stamp[slot],
+                                      self._hw_stamp[slot], self._buffers[slot])
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def copy_latest(self, after_seq: int = None, timeout: float = 0.0, after_time: float = None):
+        """Own copy of the latest frame (see lease), or None."""
+        lease = self.lease(after_seq, timeout, after_time)
+        if lease is None:
+            return None
+        with lease:
+            return np.array(lease.frame, copy=True)
+
+    def _release(self, slot):
+        with self._cond:
+            self._leases[slot] -= 1
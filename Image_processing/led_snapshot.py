@@ -0,0 +1,101 @@
+# Image_processing/led_snapshot.py
+#
+# LED-lit snapshot as one transaction, synchronised on the firmware instead of
+# a fixed number of frames:
+#
+#   M106 S<pwm>  ->  wait for its "ok"  ->  settle_time  ->  frames grabbed after
+#   that are compared by mean brightness until two in a row agree within
+#   tolerance  ->  copy that frame  ->  M106 S0
+#
+# A fast camera is done a couple of frames after the LED is up; a slow one (or
+# an LED driver with a soft start) simply takes more frames.
+#
+# M106 is queued like any other command: while the gantry still has moves
+# queued, its "ok" (and so the snapshot) only comes after them. Runs on its own
+# thread: run() blocks for up to timeout seconds waiting for that "ok", and up to
+# timeout seconds more for a stable frame.
+
+import time
+
+_SAMPLE_STEP = 8    # brightness from every 8th pixel in both directions
+
+
+def frame_brightness(frame) -> float:
+    """Mean intensity of a subsampled view (no copy of the frame)."""
+    return float(frame[::_SAMPLE_STEP, ::_SAMPLE_STEP].mean())
+
+
+class LedSnapshot:
+    """ring: the camera's FrameRing. g_control: GCodeControl, or None to capture
+    without the LED (pwm 0 does the same). tolerance is relative (0.02 = 2 %).
+    timeout bounds the wait for the M106 "ok" and, separately, the wait for a
+    stable frame after it."""
+
+    def __init__(self, ring, g_control=None, pwm: int = 255, settle_time: float = 0.08,
+                 tolerance: float = 0.02, max_frames: int = 15, timeout: float = 3.0):
+        self.ring = ring
+        self.g_control = g_control
+        self.pwm = int(pwm)
+        self.settle_time = max(0.0, float(settle_time))
+        self.tolerance = max(0.0, float(tolerance))
+        self.max_frames = max(1, int(max_frames))
+        self.timeout = float(timeout)
+
+    def run(self) -> dict:
+        """{"frame", "latency", "ack_latency", "frames", "brightness", "stable", "error"};
+        frame is an own copy, None on failure. Latencies are in seconds from the call."""
+        started = time.monotonic()
+        result = {"frame": None, "latency": None, "ack_latency": None, "frames": 0,
+                  "brightness": None, "stable": False, "error": None}
+        use_led = self.g_control is not None and self.pwm > 0
+        try:
+            if not use_led:
+                lease = self.ring.lease(after_time=started, timeout=self.timeout)
+                if lease is None:
+                    result["error"] = "no camera frame"
+                else:
+                    with lease:
+                        result["frame"] = lease.frame.copy()
+                        result["brightness"] = frame_brightness(lease.frame)
+                    result["frames"] = 1
+                    result["stable"] = True
+                return result
+
+            handle = self.g_control.submit_led_pwm(self.pwm)
+            try:
+                handle.acked.result(self.timeout)
+                acked_at = time.monotonic()
+                result["ack_latency"] = acked_at - started
+            except Exception as e:
+                # No proof the LED is on: fall back to the settle time from now.
+                acked_at = time.monotonic()
+                result["error"] = f"LED command not acknowledged ({e})"
+            self._wait_stable(acked_at + self.settle_time, acked_at + self.timeout, result)
+            return result
+        finally:
+            if use_led:
+                self.g_control.submit_led_pwm(0)
+            if result["frame"] is not None:
+                result["latency"] = time.monotonic() - started
+
+    def _wait_stable(self, not_before: float, deadline: float, result: dict):
+        prev = None
+        last_seq = None
+        while True:
+            lease = self.ring.lease(after_seq=last_seq, timeout=deadline - time.monotonic(),
+                                    after_time=not_before)
+            if lease is None:
+                if result["error"] is None:
+                    result["error"] = "no stable frame before the timeout"
+                return
+            with lease:
+                last_seq = lease.seq
+                mean = frame_brightness(lease.frame)
+                result["frames"] += 1
+                stable = prev is not None and abs(mean - prev) <= self.tolerance * max(prev, 1.0)
+                if stable or result["frames"] >= self.max_frames:
+                    result["frame"] = lease.frame.copy()
+                    result["brightness"] = mean
+                    result["stable"] = stable
+                    return
+            prev = mean
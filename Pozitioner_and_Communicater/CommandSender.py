@@ -1,28 +1,64 @@
 # This class is needed to prevent GUI freezing.
 
 from collections import deque
-from threading import Lock
+from threading import Condition
 from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
 
+from Pozitioner_and_Communicater.gcode_parser import parse_command
+
+
+def _coalesce_jog(prev, cmd):
+    """Two back-to-back jogs on the same axis and feedrate -> one jog over the summed distance."""
+    if not (prev.is_jog and cmd.is_jog) or prev.axes != cmd.axes or len(cmd.axes) != 1:
+        return None
+    if prev.feedrate != cmd.feedrate:
+        return None
+    axis = next(iter(cmd.axes))
+    distance = prev.lines[1].get(axis, 0.0) + cmd.lines[1].get(axis, 0.0)
+    step = f"{distance:.4f}".rstrip("0").rstrip(".")
+    feed = f" F{cmd.feedrate:g}" if cmd.feedrate is not None else ""
+    return parse_command(f"G91\nG1 {axis}{step}{feed}")
+
+
+def _coalesce_last_wins(prev, cmd):
+    """State-setting commands (fan/LED PWM): only the newest value matters."""
+    return cmd if prev.code == cmd.code and len(prev.lines) == len(cmd.lines) == 1 else None
+
+
+def _coalesce_duplicate(prev, cmd):
+    """Status queries: one M114 answers two identical requests."""
+    return prev if prev.text == cmd.text else None
+
+
 class CommandSender(QThread):
     sendCommand = pyqtSignal(str)  # Callable from outside; accepts commands
 
+    # Command class -> policy(prev, cmd) returning the merged command or None.
+    # Only adjacent commands of one batch are merged, so ordering is preserved.
+    COALESCE_POLICIES = {
+        "jog": _coalesce_jog,
+        "pwm": _coalesce_last_wins,
+        "query": _coalesce_duplicate,
+    }
+
     def __init__(self, g_control):
         super().__init__()
         self.g_control = g_control
         self.queue = deque()
-        self._queue_lock = Lock()
+        self._cond = Condition()
         self.running = True
+        self.coalesce = True
         self.sendCommand.connect(self.handle_command)
 
     @pyqtSlot(str)
     def handle_command(self, command):
-        with self._queue_lock:
+        with self._cond:
             self.queue.append(command)
+            self._cond.notify()
 
     def clear_pending_commands(self, predicate=None):
         """Remove queued commands. If predicate is None, clear all pending commands."""
-        with self._queue_lock:
+        with self._cond:
             if predicate is None:
                 removed = len(self.queue)
                 self.queue.clear()
@@ -39,18 +75,49 @@ class CommandSender(QThread):
             self.queue = kept
             return removed
 
+    @staticmethod
+    def command_class(cmd) -> str:
+        if cmd.is_jog:
+            return "jog"
+        if len(cmd.lines) == 1 and cmd.code in ("M106", "M107"):
+            return "pwm"
+        if len(cmd.lines) == 1 and cmd.code in ("M105", "M114", "M119"):
+            return "query"
+        return ""
+
+    def _coalesce_batch(self, batch):
+        out = []
+        prev_class = ""
+        for raw in batch:
+            cmd = parse_command(raw)
+            cls = self.command_class(cmd)
+            policy = self.COALESCE_POLICIES.get(cls) if self.coalesce else None
+            if policy is not None and out and prev_class == cls:
+                merged = policy(out[-1], cmd)
+                if merged is not None:
+                    out[-1] = merged
+                    continue
+            out.append(cmd)
+            prev_class = cls
+        return out
+
     def run(self):
-        while self.running:
-            command = None
-            with self._queue_lock:
-                if self.queue:
-                    command = self.queue.popleft()
-            if command is not None:
-                self.g_control.new_command(command) # priority?
-            self.msleep(15)  # supports smoother high-speed jog without extreme micro-chunking
+        while True:
+            with self._cond:
+                # No polling: sleep until handle_command() or stop() notifies.
+                while self.running and not self.queue:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                batch = self.queue
+                self.queue = deque()
+            for cmd in self._coalesce_batch(batch):
+                self.g_control.new_command(cmd)
 
         print("CommandSender close")
 
     def stop(self):
-        self.running = False
+        with self._cond:
+            self.running = False
+            self._cond.notify()
         self.wait()
@@ -1,12 +1,23 @@
 ﻿import threading
 import time
-import queue
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import serial  # pyserial
 import serial.tools.list_ports
 from File_managers import marlin_config_manager
 from File_managers import config_manager
+from File_managers import firmware_cache_manager
 from Pozitioner_and_Communicater.gcode_presets import MARLIN_COMMAND_MAP
+from Pozitioner_and_Communicater.serial_reactor import SerialReactor, SerialTransaction
+from Pozitioner_and_Communicater.command_handle import CommandHandle
+from Pozitioner_and_Communicater.gcode_parser import GCodeCommand, parse_command, parse_line
+from Pozitioner_and_Communicater.command_scheduler import (
+    CommandScheduler, EMERGENCY_CODES,
+    PRIORITY_MOTION, PRIORITY_TELEMETRY,
+)
+from Pozitioner_and_Communicater.session_recorder import SessionRecorder, default_session_path
+from Pozitioner_and_Communicater.motion_estimator import MotionEstimator
 
 
 # Marlin doesnâ€™t auto-calibrate steps â†’ you set/adjust them with M92, test a move, measure, then refine.
@@ -15,6 +26,29 @@ from Pozitioner_and_Communicater.gcode_presets import MARLIN_COMMAND_MAP
 # or X_MIN/MAX_POS, Y_MIN/MAX_POS). You can disable soft endstops during calibration with M211 S0, then re-enable with M211 S1.
 # Using G0/G1; positions are mm, feedrate F is mm/min.
 
+# M114 format: 'X:212.00 Y:211.87 Z:10.00 E:0.00 Count X:16960 Y:16950 Z:4000'
+_POS_RE = re.compile(r'([XYZ]):([-\d.]+)')
+# Bare acknowledgement, including ADVANCED_OK's "ok N12 P15 B3"
+_PLAIN_OK_RE = re.compile(r'^ok(\s+[NPB]\d+)*$')
+
+# Status queries: served after everything else that is queued
+_TELEMETRY_CODES = frozenset(("M105", "M114", "M119", "M115"))
+# Lanes whose queued items count as pending motion (CONTROL carries mixed-axis moves and G28)
+_MOTION_LANES = ("CONTROL", "X_motor", "Y_motor", "Z_motor")
+
+
+def parse_position(line: str) -> dict:
+    """Axis positions (mm) from an M114 / auto-report line; empty dict if none."""
+    # Only parse the mm part before 'Count' to avoid capturing step values.
+    mm_part = line.split("Count")[0]
+    parsed = {}
+    for match in _POS_RE.finditer(mm_part):
+        try:
+            parsed[match.group(1)] = float(match.group(2))
+        except ValueError:
+            pass
+    return parsed
+
 
 class GCodeControl:
     def __init__(self, lock):
@@ -28,33 +62,52 @@ class GCodeControl:
         self.command_sender = None  # set externally in MainWindow
 
 
-        # Command queues for each thread
-        self.x_motor_queue = queue.Queue()
-        self.y_motor_queue = queue.Queue()
-        self.z_motor_queue = queue.Queue()
-        self.aux_queue = queue.Queue()
-        self.control_queue = queue.Queue()
-        self._worker_busy = {
-            "X_motor": False,
-            "Y_motor": False,
-            "Z_motor": False,
-            "AUX": False,
-            "CONTROL": False,
-        }
-        self._worker_busy_lock = threading.Lock()
+        # Command lanes, taken by priority class by the serial reactor
+        # (emergency > control/motion/aux > telemetry; emergency uses the reactor's fast lane).
+        # Control, motion and aux share one FIFO so modal commands keep their place among the moves.
+        self.scheduler = CommandScheduler([
+            ("CONTROL", PRIORITY_MOTION),
+            ("X_motor", PRIORITY_MOTION), ("Y_motor", PRIORITY_MOTION), ("Z_motor", PRIORITY_MOTION),
+            ("AUX", PRIORITY_MOTION),
+            ("TELEMETRY", PRIORITY_TELEMETRY),
+        ])
+        self._reactor = None  # SerialReactor: the only thread touching self.ser once connected
+        self._session_recorder = None  # SessionRecorder while a serial capture is running
 
         self.running = True
         self._emergency_latched = False
         self._emergency_lock = threading.Lock()
         self._unsupported_gcodes = set()
+        # M115 report of the connected board and its cache key (firmware_cache.yaml)
+        self.firmware_info: dict = {}
+        self.firmware_caps: dict = {}
+        self._firmware_fingerprint = None
+        self.auto_transport: bool = False
 
         # Machine limits – populated after connecting
         self.machine_limits: dict = {}
+        self.motion_estimator = None  # MotionEstimator from marlin_settings.yaml, see estimate_motion()
         self._current_pos: dict = {"X": 0.0, "Y": 0.0, "Z": 0.0}
+        # Last position reported by the firmware (M114 reply or M154 auto-report)
+        self._pos_cond = threading.Condition()
+        self._reported_pos: dict = {}
+        self._reported_pos_time: float = 0.0  # time.monotonic() of the report
+        self._reported_pos_seq: int = 0
+        self._position_listeners = []
+        self.position_autoreport_interval: int = 0  # seconds; 0 while M154 is off
         self._relative_mode: bool = False
         self._home_requested: bool = False
-        self._endstop_detection_pending: bool = False
-        self._endstop_pos_event: threading.Event = threading.Event()
+
+        # Streaming transmit mode: instead of sleeping + M400 after every move,
+        # count Marlin's "ok" replies. The reactor keeps at most BUFSIZE lines
+        # unacknowledged (1 in stop-and-wait mode).
+        self.streaming_mode: bool = False
+        self.serial_bufsize: int = 4
+
+        # Reliable transport: "N<n> <line>*<checksum>" framing plus a ring of sent
+        # lines, so "Resend: N" replies can be answered without reconnecting.
+        self.reliable_transport: bool = False
+        self.resend_ring_size: int = 64
 
     def __del__(self):
         self.log("[INFO] GCodeControl destructor called")
@@ -78,10 +131,37 @@ class GCodeControl:
         self.connected = connected
         self.log(f"[INFO] Serial port connected - {self.connected}")
 
-    def _probe_marlin_connection(self, ser, timeout=8.0):
+    @staticmethod
+    def _is_marlin_reply(line: str) -> bool:
+        low = line.lower()
+        return (
+            "ok" in low
+            or "firmware_name" in low
+            or "firmware_info" in low
+            or "marlin" in low
+            or "creality" in low
+            or "echo:" in low
+            or "start" == low
+            or low.startswith("t:")
+            or low.startswith("t0:")
+            or low.startswith("b:")
+            or ("x:" in low and "y:" in low)
+        )
+
+    @staticmethod
+    def _looks_like_wrong_baud(raw: bytes) -> bool:
+        """At a mismatched baud rate the boot banner / replies arrive as binary noise."""
+        if len(raw) < 16:
+            return False
+        printable = sum(1 for b in raw if 32 <= b < 127 or b in (9, 10, 13))
+        return printable / len(raw) < 0.7
+
+    def _probe_marlin_connection(self, ser, timeout=8.0, cancel=None):
         """Best-effort 3D printer probe.
         Works for boards that don't reset on DTR (STM32/Ender 3 V3 SE)
-        and boards that do (ATmega2560/RAMPS)."""
+        and boards that do (ATmega2560/RAMPS).
+        Returns as soon as a Marlin line (boot banner or reply) is seen, or
+        early when the received bytes are noise (wrong baud) or cancel is set."""
         try:
             # Ensure DTR is HIGH so the board is NOT held in reset
             try:
@@ -100,17 +180,20 @@ class GCodeControl:
             except Exception:
                 pass
 
-            time.sleep(1.0)
-
             start = time.time()
             m105_sent = False
             m115_sent = False
             any_data_seen = False
+            raw_seen = b""
 
             while (time.time() - start) < timeout:
+                if cancel is not None and cancel.is_set():
+                    return False
                 elapsed = time.time() - start
 
-                if (not m105_sent) and elapsed > 0.5:
+                # A resetting board prints its banner ("start", "echo:Marlin ...") right
+                # after boot; listen first, poke with M105/M115 only if it stays silent.
+                if (not m105_sent) and elapsed > 1.0:
                     try:
                         ser.write(b"M105\n")
                         ser.flush()
@@ -135,25 +218,16 @@ class GCodeControl:
 
                 if getattr(ser, "in_waiting", 0):
                     try:
-                        line = ser.readline().decode('utf-8', errors='ignore').strip()
+                        raw = ser.readline()
                     except Exception:
-                        line = ""
+                        raw = b""
+                    raw_seen = (raw_seen + raw)[-256:]
+                    if not any_data_seen and self._looks_like_wrong_baud(raw_seen):
+                        return False
+                    line = raw.decode('utf-8', errors='ignore').strip()
                     if line:
                         any_data_seen = True
-                        low = line.lower()
-                        if (
-                            "ok" in low
-                            or "firmware_name" in low
-                            or "firmware_info" in low
-                            or "marlin" in low
-                            or "creality" in low
-                            or "echo:" in low
-                            or "start" == low
-                            or low.startswith("t:")
-                            or low.startswith("t0:")
-                            or low.startswith("b:")
-                            or ("x:" in low and "y:" in low)
-                        ):
+                        if self._is_marlin_reply(line):
                             return True
                 else:
                     time.sleep(0.05)
@@ -166,15 +240,18 @@ class GCodeControl:
             self.log(f"[WARN] Probe failed: {e}")
             return False
 
-    def _command_for_log(self, command: str) -> str:
-        parts = [p.strip() for p in str(command).replace("\r", "\n").split("\n") if p.strip()]
-        return " | ".join(parts)
+    def _command_for_log(self, command) -> str:
+        return self._as_command(command).log_text()
+
+    @staticmethod
+    def _as_command(command) -> GCodeCommand:
+        """Queue items and helper arguments may be raw strings or already parsed."""
+        return command if isinstance(command, GCodeCommand) else parse_command(command)
 
     def _extract_primary_gcode(self, text: str) -> str:
-        token = (str(text or "").strip().split(" ")[0] if str(text or "").strip() else "").upper()
-        if token and len(token) >= 2 and token[0] in ("G", "M") and token[1:].isdigit():
-            return token
-        return ""
+        line = parse_line(text or "")
+        code = line.code if line is not None else ""
+        return code if code[:1] in ("G", "M") and code[1:].isdigit() else ""
 
     def _remember_unsupported_from_response(self, line: str):
         low = str(line).lower()
@@ -199,12 +276,15 @@ class GCodeControl:
         if code not in self._unsupported_gcodes:
             self._unsupported_gcodes.add(code)
             self.log(f"[WARN] Firmware reported unsupported command: {code}. Future auto-apply will skip it.")
+            fp = self._firmware_fingerprint
+            if fp:
+                try:
+                    firmware_cache_manager.add_unsupported_gcode(fp, code)
+                except Exception as e:
+                    self.log(f"[WARN] Failed to update firmware cache: {e}")
 
-    def _is_emergency_allowed_command(self, command: str) -> bool:
-        cmd = self._command_for_log(command).upper().strip()
-        if not cmd:
-            return False
-        return cmd.startswith("M112") or cmd.startswith("M999")
+    def _is_emergency_allowed_command(self, command) -> bool:
+        return self._as_command(command).is_emergency_allowed
 
     def set_emergency_latched(self, latched: bool):
         with self._emergency_lock:
@@ -215,232 +295,178 @@ class GCodeControl:
             return bool(self._emergency_latched)
 
     def are_command_threads_alive(self) -> bool:
-        thread_names = ("x_thread", "y_thread", "z_thread", "aux_thread", "control_thread")
-        for name in thread_names:
-            thread = getattr(self, name, None)
-            if thread is None or not thread.is_alive():
-                return False
-        return True
-
-    def _set_worker_busy(self, name: str, busy: bool):
-        with self._worker_busy_lock:
-            if name in self._worker_busy:
-                self._worker_busy[name] = bool(busy)
+        return self._reactor is not None and self._reactor.is_alive()
 
     def has_pending_motion_commands(self) -> bool:
-        try:
-            if (
-                not self.x_motor_queue.empty()
-                or not self.y_motor_queue.empty()
-                or not self.z_motor_queue.empty()
-                or not self.control_queue.empty()
-            ):
-                return True
-        except Exception:
-            return False
+        if self.scheduler.pending(_MOTION_LANES):
+            return True
 
-        with self._worker_busy_lock:
-            return bool(
-                self._worker_busy.get("X_motor")
-                or self._worker_busy.get("Y_motor")
-                or self._worker_busy.get("Z_motor")
-                or self._worker_busy.get("CONTROL")
-            )
-
-    def _is_xy_move_command(self, command: str) -> bool:
-        line = self._command_for_log(command).upper().strip()
-        if not line:
-            return False
-        if not (line.startswith("G0") or line.startswith("G1")):
-            return False
-        return " X" in f" {line}" and " Y" in f" {line}"
+        reactor = self._reactor
+        return bool(reactor is not None and reactor.pending_motion())
 
-    def _is_manual_jog_command(self, command: str) -> bool:
-        parts = [p.strip().upper() for p in str(command).replace("\r", "\n").split("\n") if p.strip()]
-        if len(parts) != 2:
-            return False
-        if parts[0] != "G91":
-            return False
-        second = parts[1]
-        return second.startswith("G1 ") and (" X" in f" {second}" or " Y" in f" {second}")
+    def last_motion_time(self) -> float:
+        """time.monotonic() at which the last motion command was answered (0.0 if none yet)."""
+        reactor = self._reactor
+        return reactor.last_motion_done if reactor is not None else 0.0
+
+    def _is_xy_move_command(self, command) -> bool:
+        return self._as_command(command).is_xy_move
+
+    def _is_manual_jog_command(self, command) -> bool:
+        return self._as_command(command).is_jog
 
-    def _is_motion_command(self, command: str) -> bool:
+    def _is_motion_command(self, command) -> bool:
         if not command:
             return False
-        parts = [p.strip().upper() for p in str(command).replace("\r", "\n").split("\n") if p.strip()]
-        if not parts:
-            return False
-        if self._is_manual_jog_command(command):
-            return True
-        return any(p.startswith("G0") or p.startswith("G1") for p in parts)
-
-    def _filter_queue(self, q: queue.Queue, predicate):
-        kept = []
-        removed = 0
-        while True:
-            try:
-                item = q.get_nowait()
-            except queue.Empty:
-                break
+        return self._as_command(command).is_motion
 
-            if item == "STOP":
-                kept.append(item)
-                continue
+    @staticmethod
+    def _queued_text(item) -> str:
+        """Queue items are GCodeCommands (raw strings from send_to_*() are tolerated)."""
+        return item.text if isinstance(item, GCodeCommand) else item
 
-            if predicate(item):
-                removed += 1
-            else:
-                kept.append(item)
+    @staticmethod
+    def _drop_queued(item, reason: str):
+        handle = getattr(item, "handle", None)
+        if handle is not None:
+            handle.cancel(reason)
 
-        for item in kept:
-            q.put(item)
+    def _cancel_queued(self, items, reason: str) -> int:
+        for item in items:
+            self._drop_queued(item, reason)
+        return len(items)
 
-        return removed
+    def cancel_tag(self, tag: str) -> int:
+        """Drop every queued command submitted with tag (see new_command/submit_command)."""
+        return self._cancel_queued(self.scheduler.cancel_tag(tag), f"cancelled (tag {tag!r})")
 
     def clear_all_pending_commands(self) -> int:
-        removed = 0
-        removed += self._filter_queue(self.x_motor_queue, lambda _cmd: True)
-        removed += self._filter_queue(self.y_motor_queue, lambda _cmd: True)
-        removed += self._filter_queue(self.z_motor_queue, lambda _cmd: True)
-        removed += self._filter_queue(self.aux_queue, lambda _cmd: True)
-        removed += self._filter_queue(self.control_queue, lambda _cmd: True)
-        return removed
-
-    def _coalesce_axis_jog_queue(self, q: queue.Queue):
-        """Keep only non-jog items in axis queue so the latest jog can be appended once."""
-        kept = []
-        removed = 0
-        while True:
-            try:
-                item = q.get_nowait()
-            except queue.Empty:
-                break
-
-            if item == "STOP":
-                kept.append(item)
-            elif self._is_manual_jog_command(item):
-                removed += 1
-            else:
-                kept.append(item)
-
-        for item in kept:
-            q.put(item)
+        return self._cancel_queued(self.scheduler.clear(), "cleared from queue")
 
-        return removed
+    def _coalesce_axis_jog_queue(self, lane: str) -> int:
+        """Drop queued jogs of a motor lane so the latest jog can be appended once."""
+        return self._cancel_queued(self.scheduler.cancel_tag(f"jog:{lane}"), "superseded by a newer jog")
 
     def clear_pending_manual_jog_commands(self) -> int:
         removed = 0
-        removed += self._coalesce_axis_jog_queue(self.x_motor_queue)
-        removed += self._coalesce_axis_jog_queue(self.y_motor_queue)
-        removed += self._coalesce_axis_jog_queue(self.z_motor_queue)
+        removed += self._coalesce_axis_jog_queue("X_motor")
+        removed += self._coalesce_axis_jog_queue("Y_motor")
+        removed += self._coalesce_axis_jog_queue("Z_motor")
         return removed
 
     def clear_pending_motion_commands(self) -> int:
-        removed = 0
-        removed += self._filter_queue(self.x_motor_queue, self._is_motion_command)
-        removed += self._filter_queue(self.y_motor_queue, self._is_motion_command)
-        removed += self._filter_queue(self.z_motor_queue, self._is_motion_command)
-        removed += self._filter_queue(self.control_queue, self._is_motion_command)
-        return removed
+        return self._cancel_queued(self.scheduler.cancel_tag("motion"), "cleared from queue")
+
+
+
+    # ---------- transport settings (streaming window, reliable framing) ----------
+    def set_streaming_mode(self, enabled: bool, bufsize=None):
+        """Enable/disable ok-counting streaming. bufsize should match Marlin's BUFSIZE."""
+        self.streaming_mode = bool(enabled)
+        if bufsize is not None:
+            self.serial_bufsize = max(1, int(bufsize))
+        self._configure_reactor()
+        mode = f"streaming (BUFSIZE={self.serial_bufsize})" if self.streaming_mode else "stop-and-wait"
+        self.log(f"[INFO] Transmit mode: {mode}")
 
+    def set_reliable_transport(self, enabled: bool, ring_size=None):
+        self.reliable_transport = bool(enabled)
+        if ring_size is not None:
+            self.resend_ring_size = max(8, int(ring_size))
+        self._configure_reactor()
+        self.log(f"[INFO] Reliable transport (N/checksum/resend): {'ON' if self.reliable_transport else 'OFF'}")
 
+    def _load_transport_settings(self):
+        try:
+            cfg = config_manager.load_transport_settings()
+        except Exception as e:
+            self.log(f"[WARN] Failed to load transport settings: {e}")
+            return
+        self.auto_transport = cfg["auto_transport"]
+        self.set_streaming_mode(cfg["streaming_mode"], cfg["serial_bufsize"])
+        self.set_reliable_transport(cfg["reliable_transport"], cfg["resend_ring_size"])
+
+    def _configure_reactor(self):
+        reactor = self._reactor
+        if reactor is not None:
+            reactor.configure(self.streaming_mode, self.serial_bufsize,
+                              self.reliable_transport, self.resend_ring_size)
 
-    def send_command(self, command, wait_for_completion=False):
+    def send_command(self, command, wait_for_completion=False, timeout=60):
         if not self.connected:
             self.log("[WARN] send_command - not connected")
             return None
 
-        if self.is_emergency_latched() and not self._is_emergency_allowed_command(command):
-            self.log(f"[EMERGENCY] Blocked command while latched: {self._command_for_log(command)}")
+        cmd = self._as_command(command)
+        if self.is_emergency_latched() and not cmd.is_emergency_allowed:
+            self.log(f"[EMERGENCY] Blocked command while latched: {cmd.log_text()}")
             return None
 
-        # always send command
-        if not command.endswith("\n"):
-            command += "\n"
-
-    
-        with self.lock:
-            self.ser.write(command.encode('utf-8'))
-   
-        time.sleep(0.05 if wait_for_completion else 0.005)
+        reactor = self._reactor
+        if reactor is None or not reactor.is_alive():
+            self.log("[WARN] send_command - serial reactor is not running")
+            return None
 
+        lines = cmd.line_texts()
+        ack_lines = len(lines)
         if wait_for_completion:
-            # only then send M400 and wait for response
-            with self.lock:
-                self.ser.write(b"M400\n")
-        
-            time.sleep(0.05)
-            return self.wait_for_ok(timeout=5)
-
-        return None  # command sent, no wait requested
+            # M400's "ok" only arrives once the planner is empty.
+            lines.append("M400")
+        txn = reactor.submit(lines, source="DIRECT", motion=cmd.is_motion, ack_lines=ack_lines)
 
-
-
-
-    def wait_for_ok(self, timeout=5):
-        start_time = time.time()
-        while True:
-            with self.lock:
-                response = self.ser.readline().decode('utf-8', errors='ignore').strip().lower()
-
-            if "ok" in response:
-                # return None
-                return response
-
-            if time.time() - start_time > timeout:
+        if wait_for_completion:
+            if not txn.wait(timeout) or txn.ok_line is None:
                 self.log("[ERROR] G-code response timeout (no 'ok' received)")
                 return None
+            return txn.ok_line.lower()
 
-    def worker_loop(self, q: queue.Queue, name: str):
-        if self.connected:
-            self.log(f"[{name}] thread started.")
-            while self.running:
-                try:
-                    command = q.get(timeout=1)
-                    self._set_worker_busy(name, True)
-                    if command == "STOP":
-                        self.log(f"[{name}] thread stopping.")
-                        break
-                    if self.is_emergency_latched() and not self._is_emergency_allowed_command(command):
-                        continue
-                    cmd_log = self._command_for_log(command)
-                    if name in ("X_motor", "Y_motor", "Z_motor"): 
-                        is_jog = self._is_manual_jog_command(command)
-                        wait_move = not is_jog
-                        self.send_command(command, wait_for_completion=wait_move)
-                    elif name == "AUX":
-                        if command.startswith("M42"):
-                            self.log(f"[AUX] M42 command: {cmd_log}")
-                            self.send_command(command, wait_for_completion=False)
-                    elif name == "CONTROL":
-                        self.log(f"[CONTROL] -> {cmd_log}")
-                        self.send_command(command, wait_for_completion=self._is_xy_move_command(command))
-                except queue.Empty:
-                    continue
-                finally:
-                    self._set_worker_busy(name, False)
-        else:
-            self.log(f"[WARN] {name} - not connected")
+        return None  # command queued on the reactor, no wait requested
+
+    def _prepare_queued_command(self, name: str, item):
+        """Called on the reactor thread for each item taken from a command queue.
+        Returns the SerialTransaction to transmit, or None to drop the item."""
+        cmd = self._as_command(item)
+        handle = cmd.handle
+        if self.is_emergency_latched() and not cmd.is_emergency_allowed:
+            self._drop_queued(cmd, "emergency latch active")
+            return None
+        lines = cmd.line_texts()
+        ack_lines = len(lines)
+        # A handle asking for motion completion always gets its M400, even when streaming.
+        wait_motion = bool(handle is not None and handle.wait_motion)
+        paced = cmd.is_jog or self.streaming_mode or bool(handle is not None and handle.streamed)
+        motion = False
+        if name in ("X_motor", "Y_motor", "Z_motor"):
+            motion = True
+            # In streaming mode the planner queues moves; the ok-window provides back-pressure.
+            if wait_motion or not paced:
+                lines.append("M400")
+        elif name == "AUX":
+            if cmd.code != "M42":
+                self._drop_queued(cmd, "AUX queue only accepts M42")
+                return None
+            self.log(f"[AUX] M42 command: {cmd.log_text()}")
+        elif name == "TELEMETRY":
+            pass  # periodic status queries, not logged
+        elif name == "CONTROL":
+            self.log(f"[CONTROL] -> {cmd.log_text()}")
+            motion = cmd.is_motion
+            if (wait_motion and motion) or (cmd.is_xy_move and not paced):
+                lines.append("M400")
+        return SerialTransaction(lines, source=name, motion=motion, handle=handle, ack_lines=ack_lines)
 
     def start_threads(self):
+        """Start the serial reactor that serves the X/Y/Z/AUX/CONTROL queues and reads replies."""
         if (self.connected):
-            """Start threads: X_motor, Y_motor, Z_motor, AUX (other functions)."""
-            # Do not start new threads if they are already running
-            if hasattr(self, 'x_thread') and self.x_thread.is_alive():
-                self.log("[WARN] Threads are already running; stop them before restarting.")
+            # Do not start a new reactor if one is already running
+            if self._reactor is not None and self._reactor.is_alive():
+                self.log("[WARN] Serial reactor is already running; stop it before restarting.")
                 return
 
-            self.x_thread = threading.Thread(target=self.worker_loop, args=(self.x_motor_queue, "X_motor"))
-            self.y_thread = threading.Thread(target=self.worker_loop, args=(self.y_motor_queue, "Y_motor"))
-            self.z_thread = threading.Thread(target=self.worker_loop, args=(self.z_motor_queue, "Z_motor"))
-            self.aux_thread = threading.Thread(target=self.worker_loop, args=(self.aux_queue, "AUX"))
-            self.control_thread = threading.Thread(target=self.worker_loop, args=(self.control_queue, "CONTROL"))
-
-            self.control_thread.start()
-            self.x_thread.start()
-            self.y_thread.start()
-            self.z_thread.start()
-            self.aux_thread.start()
+            self._reactor = SerialReactor(self, self.ser, self.scheduler)
+            self._configure_reactor()
+            self._reactor.recorder = self._session_recorder
+            self._reactor.start()
         else:
             self.log("[WARN] start_threads - not connected")
 
@@ -466,70 +492,89 @@ class GCodeControl:
                 self.log("[ERROR] No valid serial connection (ser = None)")
                 return ""
 
-            with self.lock:
-                self.ser.write("M119\n".encode('utf-8'))
-
-            time.sleep(0.1)
-            with self.lock:
-                response = self.ser.read_all().decode('utf-8', errors='ignore')
-
-            return response
+            reactor = self._reactor
+            if reactor is None or not reactor.is_alive():
+                self.log("[WARN] query_endstops - serial reactor is not running")
+                return ""
+            txn = reactor.submit(["M119"], source="DIRECT")
+            txn.wait(timeout=2.0)
+            return "\n".join(txn.responses)
         else:
             self.log("[INFO] query_endstops - not connected")
             return ""
 
-    def new_command(self, command: str):
+    def new_command(self, command, tag: str = None):
+        return self._dispatch_command(command, tag=tag) is not None
+
+    def submit_command(self, command: str, wait_motion: bool = True, tag: str = None,
+                       streamed: bool = False) -> CommandHandle:
+        """Queue a command like new_command(), but return a CommandHandle.
+
+        handle.acked resolves on the firmware's "ok" for the line; handle.completed
+        resolves when the move has physically finished (wait_motion=True) so the
+        caller can chain the next action without polling has_pending_motion_commands().
+        Commands queued with a tag can be dropped together with cancel_tag(tag).
+        """
+        handle = CommandHandle(command, wait_motion=wait_motion, streamed=streamed)
+        if self._dispatch_command(command, handle, tag) is None:
+            handle.cancel("command rejected (not connected or emergency latched)")
+        return handle
+
+    def _dispatch_command(self, command, handle: CommandHandle = None, tag: str = None):
+        """Route a command to its lane. Returns the queued GCodeCommand, or None if rejected.
+
+        The text is parsed once here; routing, clamping and the reactor all work
+        on the resulting GCodeCommand.
+        """
         if self.connected:
-            if self.is_emergency_latched() and not self._is_emergency_allowed_command(command):
-                self.log(f"[EMERGENCY] Queue reject while latched: {self._command_for_log(command)}")
-                return False
-
-            command = self._clamp_gcode_command(command)
-            cmd_upper = command.upper().strip()
-            cmd_log = self._command_for_log(cmd_upper)
-            is_jog = self._is_manual_jog_command(cmd_upper)
+            cmd = self._as_command(command)
+            if self.is_emergency_latched() and not cmd.is_emergency_allowed:
+                self.log(f"[EMERGENCY] Queue reject while latched: {cmd.log_text()}")
+                return None
 
-            if "G1" in cmd_upper or "G0" in cmd_upper:
-                if "X" in cmd_upper and "Y" not in cmd_upper and "Z" not in cmd_upper:
+            if cmd.code in EMERGENCY_CODES and len(cmd.lines) == 1:
+                # Never queue behind moves: straight to the reactor's fast lane.
+                if handle is not None:
+                    handle.cancel("sent on the emergency lane")
+                return cmd if self.send_emergency(cmd.text) else None
+
+            self._clamp_command(cmd)
+            cmd_log = cmd.log_text()
+            is_jog = cmd.is_jog
+            if handle is not None:
+                handle.command = cmd.text
+                cmd.handle = handle
+
+            if cmd.is_motion:
+                axes = cmd.axes
+                if len(axes) == 1:
+                    lane = f"{next(iter(axes))}_motor"
                     if is_jog:
-                        self._coalesce_axis_jog_queue(self.x_motor_queue)
-                    if not is_jog:
-                        self.log(f"[DISPATCH] X_motor_queue <- {cmd_log}")
-                    self.send_to_x(cmd_upper)
-                    return True
-                elif "Y" in cmd_upper and "X" not in cmd_upper and "Z" not in cmd_upper:
-                    if is_jog:
-                        self._coalesce_axis_jog_queue(self.y_motor_queue)
-                    if not is_jog:
-                        self.log(f"[DISPATCH] Y_motor_queue <- {cmd_log}")
-                    self.send_to_y(cmd_upper)
-                    return True
-                elif "Z" in cmd_upper and "X" not in cmd_upper and "Y" not in cmd_upper:
-                    if is_jog:
-                        self._coalesce_axis_jog_queue(self.z_motor_queue)
-                    if not is_jog:
-                        self.log(f"[DISPATCH] Z_motor_queue <- {cmd_log}")
-                    self.send_to_z(cmd_upper)
-                    return True
-                else:
-                    self.log(f"[DISPATCH] CONTROL_queue (mixed axes or other) <- {cmd_log}")
-                    self.send_to_control(cmd_upper)
-                    return True
-            elif cmd_upper.startswith("M42"):
+                        self._coalesce_axis_jog_queue(lane)
+                    elif handle is None or not handle.streamed:
+                        self.log(f"[DISPATCH] {lane}_queue <- {cmd_log}")
+                    self._enqueue(lane, cmd, tag)
+                    return cmd
+                self.log(f"[DISPATCH] CONTROL_queue (mixed axes or other) <- {cmd_log}")
+                self._enqueue("CONTROL", cmd, tag)
+                return cmd
+            elif cmd.code == "M42":
                 self.log(f"[DISPATCH] AUX_queue (M42) <- {cmd_log}")
-                self.send_to_aux(cmd_upper)
-                return True
+                self._enqueue("AUX", cmd, tag)
+                return cmd
+            elif cmd.code in _TELEMETRY_CODES and len(cmd.lines) == 1:
+                self._enqueue("TELEMETRY", cmd, tag)
+                return cmd
             else:
                 self.log(f"[DISPATCH] CONTROL_queue <- {cmd_log}")
-                self.send_to_control(cmd_upper)
-                if cmd_upper.startswith("G28"):
+                self._enqueue("CONTROL", cmd, tag)
+                if cmd.code == "G28":
                     self._home_requested = True
-                    self.send_to_control("M114")
-                return True
+                    self._enqueue("CONTROL", parse_command("M114"))
+                return cmd
         else:
             self.log("[WARN] new_command - not connected")
-            return False
-
+            return None
 
     def autoconnect(self):
         self.log("[INFO] autoconnect() called")
@@ -538,7 +583,7 @@ class GCodeControl:
         had_connection = bool(self.ser is not None or self.connected)
 
         # Stop existing threads if they are running
-        if hasattr(self, 'x_thread') and self.x_thread.is_alive():
+        if self.are_command_threads_alive():
             self.log("[INFO] Stopping previous threads before reconnect...")
             self.stop_threads()
             # running flag needs to be enabled again
@@ -592,55 +637,17 @@ class GCodeControl:
                     unique.append(b)
             return unique
 
-        def _try_connect_port(port_name, baud_list, source_label):
-            for baud in baud_list:
-                ser = None
-                try:
-                    self.log(f"[INFO] Trying {source_label}: {port_name} @ {baud}")
-                    try:
-                        ser = serial.Serial(port_name, int(baud), timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
-                    except PermissionError:
-                        # Windows: previous process may still hold the handle.
-                        # Wait and retry once before giving up.
-                        self.log(f"[WARN] {port_name} access denied – waiting 3 s for OS to release handle...")
-                        time.sleep(3.0)
-                        ser = serial.Serial(port_name, int(baud), timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
-                    if self._probe_marlin_connection(ser, timeout=10.0):
-                        self.ser = ser
-                        self.set_connected(True)
-                        if self.label_status:
-                            self.label_status.setText(f"Connected successfully: {port_name} @ {baud} baud")
-                        self.log(f"[INFO] Successful connection ({source_label}): {port_name} @ {baud} baud")
-                        config_manager.update_settings({
-                            "selected_port": port_name,
-                            "baud": int(baud)
-                        })
-                        self.start_threads()
-                        self.start_response_listener()
-                        self.load_marlin_config()
-                        return True
-                    if ser and ser.is_open:
-                        ser.close()
-                    self.log(f"[WARN] Probe timeout/no valid response: {port_name} @ {baud}")
-                except Exception as e:
-                    if ser:
-                        try:
-                            ser.close()
-                        except Exception:
-                            pass
-                    self.log(f"[WARN] {source_label} failed: {port_name} @ {baud} - {e}")
-            return False
-
         # Try saved settings first
         if preferred_port:
             if available_ports and preferred_port not in available_ports:
                 self.log(f"[WARN] Saved port {preferred_port} not currently listed. Available: {available_ports}")
-            if _try_connect_port(preferred_port, _unique_bauds(preferred_baud), "saved"):
+            found = self._probe_port(preferred_port, _unique_bauds(preferred_baud), "saved")
+            if found:
+                self._finish_connection(found[0], preferred_port, found[1], "saved")
                 return
 
-        # Fallback: try all port/baud combinations
+        # Fallback: probe every other port concurrently; the first Marlin answer wins
         self.log("[INFO] Fallback: automatic scan started...")
-        baud_rates = fallback_bauds
         ports = serial.tools.list_ports.comports()
 
         if not ports:
@@ -651,7 +658,7 @@ class GCodeControl:
 
         all_port_names = [p.device for p in ports]
         self.log(f"[INFO] Available ports: {all_port_names}")
-        scan_ports = [p for p in ports if not (preferred_port and p.device == preferred_port)]
+        scan_ports = [p.device for p in ports if not (preferred_port and p.device == preferred_port)]
         if not scan_ports:
             self.log(f"[INFO] No other ports to try besides already-tried '{preferred_port}'. Connection failed.")
             if self.label_status:
@@ -659,51 +666,159 @@ class GCodeControl:
             self.log("[INFO] Connection failed.")
             return
 
-        for port in scan_ports:
-            port_name = port.device
-            if preferred_port and port_name == preferred_port:
-                continue
-            for baud in baud_rates:
-                ser = None
-                try:
-                    self.log(f"[INFO] Trying: {port_name} @ {baud}")
+        found = self._probe_ports_parallel(scan_ports, fallback_bauds)
+        if found:
+            ser, port_name, baud = found
+            self._finish_connection(ser, port_name, baud, "scan")
+            return
+
+        if self.label_status:
+            self.label_status.setText("Failed to connect to any serial port.")
+        self.log("[INFO] Connection failed.")
+
+    def _open_serial(self, port_name, baud, cancel=None):
+        try:
+            return serial.Serial(port_name, int(baud), timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
+        except PermissionError:
+            # Windows: previous process may still hold the handle.
+            # Wait and retry once before giving up.
+            self.log(f"[WARN] {port_name} access denied – waiting 3 s for OS to release handle...")
+            if cancel is not None:
+                if cancel.wait(3.0):
+                    return None
+            else:
+                time.sleep(3.0)
+            return serial.Serial(port_name, int(baud), timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
+
+    def _probe_port(self, port_name, baud_list, source_label, cancel=None):
+        """Try each baud rate on one port. Returns (open serial, baud) or None."""
+        for baud in baud_list:
+            if cancel is not None and cancel.is_set():
+                return None
+            ser = None
+            try:
+                self.log(f"[INFO] Trying {source_label}: {port_name} @ {baud}")
+                ser = self._open_serial(port_name, baud, cancel)
+                if ser is None:
+                    return None
+                if self._probe_marlin_connection(ser, timeout=10.0, cancel=cancel):
+                    return ser, int(baud)
+                if ser.is_open:
+                    ser.close()
+                if cancel is None or not cancel.is_set():
+                    self.log(f"[WARN] Probe timeout/no valid response: {port_name} @ {baud}")
+            except Exception as e:
+                if ser:
                     try:
-                        ser = serial.Serial(port_name, baud, timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
-                    except PermissionError:
-                        self.log(f"[WARN] {port_name} access denied – waiting 3 s for OS to release handle...")
-                        time.sleep(3.0)
-                        ser = serial.Serial(port_name, baud, timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
-                    if self._probe_marlin_connection(ser, timeout=10.0):
-                        self.ser = ser
-                        self.set_connected(True)
-                        if self.label_status:
-                            self.label_status.setText(f"Connected successfully: {port_name} @ {baud} baud")
-                        self.log(f"[INFO] Successful connection: {port_name} @ {baud} baud")
-
-                        # Save settings
-                        config_manager.update_settings({
-                            "selected_port": port_name,
-                            "baud": baud
-                        })
-
-                        self.start_threads()
-                        self.start_response_listener()
-                        self.load_marlin_config()
-                        return
-                    if ser and ser.is_open:
                         ser.close()
-
+                    except Exception:
+                        pass
+                self.log(f"[WARN] {source_label} failed: {port_name} @ {baud} - {e}")
+        return None
+
+    def _probe_ports_parallel(self, port_names, baud_list):
+        """Probe ports concurrently (bauds stay sequential per port).
+        Returns (serial, port, baud) of the first port that answers; the rest are cancelled and closed."""
+        cancel = threading.Event()
+        winner = None
+        with ThreadPoolExecutor(max_workers=len(port_names), thread_name_prefix="port-probe") as pool:
+            futures = {pool.submit(self._probe_port, name, baud_list, "scan", cancel): name
+                       for name in port_names}
+            for fut in as_completed(futures):
+                try:
+                    found = fut.result()
                 except Exception as e:
-                    if ser:
-                        try:
-                            ser.close()
-                        except Exception:
-                            pass
-                    self.log(f"[ERROR] {port_name} @ {baud} - {e}")
+                    self.log(f"[ERROR] {futures[fut]} - {e}")
+                    continue
+                if not found:
+                    continue
+                if winner is None:
+                    winner = (found[0], futures[fut], found[1])
+                    cancel.set()
+                else:
+                    # Another port answered in the same instant; keep the first one.
+                    try:
+                        found[0].close()
+                    except Exception:
+                        pass
+        return winner
 
+    def _finish_connection(self, ser, port_name, baud, source_label) -> None:
+        self.ser = ser
+        self.set_connected(True)
         if self.label_status:
-            self.label_status.setText("Failed to connect to any serial port.")
-        self.log("[INFO] Connection failed.")
+            self.label_status.setText(f"Connected successfully: {port_name} @ {baud} baud")
+        self.log(f"[INFO] Successful connection ({source_label}): {port_name} @ {baud} baud")
+        config_manager.update_settings({
+            "selected_port": port_name,
+            "baud": int(baud)
+        })
+        self.start_threads()
+        self.start_response_listener()
+        self.load_firmware_capabilities()
+        self.enable_position_autoreport()
+        self.load_marlin_config()
+
+    def load_firmware_capabilities(self):
+        """Query M115 once, merge it with the firmware cache and pick transport features."""
+        reactor = self._reactor
+        if reactor is None or not reactor.is_alive():
+            return
+        txn = reactor.submit(["M115"], source="DIRECT")
+        txn.wait(timeout=3.0)
+        info = firmware_cache_manager.parse_m115_response(txn.responses)
+        if not info:
+            self.log("[WARN] No M115 report; firmware capabilities unknown.")
+            return
+
+        fp = firmware_cache_manager.fingerprint(info)
+        try:
+            entry = firmware_cache_manager.get_entry(fp) or {}
+        except Exception as e:
+            self.log(f"[WARN] Failed to read firmware cache: {e}")
+            entry = {}
+        fields = info["fields"]
+        caps = info["capabilities"]
+        self._firmware_fingerprint = fp
+        self.firmware_info = fields
+        self.firmware_caps = caps
+        # Known-bad G-codes from earlier sessions: skip them instead of failing again.
+        self._unsupported_gcodes |= set(entry.get("unsupported_gcodes") or [])
+
+        # ADVANCED_OK: "ok P<planner free> B<buffer free>". Nothing else is queued
+        # while M115 is answered, so B is the firmware's full BUFSIZE.
+        bufsize = entry.get("bufsize")
+        if caps.get("ADVANCED_OK") and txn.ok_line:
+            match = re.search(r"\bB(\d+)", txn.ok_line)
+            if match and int(match.group(1)) > 0:
+                bufsize = int(match.group(1))
+
+        updates = {
+            "firmware_name": fields.get("FIRMWARE_NAME", ""),
+            "machine_type": fields.get("MACHINE_TYPE", ""),
+            "capabilities": caps,
+        }
+        if bufsize:
+            updates["bufsize"] = int(bufsize)
+        try:
+            firmware_cache_manager.update_entry(fp, updates)
+        except Exception as e:
+            self.log(f"[WARN] Failed to update firmware cache: {e}")
+
+        source = "cached profile" if entry else "new profile"
+        self.log(f"[INFO] Firmware: {updates['firmware_name'] or 'unknown'} ({source} {fp})")
+        enabled = sorted(name for name, on in caps.items() if on)
+        if enabled:
+            self.log(f"[INFO] Firmware capabilities: {', '.join(enabled)}")
+        if entry.get("unsupported_gcodes"):
+            self.log(f"[INFO] Known unsupported G-codes: {', '.join(entry['unsupported_gcodes'])}")
+
+        if bufsize:
+            if self.auto_transport and caps.get("ADVANCED_OK"):
+                self.set_streaming_mode(True, bufsize)
+            elif int(bufsize) != self.serial_bufsize:
+                self.serial_bufsize = int(bufsize)
+                self._configure_reactor()
 
     def reconnect_saved(self, fallback: bool = True) -> bool:
         """Reconnect using saved selected_port + baud from settings, optional fallback scan."""
@@ -723,7 +838,7 @@ class GCodeControl:
                 return bool(self.connected)
             return False
 
-        if hasattr(self, 'x_thread') and self.x_thread.is_alive():
+        if self.are_command_threads_alive():
             self.log("[INFO] Stopping previous threads before reconnect_saved...")
             self.stop_threads()
             self.running = True
@@ -732,20 +847,7 @@ class GCodeControl:
             self.log(f"[INFO] reconnect_saved: trying {preferred_port} @ {preferred_baud}")
             ser = serial.Serial(preferred_port, preferred_baud, timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
             if self._probe_marlin_connection(ser, timeout=5.0):
-                self.ser = ser
-                self.set_connected(True)
-                if self.label_status:
-                    self.label_status.setText(f"Connected successfully: {preferred_port} @ {preferred_baud} baud")
-                self.log(f"[INFO] reconnect_saved success: {preferred_port} @ {preferred_baud}")
-
-                config_manager.update_settings({
-                    "selected_port": preferred_port,
-                    "baud": int(preferred_baud)
-                })
-
-                self.start_threads()
-                self.start_response_listener()
-                self.load_marlin_config()
+                self._finish_connection(ser, preferred_port, preferred_baud, "reconnect_saved")
                 return True
 
             ser.close()
@@ -761,54 +863,156 @@ class GCodeControl:
         return False
 
     def start_response_listener(self):
-        if hasattr(self, "response_thread") and self.response_thread.is_alive():
-            self.log("[INFO] Response listener thread is already running.")
+        """Replies are read by the serial reactor; this applies the transport settings to it."""
+        if not self.are_command_threads_alive():
+            self.log("[WARN] Response listener needs the serial reactor; call start_threads() first.")
             return
-
-        self.response_running = True
-        self.response_thread = threading.Thread(target=self.response_loop, daemon=True)
-        self.response_thread.start()
-        self.log("[INFO] Response listener thread started.")
-
-    def response_loop(self):
-        while self.response_running and self.connected and self.ser:
+        self._load_transport_settings()
+        self._auto_start_session_recording()
+        self.log("[INFO] Response listener running on the serial reactor.")
+
+    # ---------- session capture ----------
+    def start_session_recording(self, path=None) -> str:
+        """Record every serial line (tx/rx, monotonic timestamps) to a JSONL file. Returns its path."""
+        self.stop_session_recording()
+        if path is None:
+            path = default_session_path(config_manager.load_session_recording_settings()["directory"])
+        port = getattr(self.ser, "port", None)
+        self._session_recorder = SessionRecorder(path, port=port,
+                                                 streaming=self.streaming_mode,
+                                                 bufsize=self.serial_bufsize,
+                                                 reliable=self.reliable_transport)
+        if self._reactor is not None:
+            self._reactor.recorder = self._session_recorder
+        self.log(f"[INFO] Serial session recording -> {path}")
+        return path
+
+    def stop_session_recording(self):
+        recorder = self._session_recorder
+        if recorder is None:
+            return
+        self._session_recorder = None
+        if self._reactor is not None:
+            self._reactor.recorder = None
+        recorder.close()
+        self.log(f"[INFO] Serial session recording stopped: {recorder.path}")
+
+    def _auto_start_session_recording(self):
+        if self._session_recorder is not None:
+            return
+        try:
+            if config_manager.load_session_recording_settings()["enabled"]:
+                self.start_session_recording()
+        except Exception as e:
+            self.log(f"[WARN] Could not start session recording: {e}")
+
+    def _handle_response_line(self, line: str):
+        """Called on the reactor thread for every line received from the firmware."""
+        self._remember_unsupported_from_response(line)
+        is_position = self._sync_pos_from_response(line)
+        if "paused for user" in line.lower():
+            self.log("[INFO] Printer paused for user – sending M108 to resume.")
+            self.send_emergency("M108")
+        elif is_position and self.position_autoreport_interval:
+            pass  # periodic M154 reports would flood the log; see get_position_snapshot()
+        elif not _PLAIN_OK_RE.match(line):
+            self.log(f"[RESPONSE] {line}")
+
+    def _sync_pos_from_response(self, line: str) -> bool:
+        if not any(f"{ax}:" in line for ax in ("X", "Y", "Z")):
+            return False
+        parsed = parse_position(line)
+        if not parsed:
+            return False
+        for ax, val in parsed.items():
+            self._current_pos[ax] = val
+        with self._pos_cond:
+            self._reported_pos = dict(parsed)
+            self._reported_pos_time = time.monotonic()
+            self._reported_pos_seq += 1
+            snapshot = self._position_snapshot_locked()
+            listeners = list(self._position_listeners)
+            self._pos_cond.notify_all()
+        for fn in listeners:
             try:
-                if self.ser.in_waiting:
-                    line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line:
-                        self._remember_unsupported_from_response(line)
-                        self._sync_pos_from_response(line)
-                        if "paused for user" in line.lower():
-                            self.log("[INFO] Printer paused for user – sending M108 to resume.")
-                            self.send_command("M108\n")
-                        elif line != "ok":
-                            self.log(f"[RESPONSE] {line}")
-                else:
-                    time.sleep(0.05)
+                fn(snapshot)
             except Exception as e:
-                self.log(f"[ERROR] Response read error: {e}")
-                break
+                self.log(f"[WARN] Position listener failed: {e}")
+        return True
 
-    def _sync_pos_from_response(self, line: str):
-        import re
-        if not any(f"{ax}:" in line for ax in ("X", "Y", "Z")):
-            return
-        # M114 format: 'X:212.00 Y:211.87 Z:10.00 E:0.00 Count X:16960 Y:16950 Z:4000'
-        # Only parse the mm part before 'Count' to avoid capturing step values.
-        mm_part = line.split("Count")[0]
-        parsed = {}
-        for match in re.finditer(r'([XYZ]):([-\d.]+)', mm_part):
-            axis = match.group(1)
+    # ---------- position reports ----------
+    def _position_snapshot_locked(self) -> dict:
+        snap = dict(self._reported_pos)
+        snap["t"] = self._reported_pos_time
+        snap["seq"] = self._reported_pos_seq
+        return snap
+
+    def get_position_snapshot(self) -> dict:
+        """Last firmware-reported position: {"X", "Y", "Z", "t": monotonic time, "seq": counter}.
+        Empty of axes until the first report arrives."""
+        with self._pos_cond:
+            return self._position_snapshot_locked()
+
+    def get_motion_estimator(self) -> MotionEstimator:
+        if self.motion_estimator is None:
+            self.motion_estimator = MotionEstimator.from_settings()
+        return self.motion_estimator
+
+    def estimate_motion(self, commands, start_pos=None) -> dict:
+        """Trapezoidal time estimate of commands, from start_pos or the last reported position."""
+        if start_pos is None:
+            start_pos = {ax: v for ax, v in self.get_position_snapshot().items() if ax in "XYZ"}
+        return self.get_motion_estimator().estimate(commands, start_pos)
+
+    def estimate_pending_motion(self) -> dict:
+        """Time estimate of the moves still waiting in the scheduler (in the order they will go out)."""
+        return self.estimate_motion(self.scheduler.items(_MOTION_LANES))
+
+    def wait_for_position_update(self, after_seq: int, timeout: float = 1.0):
+        """Block until a report newer than after_seq arrives. Returns the snapshot or None on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._pos_cond:
+            while self._reported_pos_seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._pos_cond.wait(remaining)
+            return self._position_snapshot_locked()
+
+    def add_position_listener(self, fn):
+        """fn(snapshot) is called on the serial reactor thread for every position report."""
+        with self._pos_cond:
+            if fn not in self._position_listeners:
+                self._position_listeners.append(fn)
+
+    def remove_position_listener(self, fn):
+        with self._pos_cond:
+            if fn in self._position_listeners:
+                self._position_listeners.remove(fn)
+
+    def position_autoreport_active(self) -> bool:
+        return self.connected and self.position_autoreport_interval > 0
+
+    def enable_position_autoreport(self, interval=None):
+        """Turn on M154 position auto-report if the firmware advertises AUTOREPORT_POS."""
+        if interval is None:
             try:
-                parsed[axis] = float(match.group(2))
-            except ValueError:
-                pass
-        for ax, val in parsed.items():
-            self._current_pos[ax] = val
-        if self._endstop_detection_pending and parsed:
-            self.machine_limits["position_min"] = dict(parsed)
-            self._endstop_detection_pending = False
-            self._endstop_pos_event.set()
+                interval = config_manager.load_position_report_settings()["interval"]
+            except Exception as e:
+                self.log(f"[WARN] Failed to load position report settings: {e}")
+                interval = 1
+        interval = max(0, int(interval))
+        if interval and not self.firmware_caps.get("AUTOREPORT_POS"):
+            self.log("[INFO] Firmware has no AUTOREPORT_POS; positions are read with M114 on demand.")
+            self.position_autoreport_interval = 0
+            return
+        if "M154" in self._unsupported_gcodes:
+            self.position_autoreport_interval = 0
+            return
+        self.send_command(f"M154 S{interval}\n")
+        self.position_autoreport_interval = interval
+        if interval:
+            self.log(f"[INFO] Position auto-report enabled (M154 S{interval}).")
 
     def _load_machine_limits(self, settings: dict):
         mf = settings.get("max_feedrate", {})
@@ -825,107 +1029,86 @@ class GCodeControl:
         if fr:
             self.log(f"[INFO] Feedrate caps loaded (mm/min): {fr}")
 
-    def _clamp_gcode_command(self, command: str) -> str:
+    def _clamp_command(self, cmd: GCodeCommand) -> GCodeCommand:
+        """Clamp feedrates and target positions of cmd in place to the machine limits."""
         if not self.machine_limits:
-            return command
-        lines = []
-        for raw in command.replace("\r", "\n").split("\n"):
-            line = raw.strip().upper()
-            if not line:
-                continue
-            if line.startswith("G90"):
+            return cmd
+        changed = False
+        for line in cmd.lines:
+            code = line.code
+            if code == "G90":
                 self._relative_mode = False
-            elif line.startswith("G91"):
+            elif code == "G91":
                 self._relative_mode = True
-            elif line.startswith("G28"):
+            elif code == "G28":
                 self._current_pos = {"X": 0.0, "Y": 0.0, "Z": 0.0}
-            elif line.startswith("G92"):
-                for tok in line.split()[1:]:
-                    if tok and tok[0] in "XYZ":
-                        try:
-                            self._current_pos[tok[0]] = float(tok[1:])
-                        except ValueError:
-                            pass
-            elif line.startswith("G0") or line.startswith("G1"):
-                line = self._clamp_motion_line(line)
-            lines.append(line)
-        return "\n".join(lines)
-
-    def _clamp_motion_line(self, line: str) -> str:
-        tokens = line.split()
-        if not tokens:
-            return line
-
+            elif code == "G92":
+                for letter, value, _tok in line.words:
+                    if letter in "XYZ" and value is not None:
+                        self._current_pos[letter] = value
+            elif code in ("G0", "G1"):
+                changed |= self._clamp_motion_line(line)
+        if changed:
+            cmd.refresh()
+        return cmd
+
+    def _clamp_motion_line(self, line) -> bool:
+        """Clamp one parsed G0/G1 line in place. Returns True if its text changed."""
         max_feedrate_mmmin = self.machine_limits.get("max_feedrate_mmmin", {})
         pos_min = self.machine_limits.get("position_min", {})
         pos_max = self.machine_limits.get("position_max", {})
 
-        moving_axes = [t[0] for t in tokens[1:] if t and t[0] in "XYZE"]
+        moving_axes = [w[0] for w in line.words if w[0] in "XYZE"]
         caps = [max_feedrate_mmmin[ax] for ax in moving_axes if ax in max_feedrate_mmmin]
         feedrate_cap = min(caps) if caps else float("inf")
 
-        result = [tokens[0]]
-        for tok in tokens[1:]:
-            if not tok:
+        changed = False
+        for i, (letter, value, _tok) in enumerate(line.words):
+            if value is None:
                 continue
-            letter = tok[0]
 
             if letter == "F":
-                try:
-                    f_val = float(tok[1:])
-                    f_clamped = min(f_val, feedrate_cap)
-                    if f_clamped < f_val - 0.5:
-                        self.log(f"[LIMIT] Feedrate clamped {f_val:.0f} -> {f_clamped:.0f} mm/min (axes: {moving_axes})")
-                    result.append(f"F{f_clamped:.0f}")
-                except ValueError:
-                    result.append(tok)
+                f_clamped = min(value, feedrate_cap)
+                if f_clamped < value - 0.5:
+                    self.log(f"[LIMIT] Feedrate clamped {value:.0f} -> {f_clamped:.0f} mm/min (axes: {moving_axes})")
+                changed |= line.set_word(i, f_clamped, f"F{f_clamped:.0f}")
 
             elif letter in "XYZ" and not self._relative_mode:
-                try:
-                    pos_val = float(tok[1:])
-                    lo = pos_min.get(letter)
-                    hi = pos_max.get(letter)
-                    clamped = pos_val
-                    if hi is not None:
-                        clamped = min(clamped, hi)
-                    if lo is not None:
-                        clamped = max(clamped, lo)
-                    if abs(clamped - pos_val) > 1e-4:
-                        self.log(f"[LIMIT] {letter} position clamped {pos_val:.3f} -> {clamped:.3f} mm")
-                    result.append(f"{letter}{clamped:.3f}")
-                    self._current_pos[letter] = clamped
-                except ValueError:
-                    result.append(tok)
+                lo = pos_min.get(letter)
+                hi = pos_max.get(letter)
+                clamped = value
+                if hi is not None:
+                    clamped = min(clamped, hi)
+                if lo is not None:
+                    clamped = max(clamped, lo)
+                if abs(clamped - value) > 1e-4:
+                    self.log(f"[LIMIT] {letter} position clamped {value:.3f} -> {clamped:.3f} mm")
+                changed |= line.set_word(i, clamped, f"{letter}{clamped:.3f}")
+                self._current_pos[letter] = clamped
 
             elif letter in "XYZ" and self._relative_mode:
-                try:
-                    delta = float(tok[1:])
-                    cur = self._current_pos.get(letter, 0.0)
-                    new_pos = cur + delta
-                    lo = pos_min.get(letter)
-                    hi = pos_max.get(letter)
-                    if hi is not None:
-                        new_pos = min(new_pos, hi)
-                    if lo is not None:
-                        new_pos = max(new_pos, lo)
-                    clamped_delta = new_pos - cur
-                    if abs(clamped_delta - delta) > 1e-4:
-                        self.log(f"[LIMIT] {letter} relative delta clamped {delta:.3f} -> {clamped_delta:.3f} mm")
-                    result.append(f"{letter}{clamped_delta:.3f}")
-                    self._current_pos[letter] = new_pos
-                except ValueError:
-                    result.append(tok)
-
-            else:
-                result.append(tok)
-
-        return " ".join(result)
+                cur = self._current_pos.get(letter, 0.0)
+                new_pos = cur + value
+                lo = pos_min.get(letter)
+                hi = pos_max.get(letter)
+                if hi is not None:
+                    new_pos = min(new_pos, hi)
+                if lo is not None:
+                    new_pos = max(new_pos, lo)
+                clamped_delta = new_pos - cur
+                if abs(clamped_delta - value) > 1e-4:
+                    self.log(f"[LIMIT] {letter} relative delta clamped {value:.3f} -> {clamped_delta:.3f} mm")
+                changed |= line.set_word(i, clamped_delta, f"{letter}{clamped_delta:.3f}")
+                self._current_pos[letter] = new_pos
+
+        return changed
 
     def load_marlin_config(self):
         try:
             marlin_config = marlin_config_manager.load_settings()
             self.apply_marlin_settings(marlin_config)
             self._load_machine_limits(marlin_config)
+            self.motion_estimator = MotionEstimator(marlin_config or {})
             self.log("[INFO] Marlin settings loaded and applied.")
         except Exception as e:
             self.log(f"[ERROR] Failed to load Marlin settings: {e}")
@@ -935,8 +1118,6 @@ class GCodeControl:
         """Drive to X/Y physical endstops, capture position, store as min limits in memory."""
         def _run():
             self.log("[INFO] Endstop detection: disabling soft endstops, driving to X/Y endstops.")
-            self._endstop_pos_event.clear()
-            self._endstop_detection_pending = False
 
             # Disable soft endstops and set a fake origin so Marlin allows the move
             self.send_command("M211 S0")
@@ -947,16 +1128,26 @@ class GCodeControl:
             self.send_command("G90")
             self.send_command("G1 X-500 Y-500 F3000")
 
-            # M400 waits for all motion to finish; arm the flag then read position
-            self.send_command("M400")
-            self._endstop_detection_pending = True
-            self.send_command("M114")
-
-            if not self._endstop_pos_event.wait(timeout=60):
+            # Only read the position once the gantry has stopped: M154 auto-reports
+            # sent while it is still travelling must not become the min limits.
+            if self.send_command("M400", wait_for_completion=True, timeout=120) is None:
+                self.log("[WARN] Endstop detection: the move to the endstops did not finish.")
+                self.send_command("M211 S1")
+                return
+            parsed = {}
+            reactor = self._reactor
+            if reactor is not None and reactor.is_alive():
+                txn = reactor.submit(["M114"], source="DIRECT")
+                if txn.wait(timeout=5.0) and txn.ok_line is not None:
+                    # Lines received while this M114 was the oldest in flight; an
+                    # auto-report among them is taken at rest too, the last one wins.
+                    for line in txn.responses:
+                        parsed = parse_position(line) or parsed
+            if not parsed:
                 self.log("[WARN] Endstop detection timed out — no M114 response received.")
-                self._endstop_detection_pending = False
                 self.send_command("M211 S1")
                 return
+            self.machine_limits["position_min"] = parsed
 
             self.log(f"[INFO] Physical min limits set: {self.machine_limits.get('position_min', {})}")
 
@@ -977,11 +1168,25 @@ class GCodeControl:
             logging.getLogger(__name__).info(str(message))
 
     # External command dispatch
-    def send_to_x(self, gcode): self.x_motor_queue.put(gcode)
-    def send_to_y(self, gcode): self.y_motor_queue.put(gcode)
-    def send_to_z(self, gcode): self.z_motor_queue.put(gcode)
-    def send_to_aux(self, action): self.aux_queue.put(action)
-    def send_to_control(self, gcode): self.control_queue.put(gcode)
+    def send_to_x(self, gcode): self._enqueue("X_motor", gcode)
+    def send_to_y(self, gcode): self._enqueue("Y_motor", gcode)
+    def send_to_z(self, gcode): self._enqueue("Z_motor", gcode)
+    def send_to_aux(self, action): self._enqueue("AUX", action)
+    def send_to_control(self, gcode): self._enqueue("CONTROL", gcode)
+
+    def _enqueue(self, lane: str, command, tag: str = None):
+        cmd = self._as_command(command)
+        tags = [tag]
+        if cmd.is_motion:
+            tags.append("motion")
+        if cmd.is_jog:
+            tags.append(f"jog:{lane}")
+        self.scheduler.put(lane, cmd, tags)
+        self._wake_reactor()
+
+    def _wake_reactor(self):
+        if self._reactor is not None:
+            self._reactor.wake()
 
 
 
@@ -1038,6 +1243,16 @@ class GCodeControl:
             self.new_command(command)
         self.log(f"[LED] -> M106 S{s}")
 
+    def submit_led_pwm(self, s_value: int) -> CommandHandle:
+        """Like send_led_pwm(), but through the scheduler: handle.acked resolves once
+        the firmware has applied the PWM. M106 shares the FIFO of control and motion
+        commands, so it is sent (and acknowledged) only after the moves queued before
+        it, and after any M400 among them has finished."""
+        s = max(0, min(255, int(s_value)))
+        handle = self.submit_command(f"M106 S{s}", wait_motion=False)
+        self.log(f"[LED] -> M106 S{s}")
+        return handle
+
     def _clear_command_sender_commands(self, predicate=None) -> int:
         if not self.command_sender:
             return 0
@@ -1055,10 +1270,45 @@ class GCodeControl:
     def clear_pending_motion_commands_full(self) -> int:
         return self._clear_command_sender_commands(self._is_motion_command) + self.clear_pending_motion_commands()
 
+    def send_emergency(self, command: str) -> bool:
+        """Write M112 / M410 / M108 immediately, ahead of every queued and in-flight command."""
+        cmd = self._as_command(command)
+        if cmd.code not in EMERGENCY_CODES:
+            self.log(f"[WARN] send_emergency: {cmd.log_text()} is not an emergency command")
+            return False
+        if not self.connected or not self.ser:
+            self.log(f"[WARN] send_emergency - not connected ({cmd.text} not sent)")
+            return False
+        try:
+            reactor = self._reactor
+            if reactor is not None and reactor.is_alive():
+                if cmd.code == "M410":
+                    # Also stops the lines already on their way to the planner.
+                    reactor.quickstop()
+                else:
+                    # M112 halts the firmware: no "ok" will follow.
+                    reactor.emergency_write(cmd.text, expect_ok=cmd.code != "M112")
+            else:
+                with self.lock:
+                    self.ser.write((cmd.text + "\n").encode('utf-8'))
+                    self.ser.flush()
+        except Exception as e:
+            self.log(f"[ERROR] Failed to send {cmd.text}: {e}")
+            return False
+        return True
+
+    def quick_stop(self, disable_steppers: bool = True) -> bool:
+        """M410 on the fast lane, drop queued motion, optionally M18. Firmware stays alive."""
+        ok = self.send_emergency("M410")
+        self.clear_pending_motion_commands_full()
+        if ok and disable_steppers:
+            self.send_command("M18\n")
+        return ok
+
     def send_emergency_stop(self) -> None:
         self.set_emergency_latched(True)
         if self.connected and self.ser:
-            self.send_command("M112\n")
+            self.send_emergency("M112")
         else:
             self.log("[WARN] Failed to dispatch emergency stop command (M112).")
         self.log("[EMERGENCY STOP] Immediate machine stop!")
@@ -1111,18 +1361,30 @@ class GCodeControl:
         """Hard-disconnect: stop motion and close the port cleanly.
         Does NOT send M112 (kills STM32 firmware until power cycle).
         Uses M410 (quickstop) + M18 (steppers off) instead."""
-        # 1. Stop motion directly on the wire, bypassing the queue
+        # 1. Stop motion on the reactor's fast lane, bypassing the queue
+        reactor = self._reactor
         try:
             if self.ser and self.ser.is_open:
-                with self.lock:
-                    self.ser.write(b"M410\n")
-                    self.ser.write(b"M18\n")
-                    self.ser.flush()
-                self.log("[INFO] force_disconnect: M410 + M18 sent (thread-safe).")
+                self.send_emergency("M410")
+                if reactor is not None and reactor.is_alive():
+                    reactor.emergency_write("M18", expect_ok=False)
+                else:
+                    with self.lock:
+                        self.ser.write(b"M18\n")
+                        self.ser.flush()
+                self.log("[INFO] force_disconnect: M410 + M18 sent.")
         except Exception as e:
             self.log(f"[WARN] force_disconnect: Could not write stop commands: {e}")
 
-        # 2. Close the port
+        # 2. Stop the serial reactor before closing the port under it;
+        #    queued commands stay until cleared or reconnected
+        self.running = False
+        if reactor is not None:
+            reactor.stop()
+            reactor.join(timeout=1.0)
+            self._reactor = None
+
+        # 3. Close the port
         try:
             if self.ser and self.ser.is_open:
                 self.ser.close()
@@ -1130,47 +1392,36 @@ class GCodeControl:
         except Exception as e:
             self.log(f"[WARN] force_disconnect: Could not close serial port: {e}")
 
-        # 3. Poison the command queues so worker threads exit gracefully
-        self.running = False
-        for q in (self.x_motor_queue, self.y_motor_queue, self.z_motor_queue, self.aux_queue, self.control_queue):
-            try:
-                q.put_nowait("STOP")
-            except Exception:
-                pass
-
         self.ser = None
         self.set_connected(False)
+        self.position_autoreport_interval = 0
         self.log("[EMERGENCY] force_disconnect complete.")
 
     def stop_threads(self):
         """Stop threads cleanly and close the connection."""
         try:
+            if self.position_autoreport_interval:
+                self.send_command("M154 S0\n")  # stop auto-report before the port closes
+                self.position_autoreport_interval = 0
             self.send_command("M107\n")  # Fan/LED OFF
-            time.sleep(0.05)
             # Do NOT send M0 — on Creality firmware it blocks serial until LCD button press,
             # making the board unreachable on next app start without a power cycle.
             self.send_command("M18\n")   # Motors off
-            time.sleep(0.05)
         except Exception as e:
             self.log(f"[WARN] Failed to send shutdown commands: {e}")
 
 
         self.running = False
-        self.x_motor_queue.put("STOP")
-        self.y_motor_queue.put("STOP")
-        self.z_motor_queue.put("STOP")
-        self.aux_queue.put("STOP")
-        self.control_queue.put("STOP")
-
-        try:
-            self.x_thread.join(timeout=2)
-            self.y_thread.join(timeout=2)
-            self.z_thread.join(timeout=2)
-            self.aux_thread.join(timeout=2)
-            self.control_thread.join(timeout=2)
-            self.log("[INFO] Threads stopped successfully.")
-        except Exception as e:
-            self.log(f"[ERROR] Error occurred while stopping threads: {e}")
+        reactor = self._reactor
+        if reactor is not None:
+            try:
+                # Let the shutdown commands reach the firmware before closing the port.
+                reactor.stop(drain_timeout=1.0)
+                reactor.join(timeout=2)
+                self.log("[INFO] Threads stopped successfully.")
+            except Exception as e:
+                self.log(f"[ERROR] Error occurred while stopping threads: {e}")
+            self._reactor = None
 
         # --- Disconnect ---
         try:
@@ -1182,10 +1433,3 @@ class GCodeControl:
 
         self.ser = None
         self.set_connected(False)
-
-        self.response_running = False
-        if hasattr(self, "response_thread"):
-            self.response_thread.join(timeout=2)
-            self.log("[INFO] Response listener thread stopped.")
-
-
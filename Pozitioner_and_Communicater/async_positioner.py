@@ -0,0 +1,69 @@
+# Pozitioner_and_Communicater/async_positioner.py
+#
+# asyncio front-end for automation scripts. Runs alongside the thread-based
+# GCodeControl: commands still go through its queues and the serial reactor
+# (the single reader/writer of the port), and every await is backed by the
+# CommandHandle futures that the reactor resolves. Nothing here blocks the
+# event loop, so image analysis of the next plate can overlap motion.
+#
+#   machine = AsyncPositioner(main_window.g_control)
+#   await machine.move(x=120, y=80, f=6000)
+#   pos = await machine.query_position()
+
+import asyncio
+
+from Pozitioner_and_Communicater.G_communicate import parse_position
+
+
+class AsyncPositioner:
+    def __init__(self, g_control, timeout: float = 120.0):
+        self.g_control = g_control
+        self.timeout = timeout  # default upper bound for a single await
+
+    # ---------- low level ----------
+    async def send(self, command: str, wait_motion: bool = False, timeout=None):
+        """Queue a command and await its completion. Returns the CommandHandle."""
+        handle = self.g_control.submit_command(command, wait_motion=wait_motion)
+        await asyncio.wait_for(asyncio.wrap_future(handle.completed), timeout or self.timeout)
+        return handle
+
+    async def ack(self, command: str, timeout=None):
+        """Queue a command and await only the firmware's "ok" for it (not motion end)."""
+        handle = self.g_control.submit_command(command, wait_motion=False)
+        await asyncio.wait_for(asyncio.wrap_future(handle.acked), timeout or self.timeout)
+        return handle
+
+    # ---------- motion ----------
+    async def move(self, x=None, y=None, z=None, f=None, wait: bool = True, timeout=None):
+        """Absolute G0 move. With wait=True, returns once the gantry has stopped."""
+        parts = ["G0"]
+        for letter, value in (("X", x), ("Y", y), ("Z", z)):
+            if value is not None:
+                parts.append(f"{letter}{float(value):.3f}")
+        if len(parts) == 1:
+            raise ValueError("move() needs at least one of x, y, z")
+        if f is not None:
+            parts.append(f"F{int(f)}")
+        command = " ".join(parts)
+        if wait:
+            return await self.send(command, wait_motion=True, timeout=timeout)
+        return await self.ack(command, timeout=timeout)
+
+    async def wait_idle(self, timeout=None):
+        """Resolve when every previously queued move has finished (M400)."""
+        # M400 is queued behind the moves (control and motion share one FIFO).
+        await self.send("M400", timeout=timeout)
+
+    # ---------- queries ----------
+    async def query_position(self, timeout=None) -> dict:
+        """Current position reported by M114, e.g. {'X': 10.0, 'Y': 20.0, 'Z': 5.0}."""
+        handle = await self.send("M114", timeout=timeout)
+        for line in handle.responses:
+            pos = parse_position(line)
+            if pos:
+                return pos
+        raise RuntimeError("M114 reply did not contain a position")
+
+    async def query_endstops(self, timeout=None) -> str:
+        handle = await self.send("M119", timeout=timeout)
+        return "\n".join(handle.responses)
@@ -0,0 +1,297 @@
+# Pozitioner_and_Communicater/batch_scheduler.py
+#
+# Unattended multi-plate run: capture -> detect -> pick for every plate of a
+# batch (plates come from dish_profiles.yaml entries with a plate_position).
+# The gantry is the bottleneck, so detection runs on a worker thread while the
+# gantry keeps going:
+#
+#   gantry:  capture 1, capture 2, pick 1, capture 3, pick 2, capture 4, pick 3, ...
+#   worker:            detect 1,   detect 2,         detect 3, ...
+#
+# Detection of plate N+1 therefore overlaps picking of plate N, and the gantry
+# only waits for a detection that is not finished yet.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Image_processing.BacteriaDetector import BacteriaDetector
+from Image_processing.petri_detector import PetriDetector
+from Pozitioner_and_Communicater.picking_executor import PickingExecutor, DEFAULT_SEQUENCE
+from Pozitioner_and_Communicater.route_optimizer import optimize_route
+
+BATCH_TAG = "batch"
+
+
+class Plate:
+    """One plate of a batch.
+
+    position:   gantry XY (mm) the camera is moved to before the capture.
+    offset:     mm added to the calibrated targets; for a camera riding on the
+                gantry this is position minus the position used for calibration.
+    roi_points: manual pixel points from the dish profile, picked in addition
+                to the detected colonies.
+    """
+
+    def __init__(self, plate_id, position, offset=(0.0, 0.0), roi_points=None):
+        self.plate_id = str(plate_id)
+        self.position = (float(position[0]), float(position[1]))
+        self.offset = (float(offset[0]), float(offset[1]))
+        self.roi_points = [(int(x), int(y)) for x, y in (roi_points or [])]
+        self.frame = None
+        self.points = []       # pixel points, route order
+        self.targets = []      # gantry mm, route order
+        self.picked = 0
+
+    def __repr__(self):
+        return f"<Plate {self.plate_id} @ {self.position}>"
+
+
+class ColonyDetector:
+    """Default detection: petri dish mask, then colony centres inside it."""
+
+    def __init__(self, petri_params=None, detector=None):
+        self.petri = PetriDetector()
+        pp = petri_params or {}
+        self.petri.set_params(int(pp.get("circle_blur", 7)), int(pp.get("circle_sensitivity", 30)))
+        self.detector = detector or BacteriaDetector()
+
+    def __call__(self, frame):
+        mask = self.petri.detect(frame)
+        _overlay, centers, _objects = self.detector.detect(frame, mask)
+        return list(centers)
+
+
+class BatchScheduler:
+    """Runs a list of Plates on its own thread.
+
+    capture_frame() must return a BGR frame taken after it was called (the gantry
+    has stopped over the plate by then). transform is a calibration_manager
+    PixelToGantry or None (pixels are used as mm, as in the manual pipeline).
+
+    listener(event, *args) is called from the batch thread:
+        ("captured", plate) ("detected", plate) ("progress", plate, idx)
+        ("plate_done", plate) ("finished", plates) ("stopped", plates)
+        ("failed", plate, message)
+    Exactly one of finished / stopped / failed ends every run.
+    """
+
+    def __init__(self, g_control, plates, capture_frame, detect=None, transform=None,
+                 feedrate: float = 6000, sequence=DEFAULT_SEQUENCE, window: int = 4,
+                 settle_time: float = 0.3, listener=None, journal_factory=None):
+        self.g_control = g_control
+        self.plates = list(plates)
+        self.capture_frame = capture_frame
+        self.detect = detect or ColonyDetector()
+        self.transform = transform
+        self.feedrate = feedrate
+        self.sequence = list(sequence)
+        self.window = window
+        self.settle_time = float(settle_time)
+        self.listener = listener
+        self.journal_factory = journal_factory   # plate -> JobJournal or None
+        self.state = "idle"
+        self._thread = None
+        self._executor = None
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._lock = threading.Lock()
+
+    # ---------- control ----------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.state = "running"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        """Finish the targets already sent to the firmware, then hold."""
+        with self._lock:
+            if self.state != "running":
+                return
+            self.state = "paused"
+            self._resume.clear()
+            if self._executor is not None:
+                self._executor.pause()
+
+    def resume(self):
+        with self._lock:
+            if self.state != "paused":
+                return
+            self.state = "running"
+            if self._executor is not None:
+                self._executor.resume()
+            self._resume.set()
+
+    def stop(self):
+        with self._lock:
+            if self.state in ("idle", "finished", "stopped"):
+                return
+            self.state = "stopped"
+            self._stop.set()
+            self._resume.set()
+            executor = self._executor
+        # Both paths end in the reactor's quickstop, which also stops lines already
+        # in the firmware's command buffer (SerialReactor.quickstop).
+        if executor is not None:
+            executor.stop()
+        self.g_control.cancel_tag(BATCH_TAG)
+        if executor is None:
+            self.g_control.send_emergency("M410")   # a move to a capture position
+
+    def wait(self, timeout=None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state in ("finished", "stopped", "failed")
+
+    # ---------- batch thread ----------
+    def _run(self):
+        plates = self.plates
+        completed = self._run_plates(plates)
+        if completed and self.state == "running":
+            self.state = "finished"
+            self._emit("finished", plates)
+        elif self.state == "stopped":
+            self._emit("stopped", plates)
+
+    def _run_plates(self, plates) -> bool:
+        """True once every plate was picked; False after a stop or a failure."""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-detect") as pool:
+            pending = {}   # plate index -> Future of the detection
+            try:
+                for i in range(min(2, len(plates))):
+                    if not self._capture(plates[i]):
+                        return False
+                    pending[i] = pool.submit(self._locate, plates[i])
+                for i, plate in enumerate(plates):
+                    pending.pop(i).result()   # usually finished while the gantry was busy
+                    self._emit("detected", plate)
+                    if not self._pick(plate):
+                        return False
+                    nxt = i + 2
+                    if nxt < len(plates):
+                        if not self._capture(plates[nxt]):
+                            return False
+                        pending[nxt] = pool.submit(self._locate, plates[nxt])
+            except Exception as e:
+                self._fail(None, str(e))
+                return False
+        return True
+
+    def _checkpoint(self) -> bool:
+        """Block while paused; False once stopped."""
+        self._resume.wait()
+        return not self._stop.is_set()
+
+    def _capture(self, plate) -> bool:
+        if not self._checkpoint():
+            return False
+        x, y = plate.position
+        handle = self.g_control.submit_command(f"G0 X{x:.3f} Y{y:.3f} F{int(self.feedrate)}",
+                                               wait_motion=True, tag=BATCH_TAG)
+        if not handle.wait(120):
+            if not self._stop.is_set():
+                self._fail(plate, "move to capture position failed")
+            return False
+        time.sleep(self.settle_time)
+        if not self._checkpoint():
+            return False
+        plate.frame = self.capture_frame()
+        if plate.frame is None:
+            self._fail(plate, "no camera frame")
+            return False
+        self._emit("captured", plate)
+        return True
+
+    def _locate(self, plate):
+        """Worker thread: detect, calibrate and route one plate."""
+        pts = plate.roi_points + [(int(x), int(y)) for x, y in self.detect(plate.frame)]
+        if not pts:
+            plate.points, plate.targets = [], []
+            return plate
+        h, w = plate.frame.shape[:2]
+        if self.transform is not None:
+            mm = [(float(x), float(y)) for x, y in self.transform(pts, (w, h))]
+        else:
+            mm = [(float(x), float(y)) for x, y in pts]
+        mm = [(round(x + plate.offset[0], 3), round(y + plate.offset[1], 3)) for x, y in mm]
+        max_feedrate = self.g_control.get_motion_estimator().max_feedrate
+        order = optimize_route(mm, start=plate.position, feedrate=self.feedrate, max_feedrate=max_feedrate)
+        plate.points = [pts[k] for k in order]
+        plate.targets = [mm[k] for k in order]
+        return plate
+
+    def _pick(self, plate) -> bool:
+        if not plate.targets:
+            self._emit("plate_done", plate)
+            return self._checkpoint()
+        done = threading.Event()
+        outcome = {}
+        journal = None
+        if self.journal_factory is not None:
+            try:
+                journal = self.journal_factory(plate)
+            except OSError as e:
+                # Same as the manual run: pick the plate anyway, it just cannot be resumed.
+                self.g_control.log(f"[WARN] Plate {plate.plate_id}: job journal unavailable: {e}")
+
+        def on_event(event, *args):
+            nonlocal journal
+            if event == "progress":
+                plate.picked = args[0] + 1
+                if journal is not None:
+                    try:
+                        journal.record_pick(args[0])
+                    except OSError as e:
+                        self.g_control.log(f"[WARN] Plate {plate.plate_id}: job journal write failed: {e}")
+                        journal = None
+                self._emit("progress", plate, args[0])
+            elif event in ("finished", "failed", "stopped"):
+                outcome["event"] = event
+                outcome["args"] = args
+                done.set()
+
+        executor = PickingExecutor(self.g_control, plate.targets, self.sequence,
+                                   feedrate=self.feedrate, window=self.window, listener=on_event)
+        with self._lock:
+            if self.state == "stopped":
+                return False
+            self._executor = executor
+            executor.start()
+            if self.state == "paused":
+                executor.pause()
+        done.wait()     # the executor ends with finished, failed or stopped (see stop())
+        with self._lock:
+            self._executor = None
+        if journal is not None:
+            try:
+                if outcome.get("event") == "finished":
+                    journal.finish("done")
+                else:
+                    journal.close()
+            except OSError as e:
+                self.g_control.log(f"[WARN] Plate {plate.plate_id}: job journal not closed: {e}")
+        if outcome.get("event") == "failed":
+            self._fail(plate, outcome["args"][0])
+            return False
+        if outcome.get("event") != "finished":
+            return False
+        self._emit("plate_done", plate)
+        return True
+
+    def _fail(self, plate, message):
+        with self._lock:
+            if self.state == "stopped":
+                return
+            self.state = "failed"
+        self._emit("failed", plate, message)
+
+    def _emit(self, event, *args):
+        if self.listener is not None:
+            try:
+                self.listener(event, *args)
+            except Exception as e:
+                self.g_control.log(f"[ERROR] Batch listener failed on {event!r}: {e}")
@@ -0,0 +1,84 @@
+# Pozitioner_and_Communicater/command_handle.py
+#
+# Completion handle for a queued G-code command. Lets callers react to the
+# firmware's reply instead of polling has_pending_motion_commands().
+
+from concurrent.futures import Future
+
+
+class CommandHandle:
+    """Returned by GCodeControl.submit_command().
+
+    acked:     resolves with the firmware's "ok" for the command line(s) itself.
+    completed: resolves once the command has finished executing. For motion
+               commands submitted with wait_motion=True this is the "ok" of the
+               trailing M400, i.e. the gantry has stopped; otherwise it equals acked.
+
+    streamed:  never follow the command with an M400, even in stop-and-wait mode;
+               the caller paces a stream of moves itself (JogEngine).
+
+    On rejection, timeout, queue clear or reactor shutdown both futures carry an exception.
+    """
+
+    def __init__(self, command: str, wait_motion: bool = True, streamed: bool = False):
+        self.command = command
+        self.wait_motion = bool(wait_motion)
+        self.streamed = bool(streamed) and not self.wait_motion
+        self.responses = []  # every line the firmware sent while this command was oldest in flight
+        self.acked = Future()
+        self.completed = Future()
+
+    def __repr__(self):
+        state = "done" if self.completed.done() else ("acked" if self.acked.done() else "pending")
+        return f"<CommandHandle {self.command.strip()!r} {state}>"
+
+    def done(self) -> bool:
+        return self.completed.done()
+
+    def wait(self, timeout=None) -> bool:
+        """Block until completed. Returns False on timeout or failure."""
+        try:
+            self.completed.result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def add_done_callback(self, fn):
+        """fn(handle) is called on completion, from the serial reactor thread (or immediately if already done)."""
+        self.completed.add_done_callback(lambda _f: fn(self))
+
+    def cancel(self, reason: str = "cancelled"):
+        self._fail(RuntimeError(reason))
+
+    # ---------- called by GCodeControl / SerialReactor ----------
+    def _set_acked(self, ok_line):
+        self._set(self.acked, ok_line)
+
+    def _set_completed(self, ok_line):
+        self._set(self.acked, ok_line)
+        self._set(self.completed, ok_line)
+
+    def _fail(self, exc: BaseException):
+        for fut in (self.acked, self.completed):
+            if not fut.done():
+                try:
+                    fut.set_exception(exc)
+                except Exception:
+                    pass  # resolved concurrently
+
+    @staticmethod
+    def _set(fut: Future, value):
+        if not fut.done():
+            try:
+                fut.set_result(value)
+            except Exception:
+                pass  # cancelled by the caller or resolved concurrently
+
+    def _finish(self, txn):
+        """Resolve from a finished SerialTransaction."""
+        self.responses = list(txn.responses)
+        if txn.error:
+            exc = TimeoutError(f"no 'ok' for {self.command.strip()!r}") if txn.error == "timeout" else RuntimeError(txn.error)
+            self._fail(exc)
+        else:
+            self._set_completed(txn.ok_line)
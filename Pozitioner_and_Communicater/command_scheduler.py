@@ -0,0 +1,153 @@
+# Pozitioner_and_Communicater/command_scheduler.py
+#
+# Priority scheduler for queued G-code. Replaces the five independent
+# queue.Queues of GCodeControl: the serial reactor always takes the next item
+# from the highest non-empty priority class, and queued items can be cancelled
+# by tag without draining and re-putting whole queues.
+#
+# Lanes inside one class are served strictly in submission order. Control and
+# motion share a class on purpose: modal commands (G90/G91/G92/M211) change how
+# the moves queued after them are interpreted, so they must neither overtake nor
+# fall behind single-axis moves. The lanes only name what is queued (for
+# cancellation, jog coalescing and pending counts).
+#
+# Emergency commands (M112/M410/M108) are never queued here; they take the
+# reactor's fast lane (SerialReactor.emergency_write) so their latency does not
+# depend on how many moves are waiting.
+
+import threading
+from collections import deque
+
+PRIORITY_EMERGENCY = 0  # fast lane, bypasses the scheduler
+PRIORITY_MOTION = 1     # control, axis moves and M42, one FIFO
+PRIORITY_TELEMETRY = 2
+
+EMERGENCY_CODES = frozenset(("M112", "M410", "M108"))
+
+
+class _Entry:
+    __slots__ = ("item", "lane", "tags", "seq", "cancelled")
+
+    def __init__(self, item, lane, tags, seq):
+        self.item = item
+        self.lane = lane
+        self.tags = tags
+        self.seq = seq
+        self.cancelled = False
+
+
+class CommandScheduler:
+    """Priority classes of named lanes with O(1) per-item cancellation by tag.
+
+    lanes: list of (lane_name, priority); within a priority class items come out
+    in the order they were put, whatever their lane. Cancelled entries are only
+    flagged and skipped when popped, so cancel_tag() costs O(items with that tag),
+    never a scan of everything that is queued.
+    """
+
+    def __init__(self, lanes):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._live = {}                 # lane -> number of non-cancelled entries
+        self._classes = {}              # priority -> [lane, ...]
+        for name, priority in lanes:
+            self._queues[name] = deque()
+            self._live[name] = 0
+            self._classes.setdefault(priority, []).append(name)
+        self._order = sorted(self._classes)
+        self._seq = 0
+        self._tags = {}                 # tag -> set of live entries
+
+    # ---------- producers ----------
+    def put(self, lane: str, item, tags=()):
+        with self._lock:
+            self._seq += 1
+            entry = _Entry(item, lane, tuple(t for t in tags if t), self._seq)
+            self._queues[lane].append(entry)
+            self._live[lane] += 1
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(entry)
+        return entry
+
+    # ---------- consumer (serial reactor) ----------
+    def pop(self):
+        """Next (lane, item) by priority, oldest first within a class; None when nothing is queued."""
+        with self._lock:
+            for priority in self._order:
+                head = None
+                for lane in self._classes[priority]:
+                    if not self._live[lane]:
+                        continue
+                    q = self._queues[lane]
+                    while q[0].cancelled:
+                        q.popleft()
+                    if head is None or q[0].seq < head.seq:
+                        head = q[0]
+                if head is not None:
+                    self._queues[head.lane].popleft()
+                    self._forget(head)
+                    return head.lane, head.item
+        return None
+
+    # ---------- cancellation ----------
+    def cancel_tag(self, tag: str) -> list:
+        """Cancel every queued item carrying tag. Returns the cancelled items."""
+        with self._lock:
+            entries = self._tags.pop(tag, None)
+            if not entries:
+                return []
+            for entry in entries:
+                entry.cancelled = True
+                self._live[entry.lane] -= 1
+                self._untag(entry, skip=tag)
+            return [e.item for e in entries]
+
+    def clear(self, lanes=None) -> list:
+        """Drop everything queued in lanes (default: all). Returns the dropped items."""
+        dropped = []
+        with self._lock:
+            for lane in (lanes or list(self._queues)):
+                q = self._queues[lane]
+                self._queues[lane] = deque()
+                self._live[lane] = 0
+                for entry in q:
+                    if entry.cancelled:
+                        continue
+                    entry.cancelled = True
+                    self._untag(entry)
+                    dropped.append(entry.item)
+        return dropped
+
+    def _forget(self, entry):
+        self._live[entry.lane] -= 1
+        self._untag(entry)
+
+    def _untag(self, entry, skip=None):
+        for tag in entry.tags:
+            if tag == skip:
+                continue
+            tagged = self._tags.get(tag)
+            if tagged is not None:
+                tagged.discard(entry)
+                if not tagged:
+                    del self._tags[tag]
+
+    # ---------- inspection ----------
+    def pending(self, lanes=None) -> int:
+        with self._lock:
+            return sum(self._live[lane] for lane in (lanes or self._live))
+
+    def items(self, lanes=None) -> list:
+        """Queued items in the order pop() would return them."""
+        with self._lock:
+            out = []
+            for priority in self._order:
+                entries = [e for lane in self._classes[priority] if lanes is None or lane in lanes
+                           for e in self._queues[lane] if not e.cancelled]
+                entries.sort(key=lambda e: e.seq)
+                out.extend(e.item for e in entries)
+            return out
+
+    def pending_tag(self, tag: str) -> int:
+        with self._lock:
+            return len(self._tags.get(tag, ()))
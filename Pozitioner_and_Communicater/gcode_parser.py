@@ -0,0 +1,136 @@
+# Pozitioner_and_Communicater/gcode_parser.py
+#
+# Single-pass G-code tokenizer. A command string ("G91\nG1 X5 F3000") is parsed
+# once into a GCodeCommand that carries its classification (motion, jog, axes,
+# feedrate) through dispatch, clamping and the queues, instead of every stage
+# re-splitting and substring-testing the text.
+
+import re
+
+# "G1", "M400", "T0" at the start of a line
+_CODE_RE = re.compile(r"([GMT]\d+(?:\.\d+)?)")
+# one parameter word: letter + optional number ("X-12.5", "F6000", "S")
+_WORD_RE = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))?")
+
+MOTION_CODES = frozenset(("G0", "G1"))
+# commands whose argument is free text, not parameter words
+_TEXT_ARG_CODES = frozenset(("M23", "M28", "M30", "M32", "M117", "M118", "M928"))
+_AXES = frozenset("XYZ")
+
+
+class GCodeLine:
+    """One G-code line: primary code plus its parameter words."""
+
+    __slots__ = ("code", "words", "text")
+
+    def __init__(self, code: str, words: list, text: str):
+        self.code = code        # "G1", "M400" or "" (no command word)
+        self.words = words      # [[letter, float|None, raw_token], ...]
+        self.text = text        # rendered line, kept in sync by set_word()
+
+    def get(self, letter: str, default=None):
+        for w in self.words:
+            if w[0] == letter:
+                return w[1]
+        return default
+
+    def set_word(self, index: int, value: float, token: str) -> bool:
+        """Replace a word; returns True if the rendered text changed."""
+        word = self.words[index]
+        if word[2] == token:
+            return False
+        word[1] = value
+        word[2] = token
+        self.text = " ".join([self.code] + [w[2] for w in self.words]) if self.code else " ".join(w[2] for w in self.words)
+        return True
+
+
+def parse_line(text: str):
+    """Parse one line (upper-cased, comments stripped). Returns None for blank lines."""
+    original = str(text).split(";", 1)[0].strip()
+    if not original:
+        return None
+    line = original.upper()
+    match = _CODE_RE.match(line)
+    code = match.group(1) if match else ""
+    rest = line[match.end():] if match else line
+    if code in _TEXT_ARG_CODES:
+        # keep the message's case ("M117 Homing...")
+        return GCodeLine(code, [], code + original[match.end():])
+    words = []
+    for m in _WORD_RE.finditer(rest):
+        raw_num = m.group(2)
+        try:
+            value = float(raw_num) if raw_num not in (None, "", "+", "-", ".") else None
+        except ValueError:
+            value = None
+        words.append([m.group(1), value, m.group(1) + (raw_num or "")])
+    return GCodeLine(code, words, line)
+
+
+class GCodeCommand:
+    """A queued command (one or more lines), parsed once.
+
+    handle is the optional CommandHandle of submit_command(); it rides along
+    through the queues so the reactor can resolve it.
+    """
+
+    __slots__ = ("lines", "text", "axes", "feedrate", "is_motion", "is_jog", "is_xy_move", "handle")
+
+    def __init__(self, lines, handle=None):
+        self.lines = lines
+        self.handle = handle
+        self.refresh()
+
+    def refresh(self):
+        """Recompute text and flags after words were changed (e.g. by clamping)."""
+        lines = self.lines
+        self.text = "\n".join(l.text for l in lines)
+        axes = set()
+        feedrate = None
+        is_motion = False
+        for l in lines:
+            if l.code in MOTION_CODES:
+                is_motion = True
+                for w in l.words:
+                    if w[0] in _AXES:
+                        axes.add(w[0])
+                    elif w[0] == "F" and w[1] is not None:
+                        feedrate = w[1]
+        self.axes = frozenset(axes)
+        self.feedrate = feedrate
+        self.is_motion = is_motion
+        # manual jog = "G91\nG1 X.. / Y.." exactly
+        self.is_jog = (
+            len(lines) == 2
+            and lines[0].code == "G91"
+            and lines[1].code == "G1"
+            and bool(self.axes & {"X", "Y"})
+        )
+        self.is_xy_move = bool(lines) and lines[0].code in MOTION_CODES and {"X", "Y"} <= self.axes
+
+    @property
+    def code(self) -> str:
+        return self.lines[0].code if self.lines else ""
+
+    @property
+    def is_emergency_allowed(self) -> bool:
+        return self.code in ("M112", "M999")
+
+    def line_texts(self) -> list:
+        return [l.text for l in self.lines]
+
+    def log_text(self) -> str:
+        return " | ".join(l.text for l in self.lines)
+
+    def __repr__(self):
+        return f"<GCodeCommand {self.log_text()!r}>"
+
+
+def parse_command(text, handle=None) -> GCodeCommand:
+    lines = []
+    for raw in str(text).replace("\r", "\n").split("\n"):
+        line = parse_line(raw)
+        if line is not None:
+            lines.append(line)
+    return GCodeCommand(lines, handle)
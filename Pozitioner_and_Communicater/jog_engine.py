@@ -0,0 +1,148 @@
+# Pozitioner_and_Communicater/jog_engine.py
+#
+# Continuous manual jog as one constant-velocity move. Instead of a GUI timer
+# emitting "G91 / G1 X<step>" pairs every 14-16 ms, the engine streams equal
+# G1 segments while the key is held and keeps only `lookahead_time` seconds of
+# motion ahead of the machine: enough for Marlin's planner to join the
+# collinear segments at full speed, small enough that a release stops quickly.
+# On release the queued segments are dropped and, by default, M410 discards
+# what is still in the planner.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import wait
+
+from Pozitioner_and_Communicater.gcode_parser import parse_command
+
+JOG_TAG = "jog-engine"
+
+
+class JogEngine:
+    def __init__(self, g_control, segment_time: float = 0.05, lookahead_time: float = 0.2,
+                 release: str = "quickstop"):
+        self.g_control = g_control
+        self.segment_time = max(0.01, float(segment_time))    # seconds of motion per G1 segment
+        self.lookahead_time = max(self.segment_time, float(lookahead_time))
+        self.release = release                                 # "quickstop" (M410) or "drain"
+        self._cond = threading.Condition()
+        self._thread = None
+        self._run_id = 0        # bumped per start(); a superseded streaming thread stops
+        self._active = False
+        self._axis = None
+        self._direction = 0
+        self._feedrate = 3000.0
+        self._handles = deque(maxlen=64)   # recent segments, for the release quickstop
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def is_jogging(self, axis: str, direction: int) -> bool:
+        with self._cond:
+            return self._active and self._axis == axis.upper() and self._direction == (1 if direction > 0 else -1)
+
+    def start(self, axis: str, direction: int, feedrate: float):
+        """Begin jogging axis ('X'/'Y'/'Z') in direction +1/-1 at feedrate mm/min."""
+        axis = axis.upper()
+        direction = 1 if direction > 0 else -1
+        with self._cond:
+            if self._active and axis == self._axis and direction == self._direction:
+                self._feedrate = float(feedrate)
+                return
+        self.stop()
+        with self._cond:
+            self._axis = axis
+            self._direction = direction
+            self._feedrate = float(feedrate)
+            self._active = True
+            self._run_id += 1
+            self._thread = threading.Thread(target=self._run, args=(self._thread, self._run_id),
+                                            name="jog-engine", daemon=True)
+            self._thread.start()
+
+    def set_feedrate(self, feedrate: float):
+        """Velocity update while holding: applies from the next streamed segment."""
+        with self._cond:
+            self._feedrate = float(feedrate)
+            self._cond.notify()
+
+    def stop(self):
+        """Release the jog. Returns at once: the streaming thread drops the queued
+        segments, quickstops and restores G90 on its way out."""
+        with self._cond:
+            if not self._active:
+                return
+            self._active = False
+            self._cond.notify()
+
+    # ---------- streaming thread ----------
+    def _segment_length(self, feedrate: float) -> float:
+        return max(0.05, feedrate / 60.0 * self.segment_time)
+
+    def _run(self, previous, run_id):
+        if previous is not None:
+            previous.join()     # its release (M410, G90) must reach the firmware before our G91
+        gc = self.g_control
+        if not gc.new_command("G91", tag=JOG_TAG):
+            self._finish(run_id)
+            return
+        try:
+            self._stream(gc, run_id)
+        finally:
+            released = self._finish(run_id)
+            self._release(gc, quickstop=released and self.release == "quickstop")
+
+    def _finish(self, run_id) -> bool:
+        """Clear the active flag if run_id is still current. True if the jog was released."""
+        with self._cond:
+            if self._run_id != run_id:
+                return True
+            released = not self._active   # False: soft limit or rejected segment
+            self._active = False
+            return released
+
+    def _stream(self, gc, run_id):
+        t0 = None
+        buffered = 0.0      # seconds of motion sent so far
+        with self._cond:
+            axis, direction = self._axis, self._direction
+            while self._active and self._run_id == run_id:
+                elapsed = 0.0 if t0 is None else time.monotonic() - t0
+                if buffered - elapsed < self.lookahead_time:
+                    feed = self._feedrate
+                    step = direction * self._segment_length(feed)
+                    self._cond.release()
+                    try:
+                        handle = gc.submit_command(f"G1 {axis}{step:.3f} F{feed:.0f}",
+                                                   wait_motion=False, tag=JOG_TAG, streamed=True)
+                    finally:
+                        self._cond.acquire()
+                    if handle.done() and handle.completed.exception() is not None:
+                        return   # rejected: disconnected or emergency latched
+                    self._handles.append(handle)
+                    # What was queued after clamping to soft limits and feedrate caps
+                    line = parse_command(handle.command).lines[0]
+                    sent = line.get(axis, 0.0)
+                    if abs(sent) < 1e-6:
+                        gc.log(f"[JOG] {axis} soft limit reached.")
+                        return
+                    if t0 is None:
+                        t0 = time.monotonic()
+                    buffered += abs(sent) / (line.get("F", feed) / 60.0)
+                    continue
+                self._cond.wait(self.segment_time / 2)
+
+    def _release(self, gc, quickstop: bool):
+        gc.cancel_tag(JOG_TAG)
+        if quickstop:
+            # The emergency parser runs M410 on arrival, but segments already in the
+            # firmware's command buffer are planned right after it: stop those too.
+            late = [h.acked for h in self._handles if not h.acked.done()]
+            gc.send_emergency("M410")
+            if late:
+                wait(late, timeout=0.5)
+                gc.send_emergency("M410")
+            gc.new_command("M114")  # M410 leaves the gantry between segments: resync the position
+        self._handles.clear()
+        gc.new_command("G90")
@@ -0,0 +1,550 @@
+# Pozitioner_and_Communicater/marlin_simulator.py
+#
+# Hardware-free stand-in for the printer board. MarlinSimulator is a
+# pyserial-like object (write/read/readline/in_waiting/...) that answers
+# enough Marlin to drive GCodeControl and the picking pipeline:
+#   M105 M110 M114 M115 M119 M154 M400 G0/G1 G4 G28 G90/G91 G92 M201/M203/M204 M211 M410
+# including the firmware's command buffer (BUFSIZE) back-pressure, the planner
+# buffer, N/checksum framing with Resend requests, "busy:" keepalives, the
+# EMERGENCY_PARSER (M112/M410/M108 act on arrival, ahead of the buffer) and
+# per-move timing from marlin_settings.yaml (max feedrate + acceleration).
+#
+# Usage:
+#   python -m Pozitioner_and_Communicater.marlin_simulator --pty
+#       -> prints /dev/pts/N; save it as selected_port and use autoconnect()
+#   python -m Pozitioner_and_Communicater.marlin_simulator --bench 200 --streaming
+#       -> drives GCodeControl against the simulator and reports throughput
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import yaml
+
+from File_managers import marlin_config_manager
+from Pozitioner_and_Communicater.gcode_presets import DEFAULT_SETTINGS
+from Pozitioner_and_Communicater.serial_reactor import gcode_checksum
+from Pozitioner_and_Communicater.motion_estimator import HOMING_BUMP_TIME, axis_limits, trapezoid_time
+
+
+def load_simulator_settings() -> dict:
+    """marlin_settings.yaml if present, else the defaults (without creating the file)."""
+    path = marlin_config_manager.get_settings_path()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or dict(DEFAULT_SETTINGS)
+    return dict(DEFAULT_SETTINGS)
+
+
+class MarlinSimulator:
+    """Serial-port-like object backed by a simulated Marlin firmware."""
+
+    BLOCK_BUFFER_SIZE = 16       # Marlin planner buffer
+    KEEPALIVE_INTERVAL = 2.0     # DEFAULT_KEEPALIVE_INTERVAL (s)
+    BED_SIZE = {"X": 235.0, "Y": 235.0, "Z": 250.0}
+
+    def __init__(self, settings=None, bufsize: int = 4, time_scale: float = 1.0,
+                 timeout: float = 1.0, line_error_rate: float = 0.0, port: str = "sim://marlin",
+                 advanced_ok: bool = False, emergency_parser: bool = True):
+        settings = settings if settings is not None else load_simulator_settings()
+        self.port = port
+        self.timeout = timeout
+        self.bufsize = max(1, int(bufsize))
+        self.time_scale = max(0.0, float(time_scale))
+        self.line_error_rate = float(line_error_rate)
+        self.advanced_ok = bool(advanced_ok)
+        self.emergency_parser = bool(emergency_parser)
+
+        self.max_feedrate = {ax: float(v) for ax, v in (settings.get("max_feedrate") or {}).items()}
+        self.max_acceleration = {ax: float(v) for ax, v in (settings.get("max_acceleration") or {}).items()}
+        self.acceleration = float(settings.get("acceleration", 500) or 500)
+        self.jerk = float(settings.get("jerk", 0) or 0)
+        self.steps_per_mm = {ax: float(v) for ax, v in (settings.get("steps_per_mm") or {}).items()}
+        self.feedrate = float(settings.get("feedrate", 1500) or 1500)  # mm/min, modal F
+
+        self.pos = {"X": 0.0, "Y": 0.0, "Z": 0.0, "E": 0.0}
+        self.relative = False
+        self.soft_endstops = True
+        self.last_line = 0
+        self.killed = False
+        self.stats = {"lines": 0, "moves": 0, "motion_time": 0.0, "resends": 0}
+
+        self._cond = threading.Condition()
+        self._rx = bytearray()        # host -> firmware, not yet parsed
+        self._ep_buf = bytearray()    # emergency parser's view of the incoming bytes
+        self._tx = bytearray()        # firmware -> host
+        self._commands = deque()      # firmware command queue, at most BUFSIZE lines
+        self._planner = deque()       # planned move durations (s)
+        self._moving = False
+        self._quickstop = 0           # bumped by M410 to abort the running block
+        self._autoreport_interval = 0.0  # M154 S<seconds>
+        self._dtr = True
+        self.is_open = True
+
+        self._threads = [
+            threading.Thread(target=self._firmware_loop, name="sim-firmware", daemon=True),
+            threading.Thread(target=self._motion_loop, name="sim-motion", daemon=True),
+            threading.Thread(target=self._autoreport_loop, name="sim-autoreport", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        self._emit("start", "echo:Marlin 2.1.x (simulator)", "echo: Last Updated: simulator")
+
+    # ---------- pyserial surface ----------
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            return len(self._tx)
+
+    @property
+    def dtr(self):
+        return self._dtr
+
+    @dtr.setter
+    def dtr(self, value):
+        self._dtr = bool(value)
+
+    def write(self, data) -> int:
+        if not self.is_open:
+            raise OSError("simulated port is closed")
+        with self._cond:
+            self._rx.extend(data)
+            self._cond.notify_all()
+        if self.emergency_parser:
+            self._scan_emergency(data)
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = time.time() + (self.timeout if self.timeout is not None else 1e9)
+        with self._cond:
+            while len(self._tx) < size and self.is_open:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            data = bytes(self._tx[:size])
+            del self._tx[:size]
+            return data
+
+    def readline(self) -> bytes:
+        deadline = time.time() + (self.timeout if self.timeout is not None else 1e9)
+        with self._cond:
+            while b"\n" not in self._tx and self.is_open:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            idx = self._tx.find(b"\n")
+            end = idx + 1 if idx >= 0 else len(self._tx)
+            data = bytes(self._tx[:end])
+            del self._tx[:end]
+            return data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._tx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    # ---------- firmware side ----------
+    def _scan_emergency(self, data):
+        """EMERGENCY_PARSER: act on M112/M410/M108 while the line is still in the RX buffer."""
+        self._ep_buf.extend(data)
+        while b"\n" in self._ep_buf:
+            idx = self._ep_buf.find(b"\n")
+            line = self._ep_buf[:idx].decode("utf-8", errors="ignore").split("*", 1)[0].strip().upper()
+            del self._ep_buf[:idx + 1]
+            words = line.split()
+            if words and words[0].startswith("N"):
+                words = words[1:]
+            code = words[0] if words else ""
+            if code == "M410":
+                self._m410({})
+            elif code == "M112":
+                self._m112({})
+                self._emit("Error:Printer halted. kill() called!")
+
+    def _emit(self, *lines):
+        with self._cond:
+            for line in lines:
+                self._tx.extend((line + "\n").encode("utf-8"))
+            self._cond.notify_all()
+
+    def _firmware_loop(self):
+        while True:
+            with self._cond:
+                # Serial RX -> command queue, only while the queue has room (BUFSIZE back-pressure).
+                while len(self._commands) < self.bufsize and b"\n" in self._rx:
+                    idx = self._rx.find(b"\n")
+                    raw = self._rx[:idx].decode("utf-8", errors="ignore").strip()
+                    del self._rx[:idx + 1]
+                    if raw:
+                        self._commands.append(raw)
+                if not self.is_open:
+                    return
+                if not self._commands:
+                    self._cond.wait(0.05)
+                    continue
+                raw = self._commands.popleft()
+            self.stats["lines"] += 1
+            self._process_line(raw)
+
+    def _motion_loop(self):
+        while True:
+            with self._cond:
+                while self.is_open and not self._planner:
+                    self._cond.wait(0.1)
+                if not self.is_open:
+                    return
+                duration = self._planner[0]
+                self._moving = True
+                generation = self._quickstop
+                deadline = time.time() + duration * self.time_scale
+                while self.is_open and generation == self._quickstop:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if generation == self._quickstop and self._planner:
+                    self._planner.popleft()
+                self._moving = False
+                self._cond.notify_all()
+
+    def _autoreport_loop(self):
+        last = time.time()
+        while self.is_open:
+            time.sleep(0.05)
+            interval = self._autoreport_interval
+            if interval > 0 and time.time() - last >= interval:
+                last = time.time()
+                self._emit(*self._m114({}))
+
+    def _wait_idle(self):
+        """Block until the planner is empty, sending busy keepalives like Marlin."""
+        last_keepalive = time.time()
+        with self._cond:
+            while self.is_open and (self._planner or self._moving):
+                self._cond.wait(0.05)
+                if time.time() - last_keepalive >= self.KEEPALIVE_INTERVAL:
+                    last_keepalive = time.time()
+                    self._emit("echo:busy: processing")
+
+    def _plan(self, duration: float):
+        with self._cond:
+            while self.is_open and len(self._planner) >= self.BLOCK_BUFFER_SIZE:
+                self._cond.wait(0.05)
+            self._planner.append(duration)
+            self.stats["moves"] += 1
+            self.stats["motion_time"] += duration
+            self._cond.notify_all()
+
+    def _process_line(self, raw: str):
+        line = raw.split(";", 1)[0].strip()
+        if line.startswith("N"):
+            line = self._check_line_number(line)
+            if line is None:
+                return
+        if not line:
+            self._emit("ok")
+            return
+        if self.killed and not line.upper().startswith("M999"):
+            self._emit("echo:Printer halted. kill() called!")
+            return
+
+        words = line.upper().split()
+        code = words[0]
+        params = {}
+        for w in words[1:]:
+            try:
+                params[w[0]] = float(w[1:]) if len(w) > 1 else None
+            except ValueError:
+                params[w[0]] = None
+
+        if self.emergency_parser and code in ("M410", "M108"):
+            self._emit(self._ok_line(code))  # already executed by _scan_emergency()
+            return
+        handler = self._HANDLERS.get(code)
+        if handler is None:
+            if code[:1] in ("G", "M"):
+                self._emit(f'echo:Unknown command: "{line}"')
+            self._emit("ok")
+            return
+        extra = handler(self, params) or []
+        self._emit(*extra, self._ok_line(code))
+
+    def _check_line_number(self, line: str):
+        """Validate 'N<n> cmd*cs'. Returns the bare command, or None after requesting a resend."""
+        body, _, checksum = line.partition("*")
+        head, _, cmd = body.partition(" ")
+        try:
+            number = int(head[1:])
+        except ValueError:
+            number = -1
+        if checksum:
+            corrupted = self.line_error_rate > 0 and random.random() < self.line_error_rate
+            try:
+                valid = int(checksum) == gcode_checksum(body) and not corrupted
+            except ValueError:
+                valid = False
+            if not valid:
+                return self._request_resend("checksum mismatch")
+        if cmd.strip().upper().startswith("M110"):
+            self.last_line = number
+            return cmd.strip()
+        if number != self.last_line + 1:
+            return self._request_resend("Line Number is not Last Line Number+1")
+        self.last_line = number
+        return cmd.strip()
+
+    def _request_resend(self, reason: str):
+        self.stats["resends"] += 1
+        self._emit(f"Error:{reason}, Last Line: {self.last_line}",
+                   f"Resend: {self.last_line + 1}", "ok")
+        return None
+
+    # ---------- motion model ----------
+    def move_duration(self, delta: dict, feedrate_mm_min: float) -> float:
+        """Trapezoidal move time (s), same model as MotionEstimator.move_time()."""
+        dist, v, a = axis_limits(delta, feedrate_mm_min, self.acceleration,
+                                 self.max_feedrate, self.max_acceleration)
+        return trapezoid_time(dist, v, a, self.jerk)
+
+    def _clamp(self, axis: str, value: float) -> float:
+        if axis == "E":
+            return value
+        value = max(0.0, value)  # min endstops are physical
+        if self.soft_endstops:
+            value = min(value, self.BED_SIZE.get(axis, value))
+        return value
+
+    # ---------- command handlers (return extra lines printed before "ok") ----------
+    def _g0(self, p):
+        if "F" in p and p["F"]:
+            self.feedrate = p["F"]
+        target = dict(self.pos)
+        for ax in "XYZE":
+            if ax in p and p[ax] is not None:
+                target[ax] = self._clamp(ax, (self.pos[ax] + p[ax]) if self.relative else p[ax])
+        delta = {ax: target[ax] - self.pos[ax] for ax in "XYZE"}
+        duration = self.move_duration(delta, self.feedrate)
+        if duration > 0:
+            self._plan(duration)
+        self.pos = target
+
+    def _g4(self, p):
+        self._wait_idle()
+        seconds = (p.get("S") or 0.0) + (p.get("P") or 0.0) / 1000.0
+        time.sleep(seconds * self.time_scale)
+
+    def _g28(self, p):
+        self._wait_idle()
+        axes = [ax for ax in "XYZ" if ax in p] or ["X", "Y", "Z"]
+        delta = {ax: -self.pos[ax] for ax in axes}
+        homing_feed = min(self.max_feedrate.get(ax, 50.0) for ax in axes) * 60.0 / 2.0
+        self._plan(self.move_duration(delta, homing_feed) + HOMING_BUMP_TIME)
+        self._wait_idle()
+        for ax in axes:
+            self.pos[ax] = 0.0
+
+    def _g90(self, p):
+        self.relative = False
+
+    def _g91(self, p):
+        self.relative = True
+
+    def _g92(self, p):
+        for ax in "XYZE":
+            if ax in p and p[ax] is not None:
+                self.pos[ax] = p[ax]
+        if not p:
+            self.pos = {ax: 0.0 for ax in self.pos}
+
+    def _m105(self, p):
+        return None
+
+    def _m114(self, p):
+        counts = " ".join(f"{ax}:{int(round(self.pos[ax] * self.steps_per_mm.get(ax, 80.0)))}" for ax in "XYZ")
+        return [f"X:{self.pos['X']:.2f} Y:{self.pos['Y']:.2f} Z:{self.pos['Z']:.2f} E:{self.pos['E']:.2f} Count {counts}"]
+
+    def _m115(self, p):
+        return [
+            "FIRMWARE_NAME:Marlin 2.1.x (simulator) SOURCE_CODE_URL:github.com/MarlinFirmware/Marlin "
+            "PROTOCOL_VERSION:1.0 MACHINE_TYPE:AutoLab simulator EXTRUDER_COUNT:1",
+            "Cap:SERIAL_XON_XOFF:0",
+            "Cap:AUTOREPORT_POS:1",
+            f"Cap:ADVANCED_OK:{int(self.advanced_ok)}",
+            f"Cap:EMERGENCY_PARSER:{int(self.emergency_parser)}",
+        ]
+
+    def _m119(self, p):
+        state = lambda ax: "TRIGGERED" if self.pos[ax] <= 0.0 else "open"
+        return ["Reporting endstop status",
+                f"x_min: {state('X')}", f"y_min: {state('Y')}", f"z_min: {state('Z')}"]
+
+    def _m201(self, p):
+        for ax in "XYZE":
+            if p.get(ax):
+                self.max_acceleration[ax] = p[ax]
+
+    def _m203(self, p):
+        for ax in "XYZE":
+            if p.get(ax):
+                self.max_feedrate[ax] = p[ax]
+
+    def _m204(self, p):
+        for key in ("P", "S", "T"):
+            if p.get(key):
+                self.acceleration = p[key]
+                break
+
+    def _m211(self, p):
+        if "S" in p and p["S"] is not None:
+            self.soft_endstops = bool(p["S"])
+
+    def _m154(self, p):
+        self._autoreport_interval = max(0.0, p.get("S") or 0.0)
+
+    def _m400(self, p):
+        self._wait_idle()
+
+    def _m410(self, p):
+        with self._cond:
+            self._planner.clear()
+            self._quickstop += 1
+            self._cond.notify_all()
+
+    def _m112(self, p):
+        self._m410(p)
+        self.killed = True
+        return ["Error:Printer halted. kill() called!"]
+
+    def _m999(self, p):
+        self.killed = False
+
+    def _noop(self, p):
+        return None
+
+    def _ok_line(self, code: str) -> str:
+        ok = "ok"
+        if self.advanced_ok:
+            with self._cond:
+                ok += f" P{self.BLOCK_BUFFER_SIZE - len(self._planner)} B{self.bufsize - len(self._commands)}"
+        # M105 reports temperatures on the ok line itself.
+        return ok + " T:25.00 /0.00 B:25.00 /0.00 @:0 B@:0" if code == "M105" else ok
+
+    _HANDLERS = {
+        "G0": _g0, "G1": _g0, "G4": _g4, "G28": _g28, "G90": _g90, "G91": _g91, "G92": _g92,
+        "M105": _m105, "M114": _m114, "M115": _m115, "M119": _m119,
+        "M154": _m154, "M201": _m201, "M203": _m203, "M204": _m204, "M211": _m211,
+        "M400": _m400, "M410": _m410, "M112": _m112, "M999": _m999,
+    }
+    for _code in ("M17", "M18", "M84", "M42", "M92", "M106", "M107", "M108", "M110",
+                  "M150", "M205", "M500", "M503", "M906"):
+        _HANDLERS[_code] = _noop
+    del _code
+
+
+def serve_pty(sim: MarlinSimulator) -> str:
+    """Expose the simulator on a pseudo-terminal (Linux/macOS). Returns the device path."""
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def _host_to_sim():
+        while sim.is_open:
+            try:
+                data = os.read(master, 1024)
+            except OSError:
+                time.sleep(0.05)  # no client attached yet / client closed the port
+                continue
+            if data:
+                sim.write(data)
+
+    def _sim_to_host():
+        while sim.is_open:
+            data = sim.read(max(1, sim.in_waiting))
+            if data:
+                os.write(master, data)
+
+    threading.Thread(target=_host_to_sim, name="sim-pty-rx", daemon=True).start()
+    threading.Thread(target=_sim_to_host, name="sim-pty-tx", daemon=True).start()
+    sim.port = path
+    sim._pty_fds = (master, slave)  # keep the slave open so the device stays alive
+    return path
+
+
+def run_benchmark(moves: int, streaming: bool, bufsize: int, time_scale: float, reliable: bool = False,
+                  line_error_rate: float = 0.0):
+    """Drive GCodeControl through the simulator with a random pick-like move set."""
+    from Pozitioner_and_Communicater.G_communicate import GCodeControl
+
+    sim = MarlinSimulator(bufsize=bufsize, time_scale=time_scale, line_error_rate=line_error_rate)
+    g_control = GCodeControl(threading.Lock())
+    g_control.ser = sim
+    g_control.set_connected(True)
+    g_control.start_threads()
+    g_control.set_streaming_mode(streaming, bufsize)
+    g_control.set_reliable_transport(reliable)
+
+    rng = random.Random(1)
+    start = time.time()
+    handles = [g_control.submit_command(f"G0 X{rng.uniform(5, 200):.2f} Y{rng.uniform(5, 200):.2f} F6000",
+                                        wait_motion=False)
+               for _ in range(moves)]
+    handles.append(g_control.submit_command("M400"))
+    ok = handles[-1].wait(timeout=max(60.0, moves * 5.0))
+    elapsed = time.time() - start
+    g_control.stop_threads()
+    sim.close()
+
+    motion = sim.stats["motion_time"] * time_scale
+    mode = f"streaming BUFSIZE={bufsize}" if streaming else "stop-and-wait"
+    if reliable:
+        mode += f", N/checksum, line error rate {line_error_rate:g}"
+    print(f"[BENCH] {moves} moves, {mode}: {elapsed:.2f} s wall, {motion:.2f} s pure motion, "
+          f"overhead {elapsed - motion:.2f} s, resends {sim.stats['resends']}{'' if ok else ' (TIMEOUT)'}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulated Marlin board for hardware-free runs.")
+    parser.add_argument("--pty", action="store_true", help="serve on a pseudo-terminal until Ctrl+C")
+    parser.add_argument("--bench", type=int, default=0, metavar="MOVES", help="benchmark GCodeControl")
+    parser.add_argument("--streaming", action="store_true", help="benchmark in ok-counting streaming mode")
+    parser.add_argument("--reliable", action="store_true", help="benchmark with N/checksum framing")
+    parser.add_argument("--bufsize", type=int, default=4)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="0.1 = moves run 10x faster")
+    parser.add_argument("--line-error-rate", type=float, default=0.0, help="fraction of numbered lines to reject")
+    args = parser.parse_args()
+    if args.bench and args.line_error_rate > 0 and not args.reliable:
+        parser.error("--line-error-rate only affects numbered lines: add --reliable")
+
+    if args.bench:
+        run_benchmark(args.bench, args.streaming, args.bufsize, args.time_scale, args.reliable,
+                      args.line_error_rate)
+    elif args.pty:
+        simulator = MarlinSimulator(bufsize=args.bufsize, time_scale=args.time_scale,
+                                    line_error_rate=args.line_error_rate)
+        print(f"[INFO] Simulated Marlin on {serve_pty(simulator)} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            simulator.close()
+    else:
+        parser.print_help()
@@ -0,0 +1,169 @@
+# Pozitioner_and_Communicater/motion_estimator.py
+#
+# Trapezoidal-profile time estimates for G0/G1 moves, from the feedrate,
+# acceleration and jerk values in marlin_settings.yaml. Used to preview a
+# picking run before it starts, and to compare the wall-clock time of a run
+# with its pure motion time (what is left is transport/host overhead).
+#
+#   est = MotionEstimator.from_settings()
+#   plan = est.estimate_points([(10, 20), (40, 25)], feedrate=6000, start=(0, 0))
+#   plan["total_time"], plan["moves"]
+
+import math
+
+from Pozitioner_and_Communicater.gcode_parser import parse_command
+
+HOMING_BUMP_TIME = 0.5  # s, bump + slow re-approach per G28
+
+
+def axis_limits(delta: dict, feedrate_mm_min: float, acceleration: float,
+                max_feedrate: dict, max_acceleration: dict):
+    """(distance mm, cruise speed mm/s, acceleration mm/s^2) of a move, after the
+    per-axis max feedrate / max acceleration limits are projected onto its direction."""
+    axes = {ax: abs(d) for ax, d in delta.items() if ax in "XYZ" and d}
+    if not axes and delta.get("E"):
+        axes = {"E": abs(delta["E"])}
+    dist = math.sqrt(sum(d * d for d in axes.values()))
+    if dist <= 0:
+        return 0.0, 0.0, 0.0
+    v = max(0.1, feedrate_mm_min / 60.0)
+    a = acceleration
+    for ax, d in axes.items():
+        scale = dist / d
+        if ax in max_feedrate:
+            v = min(v, max_feedrate[ax] * scale)
+        if ax in max_acceleration:
+            a = min(a, max_acceleration[ax] * scale)
+    return dist, v, max(a, 1.0)
+
+
+def trapezoid_time(dist: float, v: float, a: float, v_edge: float = 0.0) -> float:
+    """Time (s) to cover dist starting and ending at v_edge (classic jerk speed),
+    cruising at v, with constant acceleration a."""
+    if dist <= 0:
+        return 0.0
+    v_edge = min(max(0.0, v_edge), v)
+    if v_edge >= v:
+        return dist / v
+    d_ramp = (v * v - v_edge * v_edge) / a          # accel + decel distance
+    if dist >= d_ramp:
+        return 2.0 * (v - v_edge) / a + (dist - d_ramp) / v
+    v_peak = math.sqrt(a * dist + v_edge * v_edge)  # triangular profile
+    return 2.0 * (v_peak - v_edge) / a
+
+
+class MotionEstimator:
+    """Move-time model of the machine. Each move is assumed to start and end at
+    the jerk speed, i.e. moves are separated by M400 as in a picking run."""
+
+    def __init__(self, settings: dict):
+        self.acceleration = float(settings.get("acceleration", 500) or 500)
+        self.jerk = float(settings.get("jerk", 0) or 0)
+        self.feedrate = float(settings.get("feedrate", 1500) or 1500)  # default F, mm/min
+        self.max_feedrate = {ax: float(v) for ax, v in (settings.get("max_feedrate") or {}).items()}
+        self.max_acceleration = {ax: float(v) for ax, v in (settings.get("max_acceleration") or {}).items()}
+
+    @classmethod
+    def from_settings(cls):
+        from File_managers import marlin_config_manager
+        return cls(marlin_config_manager.load_settings() or {})
+
+    def move_time(self, delta: dict, feedrate_mm_min: float) -> float:
+        dist, v, a = axis_limits(delta, feedrate_mm_min, self.acceleration,
+                                 self.max_feedrate, self.max_acceleration)
+        return trapezoid_time(dist, v, a, self.jerk)
+
+    def estimate(self, commands, start_pos=None) -> dict:
+        """Estimate a sequence of G-code commands (strings or GCodeCommands).
+
+        Tracks G90/G91, G92, G28 and the modal feedrate. Returns
+        {"moves": [(text, seconds), ...], "motion_time", "dwell_time",
+         "total_time", "distance"}.
+        """
+        pos = {"X": 0.0, "Y": 0.0, "Z": 0.0}
+        pos.update({ax: float(v) for ax, v in (start_pos or {}).items() if ax in pos})
+        relative = False
+        feed = self.feedrate
+        moves = []
+        dwell = 0.0
+        distance = 0.0
+        for command in commands:
+            cmd = parse_command(command) if isinstance(command, str) else command
+            for line in cmd.lines:
+                code = line.code
+                if code == "G90":
+                    relative = False
+                elif code == "G91":
+                    relative = True
+                elif code == "G92":
+                    for ax in pos:
+                        value = line.get(ax)
+                        if value is not None:
+                            pos[ax] = value
+                elif code == "G4":
+                    dwell += (line.get("S") or 0.0) + (line.get("P") or 0.0) / 1000.0
+                elif code == "G28":
+                    delta = {ax: -pos[ax] for ax in pos}
+                    homing_feed = min(self.max_feedrate.get(ax, 50.0) for ax in "XYZ") * 60.0 / 2.0
+                    moves.append((line.text, self.move_time(delta, homing_feed) + HOMING_BUMP_TIME))
+                    pos = {ax: 0.0 for ax in pos}
+                elif code in ("G0", "G1"):
+                    feed = line.get("F") or feed
+                    delta = {}
+                    for ax in pos:
+                        value = line.get(ax)
+                        if value is not None:
+                            target = pos[ax] + value if relative else value
+                            delta[ax] = target - pos[ax]
+                            pos[ax] = target
+                    seconds = self.move_time(delta, feed)
+                    distance += math.sqrt(sum(d * d for d in delta.values()))
+                    moves.append((line.text, seconds))
+        motion = sum(t for _text, t in moves)
+        return {
+            "moves": moves,
+            "motion_time": motion,
+            "dwell_time": dwell,
+            "total_time": motion + dwell,
+            "distance": distance,
+        }
+
+    def estimate_points(self, points, feedrate: float, start=None, dwell: float = 0.0,
+                        command_for=None) -> dict:
+        """Estimate visiting (x, y) points in order with absolute moves, pausing dwell s at each.
+        command_for(idx) gives the G-code actually sent for point idx (e.g.
+        PickingExecutor.command_for, with its Z moves and dwells); default: the XY move only."""
+        start_pos = {"X": start[0], "Y": start[1]} if start is not None else None
+        if command_for is None:
+            def command_for(idx):
+                x, y = points[idx]
+                return f"G0 X{float(x):.3f} Y{float(y):.3f} F{float(feedrate):.0f}"
+        commands = ["G90"] + [command_for(idx) for idx in range(len(points))]
+        plan = self.estimate(commands, start_pos)
+        plan["dwell_time"] += dwell * len(points)
+        plan["total_time"] = plan["motion_time"] + plan["dwell_time"]
+        return plan
+
+
+def format_duration(seconds: float) -> str:
+    seconds = max(0.0, float(seconds))
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+    minutes, sec = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes} min {sec:02d} s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes:02d} min"
+
+
+def transport_overhead(wall_time: float, plan: dict) -> dict:
+    """Split a measured run into motion and overhead. A large overhead share means the
+    serial transport / host, not the machine's motion, limits throughput."""
+    motion = plan.get("total_time", 0.0)
+    overhead = max(0.0, wall_time - motion)
+    return {
+        "wall_time": wall_time,
+        "motion_time": motion,
+        "overhead": overhead,
+        "overhead_share": overhead / wall_time if wall_time > 0 else 0.0,
+    }
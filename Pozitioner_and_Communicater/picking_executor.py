@@ -0,0 +1,150 @@
+# Pozitioner_and_Communicater/picking_executor.py
+#
+# Runs a picking route without a host round trip between colonies. Each target
+# is one multi-line command (the XY move plus its Z-down / aspirate / Z-up
+# sequence) submitted with wait_motion=True, so the firmware's "ok" for the
+# trailing M400 marks the target as finished. Up to `window` targets are
+# queued ahead: when one finishes, the next is already in the scheduler (and,
+# in streaming mode, already in the firmware's buffer), so the gantry moves on
+# without waiting for the GUI.
+#
+# Every target still ends in M400, so a pause or stop never lands in the middle
+# of a pick sequence and the resume point is always exact.
+
+import threading
+from collections import deque
+
+PICK_TAG = "picking"
+
+# Per-target G-code; {x} {y} (gantry mm) {feed} {n} are filled in for every target.
+DEFAULT_SEQUENCE = ("G0 X{x:.3f} Y{y:.3f} F{feed}",)
+
+
+class PickingExecutor:
+    """States: idle -> running -> (pausing -> paused -> running)* -> finished | stopped | failed.
+
+    listener(event, *args) is called from the serial reactor thread (or the
+    caller's thread) with:
+        ("progress", idx)   target idx finished
+        ("paused", idx)     everything before idx is done, nothing is in flight
+        ("finished",)
+        ("stopped",)        stop() was called; nothing more follows
+        ("failed", message)
+    """
+
+    def __init__(self, g_control, targets, sequence=DEFAULT_SEQUENCE, feedrate: float = 6000,
+                 window: int = 4, listener=None):
+        self.g_control = g_control
+        self.targets = list(targets)
+        self.sequence = list(sequence) or list(DEFAULT_SEQUENCE)
+        self.feedrate = feedrate
+        self.window = max(1, int(window))
+        self.listener = listener
+        self.state = "idle"
+        self.done_idx = 0            # targets [0, done_idx) are finished
+        self._next_idx = 0           # next target to submit
+        self._outstanding = deque()  # (idx, CommandHandle) in submission order
+        self._lock = threading.RLock()
+
+    # ---------- G-code ----------
+    def command_for(self, idx: int) -> str:
+        x, y = self.targets[idx]
+        values = {"x": x, "y": y, "feed": int(self.feedrate), "n": idx + 1}
+        return "\n".join(line.format(**values) for line in self.sequence)
+
+    # ---------- control ----------
+    def start(self, from_idx: int = 0):
+        with self._lock:
+            self.done_idx = self._next_idx = max(0, min(int(from_idx), len(self.targets)))
+            self.state = "running"
+            self._fill()
+            self._settle()
+
+    def pause(self):
+        """Stop feeding new targets; the ones already sent to the firmware finish."""
+        with self._lock:
+            if self.state != "running":
+                return
+            self.state = "pausing"
+            self.g_control.cancel_tag(PICK_TAG)
+            # The cancelled targets are the tail of the window: forget them and resend on resume.
+            self._outstanding = deque(
+                (idx, h) for idx, h in self._outstanding
+                if not (h.done() and h.completed.exception() is not None)
+            )
+            self._next_idx = self._outstanding[-1][0] + 1 if self._outstanding else self.done_idx
+            self._settle()
+
+    def resume(self):
+        with self._lock:
+            if self.state not in ("paused", "pausing", "stopped", "failed"):
+                return
+            if self.state in ("stopped", "failed"):
+                self._outstanding.clear()   # aborted; their late "ok"s prove nothing
+                self._next_idx = self.done_idx
+            self.state = "running"
+            self._settle()
+
+    def stop(self):
+        """Abort now: drop queued targets and quick-stop what the firmware already holds.
+        Does not block. The reactor's quickstop also stops the lines of later targets
+        that are already in the firmware's command buffer (see SerialReactor.quickstop)."""
+        with self._lock:
+            if self.state in ("idle", "finished", "stopped"):
+                return
+            self.state = "stopped"
+            gc = self.g_control
+            gc.cancel_tag(PICK_TAG)
+        gc.send_emergency("M410")
+        self._emit("stopped")
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._outstanding)
+
+    # ---------- internals ----------
+    def _fill(self):
+        while (self.state == "running" and len(self._outstanding) < self.window
+               and self._next_idx < len(self.targets)):
+            idx = self._next_idx
+            self._next_idx += 1
+            handle = self.g_control.submit_command(self.command_for(idx), wait_motion=True, tag=PICK_TAG)
+            self._outstanding.append((idx, handle))
+            handle.add_done_callback(self._on_handle_done)
+
+    def _on_handle_done(self, _handle):
+        with self._lock:
+            self._settle()
+
+    def _settle(self):
+        """Consume finished handles in submission order and move the state machine."""
+        while self._outstanding and self._outstanding[0][1].done():
+            idx, handle = self._outstanding.popleft()
+            error = handle.completed.exception()
+            if self.state == "stopped":
+                continue    # M400 returns "ok" after a quickstop too: not proof the target was reached
+            if error is None:
+                self.done_idx = idx + 1
+                self._emit("progress", idx)
+                continue
+            if self.state == "running":
+                self.state = "failed"
+                self.g_control.cancel_tag(PICK_TAG)
+                self._emit("failed", f"target {idx + 1}: {error}")
+            # pausing/stopped/failed: a cancelled target is simply not done yet
+        if self.state == "running":
+            self._fill()
+            if self.state == "running" and not self._outstanding and self.done_idx >= len(self.targets):
+                self.state = "finished"
+                self._emit("finished")
+        elif self.state == "pausing" and not self._outstanding:
+            self.state = "paused"
+            self._emit("paused", self.done_idx)
+
+    def _emit(self, event, *args):
+        if self.listener is not None:
+            try:
+                self.listener(event, *args)
+            except Exception as e:
+                self.g_control.log(f"[ERROR] Picking listener failed on {event!r}: {e}")
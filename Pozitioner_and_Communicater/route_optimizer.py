@@ -0,0 +1,213 @@
+# Pozitioner_and_Communicater/route_optimizer.py
+#
+# Visiting order for picking runs. The route is an open path that starts at the
+# gantry's current position and may end anywhere. Moves are weighted by travel
+# time, not distance: X and Y move simultaneously, so a G0 takes as long as its
+# slowest axis (Chebyshev metric scaled by the per-axis max feedrates), capped
+# by the commanded feedrate along the move vector.
+#
+#   order = optimize_route(points, start=(x, y), feedrate=6000,
+#                          max_feedrate={"X": 200, "Y": 200})
+#   ordered = [points[i] for i in order]
+#
+# Construction: nearest-neighbour from the start using K-nearest candidate
+# lists (numpy, computed in row blocks); improvement: 2-opt and Or-opt moves
+# restricted to those candidates, until no move helps or time_limit runs out.
+
+import math
+import time
+
+import numpy as np
+
+_BLOCK_ROWS = 512   # rows of the pairwise cost matrix built at once
+
+
+class TravelMetric:
+    """Move time (s) between two XY points."""
+
+    def __init__(self, feedrate: float = 6000.0, max_feedrate: dict = None):
+        v = max(0.1, float(feedrate) / 60.0)      # mm/min -> mm/s, along the move vector
+        caps = max_feedrate or {}
+        self.v = v
+        self.vx = min(v, float(caps.get("X", v)) or v)
+        self.vy = min(v, float(caps.get("Y", v)) or v)
+
+    def __call__(self, a, b) -> float:
+        dx = abs(a[0] - b[0])
+        dy = abs(a[1] - b[1])
+        return max(dx / self.vx, dy / self.vy, math.hypot(dx, dy) / self.v)
+
+    def to_many(self, xy: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cost matrix len(rows) x len(xy)."""
+        dx = np.abs(rows[:, None, 0] - xy[None, :, 0])
+        dy = np.abs(rows[:, None, 1] - xy[None, :, 1])
+        return np.maximum(np.maximum(dx / self.vx, dy / self.vy), np.hypot(dx, dy) / self.v)
+
+
+def _candidate_lists(xy: np.ndarray, metric: TravelMetric, k: int) -> list:
+    """K cheapest neighbours of every node, nearest first."""
+    n = len(xy)
+    k = min(k, n - 1)
+    if k <= 0:
+        return [[] for _ in range(n)]
+    out = []
+    for lo in range(0, n, _BLOCK_ROWS):
+        cost = metric.to_many(xy, xy[lo:lo + _BLOCK_ROWS])
+        cost[np.arange(len(cost)), np.arange(lo, lo + len(cost))] = np.inf
+        idx = np.argpartition(cost, k - 1, axis=1)[:, :k]
+        for r in range(len(cost)):
+            row = idx[r]
+            out.append(row[np.argsort(cost[r, row])].tolist())
+    return out
+
+
+def _nearest_neighbour_tour(xy: np.ndarray, metric: TravelMetric, cand: list) -> list:
+    """Greedy tour from node 0 (the start). Falls back to a full scan only when
+    every candidate of the current node is already visited."""
+    n = len(xy)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    tour = [0]
+    cur = 0
+    for _ in range(n - 1):
+        nxt = -1
+        for c in cand[cur]:
+            if not visited[c]:
+                nxt = c
+                break
+        if nxt < 0:
+            cost = metric.to_many(xy, xy[cur:cur + 1])[0]
+            cost[visited] = np.inf
+            nxt = int(np.argmin(cost))
+        visited[nxt] = True
+        tour.append(nxt)
+        cur = nxt
+    return tour
+
+
+class _Path:
+    """Open path with node 0 fixed at the front; pos[] maps node -> index."""
+
+    def __init__(self, tour, pts, metric):
+        self.tour = tour
+        self.pts = pts
+        self.metric = metric
+        self.pos = [0] * len(tour)
+        self._reindex(0, len(tour))
+
+    def _reindex(self, lo, hi):
+        tour, pos = self.tour, self.pos
+        for i in range(lo, hi):
+            pos[tour[i]] = i
+
+    def d(self, a, b) -> float:
+        if a is None or b is None:
+            return 0.0      # open end: leaving the last point is free
+        return self.metric(self.pts[a], self.pts[b])
+
+    def at(self, i):
+        return self.tour[i] if i < len(self.tour) else None
+
+    def two_opt(self, cand, active) -> set:
+        """Reverse tour[lo+1..hi] when that replaces edges (lo,lo+1),(hi,hi+1) by
+        (lo,hi),(lo+1,hi+1) at lower cost. Only nodes in active are tried (don't-look
+        bits); returns the endpoints of the edges that changed."""
+        touched = set()
+        tour, pos = self.tour, self.pos
+        for a in sorted(active, key=pos.__getitem__):
+            i = pos[a]
+            for c in cand[a]:
+                j = pos[c]
+                lo, hi = (i, j) if i < j else (j, i)
+                if hi <= lo + 1:
+                    continue
+                p, q = tour[lo], tour[lo + 1]
+                r, s = tour[hi], self.at(hi + 1)
+                delta = self.d(p, r) + self.d(q, s) - self.d(p, q) - self.d(r, s)
+                if delta < -1e-9:
+                    tour[lo + 1:hi + 1] = tour[lo + 1:hi + 1][::-1]
+                    self._reindex(lo + 1, hi + 1)
+                    touched.update((p, q, r) if s is None else (p, q, r, s))
+                    i = pos[a]
+        return touched
+
+    def or_opt(self, cand, active, max_len=3) -> set:
+        """Move a run of 1..max_len nodes (optionally reversed) next to a candidate
+        neighbour. Only runs starting at an active node are tried."""
+        touched = set()
+        tour, pos = self.tour, self.pos
+        n = len(tour)
+        for length in range(1, max_len + 1):
+            i = 1
+            while i + length <= n:
+                if tour[i] not in active and tour[i + length - 1] not in active:
+                    i += 1
+                    continue
+                seg = tour[i:i + length]
+                s0, s1 = seg[0], seg[-1]
+                p, nx = tour[i - 1], self.at(i + length)
+                removed = self.d(p, s0) + self.d(s1, nx) - self.d(p, nx)
+                best = None
+                for end in (s0, s1):
+                    for c in cand[end]:
+                        j = pos[c]
+                        if i <= j < i + length or j == i - 1:
+                            continue
+                        e = self.at(j + 1)
+                        base = self.d(c, e)
+                        fwd = self.d(c, s0) + self.d(s1, e) - base
+                        rev = self.d(c, s1) + self.d(s0, e) - base
+                        gain = removed - min(fwd, rev)
+                        if gain > 1e-9 and (best is None or gain > best[0]):
+                            best = (gain, c, rev < fwd)
+                if best is None:
+                    i += 1
+                    continue
+                _gain, c, reverse = best
+                touched.update(x for x in (p, nx, c, self.at(pos[c] + 1), s0, s1) if x is not None)
+                del tour[i:i + length]
+                k = tour.index(c) + 1
+                tour[k:k] = seg[::-1] if reverse else seg
+                lo = min(i, k)
+                self._reindex(lo, n)
+        return touched
+
+
+def optimize_route(points, start=None, feedrate: float = 6000.0, max_feedrate: dict = None,
+                   time_limit: float = 1.0, neighbours: int = 8) -> list:
+    """Visiting order (indices into points) that minimises total travel time.
+
+    start: gantry XY the route begins at (default: machine origin).
+    max_feedrate: per-axis caps in mm/s, as in marlin_settings.yaml.
+    """
+    n = len(points)
+    if n == 0:
+        return []
+    metric = TravelMetric(feedrate, max_feedrate)
+    origin = (0.0, 0.0) if start is None else (float(start[0]), float(start[1]))
+    pts = [origin] + [(float(p[0]), float(p[1])) for p in points]
+    xy = np.asarray(pts, dtype=float)
+    cand = _candidate_lists(xy, metric, neighbours)
+    path = _Path(_nearest_neighbour_tour(xy, metric, cand), pts, metric)
+
+    deadline = time.monotonic() + max(0.0, time_limit)
+    active = set(range(1, n + 1))
+    while active and time.monotonic() < deadline:
+        touched = path.two_opt(cand, active)
+        if time.monotonic() >= deadline:
+            break
+        touched |= path.or_opt(cand, active | touched)
+        touched.discard(0)
+        active = touched
+    return [node - 1 for node in path.tour[1:]]
+
+
+def route_time(points, order, start=None, feedrate: float = 6000.0, max_feedrate: dict = None) -> float:
+    """Total travel time (s) of visiting points in order from start."""
+    metric = TravelMetric(feedrate, max_feedrate)
+    cur = (0.0, 0.0) if start is None else start
+    total = 0.0
+    for i in order:
+        total += metric(cur, points[i])
+        cur = points[i]
+    return total
@@ -0,0 +1,496 @@
+# Pozitioner_and_Communicater/serial_reactor.py
+#
+# Single owner of the serial port. Every byte written to or read from the printer
+# goes through this thread, so there is no lock contention between senders and no
+# race between two readers for the same "ok".
+
+import threading
+import time
+import re
+from collections import deque
+
+
+# Marlin asks for a retransmit with "Resend: 12" (or "rs N12" on some forks).
+_RESEND_RE = re.compile(r"^\s*(?:resend|rs)\s*:?\s*n?:?\s*(\d+)", re.IGNORECASE)
+
+# Commands whose "ok" legitimately arrives much later than a normal line.
+_LONG_RUNNING_CODES = ("M400", "G28", "G29", "G4", "M109", "M190", "M303", "M600")
+# Commands that wait for the planner to empty. Nothing is written behind one until it
+# is answered: the lines after it could not run earlier anyway, and a quickstop while
+# it waits then leaves no later move in the firmware's command buffer to be planned.
+_BARRIER_CODES = ("M400", "G4", "G28", "G29")
+
+
+def _command_code(line: str) -> str:
+    return line.strip().split(" ", 1)[0].upper()
+
+
+def gcode_checksum(payload: str) -> int:
+    cs = 0
+    for b in payload.encode('utf-8'):
+        cs ^= b
+    return cs & 0xFF
+
+
+def parse_resend_request(line: str):
+    match = _RESEND_RE.match(str(line))
+    if not match:
+        return None
+    return int(match.group(1))
+
+
+class SerialTransaction:
+    """One submitted command (one or more lines). Resolved once its last line is acknowledged."""
+
+    def __init__(self, lines, source: str = "DIRECT", motion: bool = False, handle=None, ack_lines=None):
+        self.lines = list(lines)
+        self.source = source
+        self.motion = bool(motion)
+        self.handle = handle     # optional CommandHandle to notify
+        self.ack_lines = len(self.lines) if ack_lines is None else int(ack_lines)  # lines before any appended M400
+        self._acked = 0
+        self.responses = []      # every line received while this command was the oldest in flight
+        self.ok_line = None      # the final "ok ..." line, None if timed out / cancelled
+        self.error = None
+        self._next = 0           # index of the next line to transmit
+        self._outstanding = 0    # lines written but not yet acknowledged
+        self._event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._event.wait(timeout)
+
+    def _notify_acked(self, ok_line):
+        if self.handle is not None and not self.error:
+            self.handle._set_acked(ok_line)
+
+    def _resolve(self, error=None):
+        if error and not self.error:
+            self.error = error
+        self._event.set()
+        if self.handle is not None:
+            self.handle._finish(self)
+
+
+class _InFlightLine:
+    __slots__ = ("txn", "line", "number", "deadline", "resent")
+
+    def __init__(self, txn, line, number, deadline, resent=False):
+        self.txn = txn
+        self.line = line
+        self.number = number
+        self.deadline = deadline
+        self.resent = resent     # written by _handle_resend, not by the first transmission
+
+
+class SerialReactor(threading.Thread):
+    """Owns the port: takes queued commands from the CommandScheduler by priority and routes replies to waiters.
+
+    Besides the scheduler there are two lanes: submit() (send_command, above every
+    queued class) and emergency_write() (M112/M410/M108, written immediately).
+    """
+
+    def __init__(self, g_control, ser, scheduler):
+        super().__init__(name="serial-reactor", daemon=True)
+        self._gc = g_control
+        self._ser = ser
+        self._scheduler = scheduler
+
+        self._direct = deque()       # send_command() lane, above every queue
+        self._direct_lock = threading.Lock()
+        self._current = None         # transaction being transmitted (lines stay contiguous)
+        self._in_flight = deque()    # _InFlightLine, FIFO matching Marlin's "ok" order
+        self._state_lock = threading.Lock()
+
+        self._rx_buffer = b""
+        self._wake = threading.Event()
+        self._running = False
+        self._draining = False
+
+        # transport features (copied from GCodeControl settings)
+        self.window = 1
+        self.reliable = False
+        self.ok_timeout = 15.0
+        self.long_ok_timeout = 300.0
+        self._line_number = 0
+        self._ring = deque(maxlen=64)
+        self._resend_from = None     # N being retransmitted; repeats of it are ignored until it is answered
+        self._quickstops = 0         # bumped by quickstop(); a motion transaction popped before it is dropped
+        self._quickstop_marker = None  # in-flight M410 of quickstop(); M410 follows every "ok" before its own
+        self.recorder = None         # optional SessionRecorder (tx/rx capture)
+        self.last_motion_done = 0.0  # time.monotonic() the last motion transaction resolved
+
+    def start(self):
+        # Accept submissions as soon as start() returns, before run() gets scheduled.
+        self._running = True
+        super().start()
+
+    # ---------- configuration ----------
+    def configure(self, streaming: bool, bufsize: int, reliable: bool, ring_size: int):
+        with self._state_lock:
+            self.window = max(1, int(bufsize)) if streaming else 1
+            if self._ring.maxlen != ring_size:
+                self._ring = deque(self._ring, maxlen=max(8, int(ring_size)))
+            was_reliable = self.reliable
+            self.reliable = bool(reliable)
+        if self.reliable and not was_reliable:
+            self._reset_line_numbers()
+        self.wake()
+
+    # ---------- producer side (any thread) ----------
+    def wake(self):
+        self._wake.set()
+
+    def submit(self, lines, source="DIRECT", motion=False, ack_lines=None) -> SerialTransaction:
+        txn = SerialTransaction(lines, source=source, motion=motion, ack_lines=ack_lines)
+        if not txn.lines:
+            txn._resolve()
+            return txn
+        if not self._running:
+            txn._resolve("reactor not running")
+            return txn
+        with self._direct_lock:
+            self._direct.append(txn)
+        self.wake()
+        return txn
+
+    def emergency_write(self, line: str, expect_ok: bool = True):
+        """Fast lane: write line now, ignoring the transmit window and any transaction
+        being sent. Marlin's emergency parser acts on M112/M410/M108 as soon as the
+        bytes arrive, even with a full command buffer. The line is sent unnumbered
+        (accepted in N/checksum mode too); its "ok", if one comes, is expected after
+        those of the lines already in flight."""
+        line = line.strip()
+        with self._gc.lock:
+            self._ser.write((line + "\n").encode('utf-8'))
+            self._ser.flush()
+        if self.recorder is not None:
+            self.recorder.record("tx", line, source="EMERGENCY")
+        if expect_ok:
+            with self._state_lock:
+                self._in_flight.append(_InFlightLine(None, line, None, self._deadline_for(line)))
+        self.wake()
+
+    def quickstop(self):
+        """M410 that also stops what is already on its way to the planner.
+
+        The first M410 empties the planner, but lines already in the firmware's
+        command buffer (streamed jog segments, the rest of a multi-line command)
+        are planned right after it. So the unsent lines of a motion transaction being transmitted are
+        dropped, and M410 is repeated after the "ok" of every line that was in
+        flight, until the firmware has answered the first M410 itself.
+        """
+        aborted = None
+        with self._gc.lock:
+            with self._state_lock:
+                self._quickstops += 1
+                txn = self._current
+                if txn is not None and txn.motion:
+                    self._current = None
+                    del txn.lines[txn._next:]
+                    txn.ack_lines = min(txn.ack_lines, len(txn.lines))
+                    txn.error = txn.error or "aborted by quickstop"
+                    if txn._outstanding <= 0:
+                        aborted = txn
+                marker = _InFlightLine(None, "M410", None, self._deadline_for("M410"))
+                self._quickstop_marker = marker if self._in_flight else None
+                self._in_flight.append(marker)
+            self._ser.write(b"M410\n")
+            self._ser.flush()
+        if self.recorder is not None:
+            self.recorder.record("tx", "M410", source="EMERGENCY")
+        if aborted is not None:
+            aborted._resolve(aborted.error)
+        self.wake()
+
+    def pending_motion(self) -> bool:
+        with self._state_lock:
+            if self._current is not None and self._current.motion:
+                return True
+            return any(e.txn is not None and e.txn.motion for e in self._in_flight)
+
+    def in_flight_count(self) -> int:
+        with self._state_lock:
+            return len(self._in_flight)
+
+    def stop(self, drain_timeout: float = 0.0):
+        """Stop the loop. With drain_timeout, first let already submitted commands go out."""
+        if drain_timeout > 0 and self._running and self.is_alive():
+            self._draining = True
+            deadline = time.time() + drain_timeout
+            while time.time() < deadline and self.is_alive():
+                with self._direct_lock:
+                    direct_empty = not self._direct
+                with self._state_lock:
+                    idle = self._current is None and not self._in_flight
+                if direct_empty and idle:
+                    break
+                time.sleep(0.01)
+        self._running = False
+        self.wake()
+
+    # ---------- reactor loop ----------
+    def run(self):
+        self._gc.log("[INFO] Serial reactor started.")
+        try:
+            while self._running:
+                did_io = self._read_available()
+                self._check_timeouts()
+                did_io = self._transmit() or did_io
+                if not did_io:
+                    # Short poll while waiting for replies, relaxed when the link is idle.
+                    with self._state_lock:
+                        busy = bool(self._in_flight)
+                    self._wake.wait(0.002 if busy else 0.02)
+                    self._wake.clear()
+        except Exception as e:
+            self._gc.log(f"[ERROR] Serial reactor I/O error: {e}")
+        finally:
+            self._running = False
+            self._fail_all("reactor stopped")
+            self._gc.log("[INFO] Serial reactor stopped.")
+
+    def _fail_all(self, reason: str):
+        with self._state_lock:
+            pending = [e.txn for e in self._in_flight if e.txn is not None]
+            self._in_flight.clear()
+            self._quickstop_marker = None
+            if self._current is not None:
+                pending.append(self._current)
+                self._current = None
+        with self._direct_lock:
+            pending.extend(self._direct)
+            self._direct.clear()
+        for txn in pending:
+            txn._resolve(reason)
+
+    # ---------- transmit ----------
+    def _next_transaction(self):
+        with self._direct_lock:
+            if self._direct:
+                return self._direct.popleft()
+        if self._draining:
+            return None
+        while True:
+            popped = self._scheduler.pop()
+            if popped is None:
+                return None
+            txn = self._gc._prepare_queued_command(*popped)
+            if txn is not None:
+                return txn
+
+    def _transmit(self) -> bool:
+        wrote = False
+        while True:
+            with self._state_lock:
+                if len(self._in_flight) >= self.window or self._barrier_in_flight():
+                    return wrote
+                txn = self._current
+                quickstops = self._quickstops
+            if txn is None:
+                txn = self._next_transaction()
+                if txn is None:
+                    return wrote
+                with self._state_lock:
+                    stale = txn.motion and quickstops != self._quickstops
+                    if not stale:
+                        self._current = txn
+                if stale:
+                    txn._resolve("aborted by quickstop")   # taken from the queue before the stop
+                    continue
+            if self._write_next_line(txn):
+                wrote = True
+
+    def _barrier_in_flight(self) -> bool:
+        return any(_command_code(e.line) in _BARRIER_CODES for e in self._in_flight)
+
+    def _deadline_for(self, line: str) -> float:
+        code = _command_code(line)
+        timeout = self.long_ok_timeout if code in _LONG_RUNNING_CODES else self.ok_timeout
+        return time.time() + timeout
+
+    def _write_next_line(self, txn) -> bool:
+        """Write txn's next line. False if quickstop() dropped the rest of txn meanwhile.
+        Taking the line, writing it and tracking it happen under the port lock, so a
+        line is either in flight before quickstop()'s M410 or not sent at all."""
+        number = None
+        with self._gc.lock:
+            with self._state_lock:
+                if self._current is not txn:
+                    return False
+                line = txn.lines[txn._next].strip()
+                txn._next += 1
+                if txn._next >= len(txn.lines):
+                    self._current = None
+            if self.reliable:
+                self._line_number += 1
+                number = self._line_number
+                payload = f"N{number} {line}"
+                data = f"{payload}*{gcode_checksum(payload)}"
+                self._ring.append((number, data))
+            else:
+                data = line
+            self._ser.write((data + "\n").encode('utf-8'))
+            with self._state_lock:
+                txn._outstanding += 1
+                self._in_flight.append(_InFlightLine(txn, line, number, self._deadline_for(line)))
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record("tx", data, source=txn.source, auto=txn._next > txn.ack_lines)
+        return True
+
+    def _reset_line_numbers(self):
+        # Unnumbered lines are always accepted, so M110 can resync the firmware's counter.
+        with self._gc.lock:
+            self._line_number = 0
+            self._ring.clear()
+            self._ser.write(b"M110 N0\n")
+        if self.recorder is not None:
+            self.recorder.record("tx", "M110 N0")
+        with self._state_lock:
+            self._resend_from = None
+            self._in_flight.append(_InFlightLine(None, "M110 N0", None, self._deadline_for("M110")))
+
+    def _handle_resend(self, line_number: int):
+        with self._state_lock:
+            reliable = self.reliable
+            ring = list(self._ring)
+            # After one bad line Marlin rejects every following line too, each with the
+            # same "Resend: N". Those repeats belong to lines that are already queued for
+            # retransmission: only a request that arrives once the retransmitted lines
+            # have reached the head of the queue (the resent N itself failed) is new.
+            oldest = self._in_flight[0] if self._in_flight else None
+            if (self._resend_from == line_number
+                    and not (oldest is not None and oldest.resent)):
+                return
+        if not reliable:
+            return
+        if not ring or ring[0][0] > line_number:
+            self._gc.log(f"[ERROR] Resend N{line_number} requested but it is no longer in the resend ring; resyncing line numbers.")
+            self._reset_line_numbers()
+            return
+
+        to_resend = [(n, data) for (n, data) in ring if n >= line_number]
+        with self._state_lock:
+            # Lines >= N are rejected by the firmware: each still gets one (error) "ok".
+            # Leave a placeholder in their FIFO slot and move the real waiter to the back.
+            moved = {}
+            for i, entry in enumerate(self._in_flight):
+                if entry.number is not None and entry.number >= line_number:
+                    moved[entry.number] = entry
+                    self._in_flight[i] = _InFlightLine(None, entry.line, entry.number, entry.deadline)
+            self._resend_from = line_number
+            with self._gc.lock:
+                for n, data in to_resend:
+                    self._ser.write((data + "\n").encode('utf-8'))
+            if self.recorder is not None:
+                for n, data in to_resend:
+                    self.recorder.record("tx", data, resend=True)
+            for n, data in to_resend:
+                entry = moved.get(n)
+                txn = entry.txn if entry else None
+                line = entry.line if entry else data
+                self._in_flight.append(_InFlightLine(txn, line, n, self._deadline_for(line), resent=True))
+        self._gc.log(f"[WARN] Firmware requested resend from N{line_number}; retransmitted {len(to_resend)} line(s).")
+
+    # ---------- receive ----------
+    def _read_available(self) -> bool:
+        waiting = self._ser.in_waiting
+        if not waiting:
+            return False
+        self._rx_buffer += self._ser.read(waiting)
+        while b"\n" in self._rx_buffer:
+            raw, self._rx_buffer = self._rx_buffer.split(b"\n", 1)
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                if self.recorder is not None:
+                    self.recorder.record("rx", line)
+                self._route_line(line)
+        return True
+
+    def _route_line(self, line: str):
+        resend_n = parse_resend_request(line)
+        if resend_n is not None:
+            self._handle_resend(resend_n)
+
+        acked = completed = None
+        repeat_quickstop = False
+        with self._state_lock:
+            oldest = self._in_flight[0] if self._in_flight else None
+            if oldest is not None and oldest.txn is not None:
+                oldest.txn.responses.append(line)
+            if line.startswith("ok"):
+                if oldest is not None:
+                    self._in_flight.popleft()
+                    if self._quickstop_marker is not None:
+                        if oldest is self._quickstop_marker:
+                            self._quickstop_marker = None
+                        else:
+                            repeat_quickstop = True   # this line may have been planned after the M410
+                    if oldest.resent and oldest.number == self._resend_from:
+                        self._resend_from = None
+                    acked, completed = self._complete_line(oldest, ok_line=line)
+                    self._restart_head_deadline()
+            elif "busy:" in line.lower() and oldest is not None:
+                # Host keepalive: the firmware is working on the oldest line, extend its deadline.
+                oldest.deadline = self._deadline_for(oldest.line)
+
+        if repeat_quickstop:
+            self.emergency_write("M410")
+        if acked is not None:
+            acked._notify_acked(line)
+        if completed is not None:
+            completed._resolve(completed.error)
+        self._gc._handle_response_line(line)
+
+    def _restart_head_deadline(self):
+        # A line only starts its timeout once every earlier line has been answered.
+        if self._in_flight:
+            head = self._in_flight[0]
+            head.deadline = self._deadline_for(head.line)
+
+    def _complete_line(self, entry, ok_line=None, error=None):
+        """Account one finished line.
+
+        Returns (acked, resolved): the transaction whose own lines were just all
+        acknowledged, and the transaction that just resolved. Notify them outside the lock.
+        """
+        txn = entry.txn
+        if txn is None:
+            return None, None
+        txn._outstanding -= 1
+        txn._acked += 1
+        if error and not txn.error:
+            txn.error = error
+        acked = txn if txn._acked == txn.ack_lines else None
+        if txn._outstanding <= 0 and txn._next >= len(txn.lines):
+            if ok_line is not None:
+                txn.ok_line = ok_line
+            if txn.motion:
+                self.last_motion_done = time.monotonic()
+            return acked, txn
+        return acked, None
+
+    def _check_timeouts(self):
+        now = time.time()
+        expired = []
+        resolved = []
+        with self._state_lock:
+            while self._in_flight and self._in_flight[0].deadline < now:
+                entry = self._in_flight.popleft()
+                expired.append(entry)
+                if entry.resent and entry.number == self._resend_from:
+                    self._resend_from = None
+                if entry is self._quickstop_marker:
+                    self._quickstop_marker = None
+                _acked, txn = self._complete_line(entry, error="timeout")
+                if txn is not None:
+                    resolved.append(txn)
+                self._restart_head_deadline()
+        for entry in expired:
+            self._gc.log(f"[WARN] No 'ok' for '{entry.line}'; releasing its slot in the transmit window.")
+        for txn in resolved:
+            txn._resolve(txn.error)
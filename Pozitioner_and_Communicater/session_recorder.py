@@ -0,0 +1,81 @@
+# Pozitioner_and_Communicater/session_recorder.py
+#
+# Serial session capture. One JSON object per line:
+#   {"t": 0.0, "d": "meta", "port": "COM5", "started": "2026-01-01T12:00:00"}
+#   {"t": 1.2345, "d": "tx", "l": "N12 G0 X10 Y5*87", "s": "CONTROL"}
+#   {"t": 1.2391, "d": "rx", "l": "ok"}
+# t is seconds since the session started (monotonic clock). Optional tx keys:
+#   "s": queue / source name, "a": 1 for lines the host appended (the M400 after
+#   a waited move), "r": 1 for retransmissions answering a Resend request.
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class SessionRecorder:
+    FLUSH_INTERVAL = 1.0  # seconds; the file is also flushed on close()
+
+    def __init__(self, path: str, **meta):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._t0 = time.monotonic()
+        self._last_flush = self._t0
+        header = {"t": 0.0, "d": "meta", "started": datetime.now().isoformat(timespec="seconds")}
+        header.update(meta)
+        self._write(header)
+
+    def record(self, direction: str, line: str, source=None, auto=False, resend=False):
+        now = time.monotonic()
+        rec = {"t": round(now - self._t0, 6), "d": direction, "l": line}
+        if source:
+            rec["s"] = source
+        if auto:
+            rec["a"] = 1
+        if resend:
+            rec["r"] = 1
+        self._write(rec, now)
+
+    def _write(self, rec: dict, now=None):
+        data = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(data)
+            now = now if now is not None else time.monotonic()
+            if now - self._last_flush >= self.FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def default_session_path(directory: str) -> str:
+    return os.path.join(directory, datetime.now().strftime("session_%Y%m%d_%H%M%S.jsonl"))
+
+
+def load_session(path: str):
+    """Returns (meta, records) from a recorded session file."""
+    meta = {}
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            raw = raw.strip()
+            if not raw:
+                continue
+            rec = json.loads(raw)
+            if rec.get("d") == "meta":
+                if not meta:
+                    meta = rec
+                continue
+            records.append(rec)
+    return meta, records
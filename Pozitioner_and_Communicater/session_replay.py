@@ -0,0 +1,167 @@
+# Pozitioner_and_Communicater/session_replay.py
+#
+# Replays a recorded serial session (see session_recorder.py) through the
+# GCodeControl dispatcher, against the Marlin simulator or a real port, and
+# compares ok-latency statistics of the original and the replayed run.
+#
+#   python -m Pozitioner_and_Communicater.session_replay session_logs/session_x.jsonl --summary
+#   python -m Pozitioner_and_Communicater.session_replay session_x.jsonl --sim --time-scale 0.2
+#   python -m Pozitioner_and_Communicater.session_replay session_x.jsonl --port /dev/ttyUSB0 --streaming on
+
+import re
+import threading
+import time
+from collections import deque
+
+from Pozitioner_and_Communicater.session_recorder import load_session
+
+_FRAMING_RE = re.compile(r"^N\d+\s+(.*?)\*\d+$")
+
+
+def strip_framing(line: str) -> str:
+    """'N12 G0 X10*87' -> 'G0 X10'; unnumbered lines are returned unchanged."""
+    match = _FRAMING_RE.match(line.strip())
+    return match.group(1).strip() if match else line.strip()
+
+
+def replay_commands(records):
+    """Host-level commands of a session as (t, source, command).
+
+    Drops what the transport generated itself: appended M400s, resend
+    retransmissions and M110 line-number resets.
+    """
+    out = []
+    for rec in records:
+        if rec.get("d") != "tx" or rec.get("a") or rec.get("r"):
+            continue
+        command = strip_framing(rec["l"])
+        if not command or command.upper().startswith("M110"):
+            continue
+        out.append((rec["t"], rec.get("s"), command))
+    return out
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def summarize(records) -> dict:
+    """ok-latency statistics. Each transmitted line is matched FIFO with the next "ok"."""
+    pending = deque()
+    latencies = []
+    ok_times = []
+    for rec in records:
+        if rec.get("d") == "tx":
+            pending.append(rec["t"])
+        elif rec.get("d") == "rx" and rec["l"].startswith("ok"):
+            ok_times.append(rec["t"])
+            if pending:
+                latencies.append(rec["t"] - pending.popleft())
+    gaps = [b - a for a, b in zip(ok_times, ok_times[1:])]
+    return {
+        "tx_lines": sum(1 for r in records if r.get("d") == "tx"),
+        "oks": len(ok_times),
+        "duration": (records[-1]["t"] - records[0]["t"]) if records else 0.0,
+        "ok_latency_p50": _percentile(latencies, 0.50),
+        "ok_latency_p95": _percentile(latencies, 0.95),
+        "ok_latency_max": max(latencies) if latencies else 0.0,
+        "max_ok_gap": max(gaps) if gaps else 0.0,
+        "unanswered": len(pending),
+    }
+
+
+def format_summary(label: str, stats: dict) -> str:
+    text = (f"[{label}] {stats['tx_lines']} lines / {stats['oks']} ok in {stats['duration']:.2f} s | "
+            f"ok latency p50 {stats['ok_latency_p50'] * 1000:.1f} ms, p95 {stats['ok_latency_p95'] * 1000:.1f} ms, "
+            f"max {stats['ok_latency_max'] * 1000:.1f} ms | longest silence {stats['max_ok_gap']:.2f} s")
+    if stats["unanswered"]:
+        text += f" | {stats['unanswered']} unanswered"
+    return text
+
+
+def replay(g_control, records, speed: float = 1.0):
+    """Feed the session's commands through the dispatcher, keeping the original
+    spacing divided by speed (speed <= 0: as fast as the transport allows)."""
+    commands = replay_commands(records)
+    if not commands:
+        return []
+    t_first = commands[0][0]
+    start = time.monotonic()
+    handles = []
+    for t, source, command in commands:
+        if speed > 0:
+            delay = (t - t_first) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if source in (None, "DIRECT"):
+            g_control.send_command(command)
+        else:
+            handles.append(g_control.submit_command(command, wait_motion=False))
+    for handle in handles:
+        handle.wait(timeout=300)
+    g_control.send_command("M400", wait_for_completion=True, timeout=300)
+    return handles
+
+
+def _attach(g_control, ser):
+    g_control.ser = ser
+    g_control.set_connected(True)
+    g_control.start_threads()
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Replay a recorded G-code serial session.")
+    parser.add_argument("session")
+    parser.add_argument("--summary", action="store_true", help="only print statistics of the recording")
+    parser.add_argument("--sim", action="store_true", help="replay against the Marlin simulator")
+    parser.add_argument("--port", help="replay against a real serial port")
+    parser.add_argument("--baud", type=int, default=250000)
+    parser.add_argument("--speed", type=float, default=1.0, help="timing speed-up; 0 = no pacing")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="simulator move time scale")
+    parser.add_argument("--streaming", choices=("on", "off"), help="override the recorded transmit mode")
+    parser.add_argument("--bufsize", type=int, help="override the recorded BUFSIZE")
+    parser.add_argument("--reliable", choices=("on", "off"), help="override the recorded N/checksum mode")
+    parser.add_argument("--out", help="where to record the replayed session")
+    args = parser.parse_args()
+
+    meta, records = load_session(args.session)
+    print(format_summary("recorded", summarize(records)))
+    if args.summary:
+        raise SystemExit(0)
+    if not args.sim and not args.port:
+        parser.error("choose --sim or --port")
+
+    from Pozitioner_and_Communicater.G_communicate import GCodeControl
+
+    logging.basicConfig(level=logging.WARNING)
+    g_control = GCodeControl(threading.Lock())
+    if args.sim:
+        from Pozitioner_and_Communicater.marlin_simulator import MarlinSimulator
+        ser = MarlinSimulator(bufsize=args.bufsize or meta.get("bufsize", 4), time_scale=args.time_scale)
+    else:
+        import serial
+        ser = serial.Serial(args.port, args.baud, timeout=1, write_timeout=1, rtscts=False, dsrdtr=False)
+        if not g_control._probe_marlin_connection(ser, timeout=10.0):
+            ser.close()
+            raise SystemExit(f"[ERROR] No Marlin response on {args.port} @ {args.baud}")
+    _attach(g_control, ser)
+
+    streaming = meta.get("streaming", False) if args.streaming is None else args.streaming == "on"
+    reliable = meta.get("reliable", False) if args.reliable is None else args.reliable == "on"
+    g_control.set_streaming_mode(streaming, args.bufsize or meta.get("bufsize"))
+    g_control.set_reliable_transport(reliable)
+    out_path = g_control.start_session_recording(args.out or args.session.replace(".jsonl", "") + ".replay.jsonl")
+
+    replay(g_control, records, speed=args.speed)
+    g_control.stop_session_recording()
+    g_control.stop_threads()
+
+    _meta, replayed = load_session(out_path)
+    print(format_summary("replayed", summarize(replayed)))
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from Pozitioner_and_Communicater.G_communicate import GCodeControl
+from Pozitioner_and_Communicater.marlin_simulator import MarlinSimulator
+
+
+class PlanRecordingSimulator(MarlinSimulator):
+    """Records when every move is planned and when the first M410 arrived."""
+
+    def __init__(self, **kwargs):
+        self.planned = []
+        self.first_quickstop = None
+        super().__init__(**kwargs)
+
+    def _plan(self, duration):
+        self.planned.append(time.monotonic())
+        super()._plan(duration)
+
+    def _m410(self, p):
+        if self.first_quickstop is None:
+            self.first_quickstop = time.monotonic()
+        super()._m410(p)
+
+    def moves_after_quickstop(self):
+        return [t for t in self.planned if t > self.first_quickstop]
+
+
+@pytest.fixture
+def machine():
+    """connect(time_scale) -> (GCodeControl streaming to a PlanRecordingSimulator, simulator)."""
+    controls = []
+
+    def connect(time_scale=0.3):
+        sim = PlanRecordingSimulator(time_scale=time_scale)
+        g = GCodeControl(threading.Lock())
+        g.log = lambda message: None
+        g.ser = sim
+        g.set_connected(True)
+        g.start_threads()
+        g.set_streaming_mode(True, 4)
+        controls.append(g)
+        return g, sim
+
+    yield connect
+    for g in controls:
+        g.stop_threads()
+
+
+def wait_until_answered(g, timeout=5.0):
+    """Wait until every line sent to the simulator has its "ok"."""
+    deadline = time.monotonic() + timeout
+    while g._reactor.in_flight_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    return not g._reactor.in_flight_count()
@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+
+from conftest import wait_until_answered
+from Pozitioner_and_Communicater.batch_scheduler import BatchScheduler, Plate
+
+_SEQUENCE = ("G0 X{x:.3f} Y{y:.3f} F{feed}", "G1 Z5 F3000", "G1 Z0 F3000")
+
+
+def _batch(g, events, **kwargs):
+    plates = [Plate(i, (60.0 * i, 20.0)) for i in range(3)]
+    return BatchScheduler(g, plates, lambda: np.zeros((8, 8, 3), np.uint8),
+                          detect=lambda frame: [(10 * i, 5) for i in range(1, 5)],
+                          sequence=_SEQUENCE, settle_time=0.0,
+                          listener=lambda event, *args: events.append(event), **kwargs)
+
+
+def test_no_motion_is_planned_after_stop(machine):
+    for run_time in (0.3, 0.9):
+        g, sim = machine()
+        events = []
+        batch = _batch(g, events)
+        batch.start()
+        time.sleep(run_time)
+        batch.stop()
+
+        assert batch.wait(5.0)
+        assert wait_until_answered(g)
+        assert sim.moves_after_quickstop() == []
+        assert not sim._planner
+        assert events[-1] == "stopped"
+
+
+def test_plate_without_journal_is_still_picked(machine):
+    g, _sim = machine(time_scale=0.02)
+    events = []
+
+    def journal_for(plate):
+        raise OSError("disk full")
+
+    batch = _batch(g, events, journal_factory=journal_for)
+    batch.start()
+    assert batch.wait(30.0)
+    assert batch.state == "finished"
+    assert [p.picked for p in batch.plates] == [4, 4, 4]
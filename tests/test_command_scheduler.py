@@ -0,0 +1,43 @@
+from Pozitioner_and_Communicater.command_scheduler import (
+    CommandScheduler, PRIORITY_MOTION, PRIORITY_TELEMETRY,
+)
+
+
+def _scheduler():
+    return CommandScheduler([
+        ("CONTROL", PRIORITY_MOTION),
+        ("X_motor", PRIORITY_MOTION), ("Y_motor", PRIORITY_MOTION),
+        ("TELEMETRY", PRIORITY_TELEMETRY),
+    ])
+
+
+def _drain(scheduler):
+    out = []
+    while True:
+        popped = scheduler.pop()
+        if popped is None:
+            return out
+        out.append(popped[1])
+
+
+def test_modal_commands_keep_their_place_among_moves():
+    s = _scheduler()
+    s.put("X_motor", "G1 X10")
+    s.put("CONTROL", "G91")
+    s.put("X_motor", "G1 X5")
+    s.put("Y_motor", "G1 Y5")
+    s.put("CONTROL", "G90")
+    s.put("Y_motor", "G1 Y20")
+    expected = ["G1 X10", "G91", "G1 X5", "G1 Y5", "G90", "G1 Y20"]
+    assert s.items() == expected
+    assert _drain(s) == expected
+
+
+def test_cancelled_entries_are_skipped_and_telemetry_comes_last():
+    s = _scheduler()
+    s.put("TELEMETRY", "M105")
+    s.put("X_motor", "G1 X1", tags=("jog:X_motor",))
+    s.put("CONTROL", "G92 X0")
+    s.put("X_motor", "G1 X2")
+    assert s.cancel_tag("jog:X_motor") == ["G1 X1"]
+    assert _drain(s) == ["G92 X0", "G1 X2", "M105"]
@@ -0,0 +1,19 @@
+import pytest
+
+from Pozitioner_and_Communicater.motion_estimator import MotionEstimator
+from Pozitioner_and_Communicater.picking_executor import PickingExecutor
+
+_SEQUENCE = ("G0 X{x:.3f} Y{y:.3f} F{feed}", "G1 Z5 F3000", "G4 P200", "G1 Z0 F3000")
+
+
+def test_estimate_covers_the_picking_sequence():
+    estimator = MotionEstimator.from_settings()
+    points = [(10.0, 20.0), (40.0, 25.0)]
+    executor = PickingExecutor(None, points, _SEQUENCE, feedrate=6000)
+    xy_only = estimator.estimate_points(points, 6000, start=(0, 0))
+    plan = estimator.estimate_points(points, 6000, start=(0, 0), command_for=executor.command_for)
+
+    assert len(plan["moves"]) == 3 * len(points)
+    assert plan["dwell_time"] == pytest.approx(0.4)
+    assert plan["distance"] == pytest.approx(xy_only["distance"] + 10.0 * len(points))  # Z 5 up, 5 down
+    assert plan["total_time"] > xy_only["total_time"] + plan["dwell_time"]
@@ -0,0 +1,23 @@
+import time
+
+from conftest import wait_until_answered
+from Pozitioner_and_Communicater.picking_executor import PickingExecutor
+
+_SEQUENCE = ("G0 X{x:.3f} Y{y:.3f} F{feed}", "G1 Z5 F3000", "G1 Z0 F3000")
+
+
+def test_no_motion_is_planned_after_stop(machine):
+    for run_time in (0.25, 0.4, 0.55):
+        g, sim = machine()
+        events = []
+        executor = PickingExecutor(g, [(20.0 * i, 20.0) for i in range(1, 10)], _SEQUENCE,
+                                   listener=lambda event, *args: events.append(event))
+        executor.start()
+        time.sleep(run_time)
+        executor.stop()
+
+        assert wait_until_answered(g)
+        assert sim.first_quickstop is not None
+        assert sim.moves_after_quickstop() == []
+        assert not sim._planner
+        assert events[-1] == "stopped"
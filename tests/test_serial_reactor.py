@@ -0,0 +1,68 @@
+import re
+import threading
+from collections import Counter
+
+from Pozitioner_and_Communicater.G_communicate import GCodeControl
+from Pozitioner_and_Communicater.marlin_simulator import MarlinSimulator
+
+_NUMBER_RE = re.compile(rb"^N(\d+) ")
+
+
+class _RejectingSimulator(MarlinSimulator):
+    """Rejects the listed transmissions by line number (a number listed twice is rejected
+    twice) and counts how often every numbered line arrives."""
+
+    def __init__(self, reject, **kwargs):
+        self.reject = Counter(reject)
+        self.sent = Counter()
+        super().__init__(**kwargs)
+
+    def write(self, data):
+        for line in bytes(data).splitlines():
+            m = _NUMBER_RE.match(line)
+            if m:
+                self.sent[int(m.group(1))] += 1
+        return super().write(data)
+
+    def _check_line_number(self, line):
+        number = int(line.split(" ", 1)[0][1:])
+        if self.reject[number] > 0 and number == self.last_line + 1:
+            self.reject[number] -= 1
+            return self._request_resend("checksum mismatch")
+        return super()._check_line_number(line)
+
+
+def _run_moves(sim, moves=30, bufsize=4):
+    g = GCodeControl(threading.Lock())
+    g.log = lambda _msg: None
+    g.ser = sim
+    g.set_connected(True)
+    g.start_threads()
+    g.set_streaming_mode(True, bufsize)
+    g.set_reliable_transport(True)
+    try:
+        handles = [g.submit_command(f"G0 X{5 + i} Y{5 + i} F6000", wait_motion=False) for i in range(moves)]
+        assert all(h.wait(30) for h in handles)
+        return handles
+    finally:
+        g.stop_threads()
+        sim.close()
+
+
+def test_each_rejected_line_is_retransmitted_once():
+    # N5 is rejected; the lines streamed behind it (6..8 with BUFSIZE 4) are rejected
+    # as well and Marlin repeats "Resend: 5" for each of them.
+    sim = _RejectingSimulator([5], bufsize=4, time_scale=0.0)
+    _run_moves(sim)
+    retransmitted = {n: c - 1 for n, c in sim.sent.items() if c > 1}
+    assert retransmitted, "the rejection did not trigger a resend"
+    assert set(retransmitted.values()) == {1}
+    assert min(retransmitted) == 5
+
+
+def test_failed_retransmission_is_resent_again():
+    # The retransmitted N5 is rejected too: that Resend is new and must be honoured.
+    sim = _RejectingSimulator([5, 5], bufsize=4, time_scale=0.0)
+    _run_moves(sim)
+    assert sim.sent[5] == 3
+    assert max(sim.sent.values()) == 3